@@ -6,17 +6,27 @@ This avoids re-computing embeddings for all existing videos.
 
 import os
 import sys
-import pickle
 import numpy as np
 from pathlib import Path
 from tqdm import tqdm
 
 # Import the clusterer
 sys.path.insert(0, str(Path(__file__).parent))
-from advanced_video_clusterer import VideoClusterer
+from advanced_video_clusterer import CLIP_MODEL_NAME, DEFAULT_BATCH_SIZE, DEFAULT_NEIGHBORS, VideoClusterer
+from cluster_model import CLUSTER_MODEL_DIR, ClusterModel
+from clip_encoders import DEFAULT_BACKEND
+from embedding_store import open_store
+from frame_aggregation import DEFAULT_AGGREGATION, aggregate
+from frame_samplers import sampler_from_settings
+from host_profile import load_host_profile
+from video_discovery import discover_videos
+
+# This script's own default when no clustering model was saved (the clusterer's is larger)
+FALLBACK_MIN_CLUSTER_SIZE = 7
 
 def add_new_videos_and_recluster(new_videos_dir, cache_dir="video_embeddings_cache", 
-                                  output_dir="channels_clustered", min_cluster_size=7):
+                                  output_dir="channels_clustered", min_cluster_size=None, thumbnails=False,
+                                  namespace=None, use_daemon=True, assign_only=False):
     """
     Add new videos to existing embeddings and re-cluster.
     
@@ -24,90 +34,144 @@ def add_new_videos_and_recluster(new_videos_dir, cache_dir="video_embeddings_cac
         new_videos_dir: Directory containing new videos to add
         cache_dir: Directory with cached embeddings
         output_dir: Where to save clustered channels
-        min_cluster_size: Minimum cluster size for HDBSCAN
+        min_cluster_size: Minimum cluster size for HDBSCAN (default: the saved
+            clustering model's, else FALLBACK_MIN_CLUSTER_SIZE)
+        thumbnails: Also save channel-guide thumbnails of the new videos
+        namespace: Embedding namespace to extend (default: the only one in cache_dir)
+        use_daemon: Embed through embedding_daemon.py when it is running (CLIP already loaded)
+        assign_only: Add the new videos to the saved clustering instead of refitting it
+            (existing videos keep their channel; falls back to a refit on drift or novelty)
     """
     
-    cache_file = Path(cache_dir) / "video_embeddings.pkl"
+    try:
+        store = open_store(cache_dir, model=CLIP_MODEL_NAME, namespace=namespace)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
     new_videos_path = Path(new_videos_dir)
     
     # Load existing embeddings
-    if not cache_file.exists():
-        print(f"❌ No cached embeddings found at {cache_file}")
+    if not store.exists():
+        print(f"❌ No cached embeddings found in {cache_dir}")
         print("   Run advanced_video_clusterer.py first to create initial embeddings")
         return
     
     print("📦 Loading existing embeddings...")
-    with open(cache_file, 'rb') as f:
-        cached_data = pickle.load(f)
-        existing_videos = cached_data['video_files']
-        existing_embeddings = cached_data['embeddings']
+    metadata = store.read_metadata()
+    existing_videos, existing_embeddings = store.load()
+    existing_frames = store.load_frames(metadata)
     
     print(f"✅ Loaded {len(existing_videos)} existing videos")
     
+    # New videos must be sampled exactly like the ones already in the store
+    try:
+        sampler = sampler_from_settings(metadata.get('sampling'))
+    except ValueError as e:
+        print(f"❌ Can't add videos to this store: {e}")
+        return
+    
     # Find new videos
     if not new_videos_path.exists():
         print(f"❌ New videos directory not found: {new_videos_dir}")
         return
     
-    video_extensions = {'.mp4', '.mov', '.avi', '.mkv', '.webm'}
-    new_video_files = [f for f in new_videos_path.iterdir() 
-                       if f.is_file() and f.suffix.lower() in video_extensions]
+    # Stat and fingerprint the new files in parallel (cached in the discovery manifest)
+    candidates = discover_videos(new_videos_path, cache_dir, recursive=False, fingerprints=True)
+    for video_info in candidates:
+        del video_info['folder']
+        video_info['channel'] = Path(video_info['path']).parent.name
     
-    if not new_video_files:
+    if not candidates:
         print(f"❌ No video files found in {new_videos_dir}")
         return
     
-    print(f"\n📹 Found {len(new_video_files)} new videos")
+    print(f"\n📹 Found {len(candidates)} new videos")
+    
+    # Throughput settings autotuned for this host, if any
+    backend = metadata.get('backend', DEFAULT_BACKEND)
+    profile = load_host_profile(cache_dir, backend)
+    settings = profile['settings'] if profile else {}
+    if profile:
+        print(f"🎛️  Host profile {profile['host']}: batch size {settings['batch_size']}, "
+              f"{settings['decode_workers']} decode workers, {settings['threads']} threads")
+    
+    # Initialize clusterer for computing new embeddings, pooling frames the way the store does
+    clusterer = VideoClusterer(cache_dir=cache_dir, backend=backend,
+                               aggregation=metadata.get('aggregation', DEFAULT_AGGREGATION),
+                               sampler=sampler, thumbnails=thumbnails, namespace=store.directory.parent.name,
+                               use_daemon=use_daemon, threads=settings.get('threads'))
+    if clusterer.backend != backend:
+        print(f"❌ This store was embedded with the {backend} backend, which isn't available here")
+        return
     
-    # Initialize clusterer for computing new embeddings
-    clusterer = VideoClusterer()
+    # Compute per-frame embeddings for new videos
+    print(f"\n🎬 Computing embeddings for {len(candidates)} new videos...")
+    results = clusterer.compute_frame_embeddings_batched(
+        candidates, batch_size=settings.get('batch_size', DEFAULT_BATCH_SIZE),
+        decode_workers=settings.get('decode_workers', 0)
+    )
     
-    # Compute embeddings for new videos
-    print(f"\n🎬 Computing embeddings for {len(new_video_files)} new videos...")
-    new_embeddings = []
     new_video_infos = []
-    
-    for video_file in tqdm(new_video_files, desc="Processing new videos"):
-        embedding = clusterer.compute_video_embedding(str(video_file))
-        if embedding is not None:
-            new_embeddings.append(embedding)
-            new_video_infos.append({
-                'path': video_file,
-                'name': video_file.name,
-                'channel': video_file.parent.name,
-                'size_mb': video_file.stat().st_size / (1024 * 1024)
-            })
-    
-    if not new_embeddings:
+    new_frames = []
+    new_times = []
+    for video_info, result in zip(candidates, results):
+        if result is not None:
+            video_info['frame_count'] = len(result[0])
+            new_video_infos.append(video_info)
+            new_frames.append(result[0])
+            new_times.append(result[1])
+    
+    if not new_video_infos:
         print("❌ Failed to compute embeddings for new videos")
         return
     
-    new_embeddings = np.array(new_embeddings)
+    new_frames = np.concatenate(new_frames)
+    new_times = np.concatenate(new_times)
+    new_embeddings = aggregate(new_frames, [v['frame_count'] for v in new_video_infos],
+                               clusterer.aggregation, frame_times=new_times)
     print(f"✅ Computed {len(new_embeddings)} new embeddings")
     
-    # Combine embeddings
+    # Combine embeddings (existing frames stay in store order, new ones are appended)
     print(f"\n🔗 Combining embeddings...")
     all_embeddings = np.vstack([existing_embeddings, new_embeddings])
     all_videos = existing_videos + new_video_infos
+    if existing_frames:
+        all_frames = np.concatenate([existing_frames[0], new_frames])
+        all_times = np.concatenate([existing_frames[1], new_times])
+    else:
+        # Older store without frames: its videos keep only their pooled embedding
+        for video_info in existing_videos:
+            video_info['frame_count'] = 0
+        all_frames, all_times = new_frames, new_times
     
     print(f"✅ Total: {len(all_videos)} videos ({len(existing_videos)} existing + {len(new_video_infos)} new)")
     
     # Update cache with combined embeddings
     print(f"\n💾 Updating cache...")
-    with open(cache_file, 'wb') as f:
-        pickle.dump({
-            'video_files': all_videos,
-            'embeddings': all_embeddings
-        }, f)
+    # Keep the sampling/backend record the namespace was derived from
+    extra = {key: metadata[key] for key in ('backend', 'sampling') if key in metadata}
+    store.write(all_videos, all_embeddings, model=CLIP_MODEL_NAME, extra=extra, frame_embeddings=all_frames,
+                frame_times=all_times, aggregation=clusterer.aggregation)
     print(f"✅ Cache updated")
     
     # Set the embeddings in the clusterer
     clusterer.video_files = all_videos
     clusterer.embeddings = all_embeddings
     
-    # Run clustering
-    print(f"\n🔮 Clustering {len(all_videos)} videos (min_cluster_size={min_cluster_size})...")
-    labels = clusterer.cluster_videos(min_cluster_size=min_cluster_size)
+    # Cluster with the saved model's settings, so --assign-only can reuse the model
+    model = ClusterModel(clusterer.store_root / CLUSTER_MODEL_DIR)
+    saved = model.read_metadata()['params'] if model.exists() else {}
+    params = {'n_neighbors': saved.get('n_neighbors', DEFAULT_NEIGHBORS),
+              'min_cluster_size': min_cluster_size or saved.get('min_cluster_size', FALLBACK_MIN_CLUSTER_SIZE),
+              'min_samples': saved.get('min_samples', 1)}
+    if 'noise_policy' in saved:
+        params['noise_policy'] = saved['noise_policy']
+    
+    # Assign the new videos to the saved clustering, else run a full clustering
+    labels = clusterer.assign_clusters(**params) if assign_only else None
+    if labels is None:
+        print(f"\n🔮 Clustering {len(all_videos)} videos (min_cluster_size={params['min_cluster_size']})...")
+        labels = clusterer.cluster_videos(**params)
     
     if labels is None:
         print("❌ Clustering failed")
@@ -149,8 +213,17 @@ def main():
                        help='Cache directory (default: video_embeddings_cache)')
     parser.add_argument('--output-dir', default='channels_clustered',
                        help='Output directory (default: channels_clustered)')
-    parser.add_argument('--min-cluster-size', type=int, default=7,
-                       help='Minimum cluster size (default: 7)')
+    parser.add_argument('--min-cluster-size', type=int, default=None,
+                       help=f'Minimum cluster size (default: the saved clustering\'s, else {FALLBACK_MIN_CLUSTER_SIZE})')
+    parser.add_argument('--namespace', default=None,
+                       help='Embedding namespace (default: the only one in the cache directory)')
+    parser.add_argument('--thumbnails', action='store_true',
+                       help='Save channel-guide thumbnails of the new videos')
+    parser.add_argument('--assign-only', action='store_true',
+                       help='Assign new videos to the saved clusters instead of reclustering '
+                            '(refits only on drift or novelty)')
+    parser.add_argument('--no-daemon', action='store_true',
+                       help='Compute embeddings in this process even if embedding_daemon.py is running')
     
     args = parser.parse_args()
     
@@ -158,7 +231,11 @@ def main():
         args.new_videos_dir,
         args.cache_dir,
         args.output_dir,
-        args.min_cluster_size
+        args.min_cluster_size,
+        thumbnails=args.thumbnails,
+        namespace=args.namespace,
+        use_daemon=not args.no_daemon,
+        assign_only=args.assign_only
     )
 
 if __name__ == '__main__':
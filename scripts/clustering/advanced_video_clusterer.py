@@ -5,67 +5,168 @@ Automatically discovers natural groupings in your video collection.
 """
 
 import os
-import cv2
 import json
-import torch
-import clip
+import time
+import importlib.util
 import numpy as np
 from pathlib import Path
 from collections import defaultdict
 import argparse
 from tqdm import tqdm
-import pickle
 
-try:
-    import umap
-    import hdbscan
-    from sklearn.preprocessing import StandardScaler
-    CLUSTERING_AVAILABLE = True
-except ImportError:
-    CLUSTERING_AVAILABLE = False
+from cluster_cache import CLUSTER_CACHE_DIR, ClusterCache, embeddings_hash
+from cluster_model import CLUSTER_MODEL_DIR, DRIFT_LIMIT, NOVELTY_LIMIT, ClusterModel, fit_reach, video_key
+from cluster_sweep import DEFAULT_SWEEP_MIN_CLUSTER_SIZES, sweep
+from clip_encoders import DEFAULT_BACKEND, ENCODER_BACKENDS, get_encoder, resolve_backend
+from embedding_daemon import daemon_embed
+from embedding_shards import merge_shards, parse_shard, select_shard, shard_dir, shard_info
+from embedding_store import (EmbeddingCheckpoint, EmbeddingStore, list_namespaces, namespace_dir, namespace_name,
+                             open_store, rows_from_columns)
+from frame_aggregation import AGGREGATIONS, DEFAULT_AGGREGATION, aggregate, frame_offsets
+from frame_decoders import DECODERS, DEFAULT_DECODER, decode_sampled_frames, get_decoder
+from frame_samplers import DEFAULT_SAMPLER, SAMPLERS, UniformSampler, get_sampler
+from host_profile import DEFAULT_SAMPLE_SIZE, apply_host_profile, autotune
+from memory_budget import MemoryBudget
+from noise_policy import DEFAULT_NOISE_POLICY, NOISE_POLICIES, reassign_noise
+from intro_detection import IntroReference, build_intro_reference, load_intro_reference, save_intro_reference
+from duplicate_index import DUPLICATE_INDEX_NAME, load_duplicate_index
+from embedding_pipeline import DEFAULT_QUEUE_DEPTH, DEFAULT_VIDEO_TIMEOUT, iter_preprocessed_videos
+from video_discovery import VideoManifest, discover_videos
+from video_fingerprint import resolve_partial_collisions
+from video_quarantine import Quarantine
+from video_thumbnails import ThumbnailWriter
+
+# Heavy libraries (torch/CLIP, UMAP/HDBSCAN, matplotlib) are imported on first use,
+# so cache-only commands don't pay for them. find_spec checks availability without importing.
+def _installed(*modules):
+    return all(importlib.util.find_spec(module) is not None for module in modules)
+
+CLUSTERING_AVAILABLE = _installed('umap', 'hdbscan', 'sklearn')
+if not CLUSTERING_AVAILABLE:
     print("⚠️  Install clustering libraries: pip install umap-learn hdbscan scikit-learn")
 
-try:
-    import matplotlib.pyplot as plt
-    import seaborn as sns
-    PLOTTING_AVAILABLE = True
-except ImportError:
-    PLOTTING_AVAILABLE = False
+PLOTTING_AVAILABLE = _installed('matplotlib', 'seaborn')
+if not PLOTTING_AVAILABLE:
     print("⚠️  Install plotting libraries: pip install matplotlib seaborn")
 
+# Images per CLIP forward pass; tune per host with --batch-size
+DEFAULT_BATCH_SIZE = 64
+
+# Frame embedding rows allocated at a time (8 MB at 512 dims); each video's rows stay contiguous
+FRAME_BLOCK_ROWS = 4096
+
+# Checkpoint newly computed embeddings every N videos or T seconds
+DEFAULT_CHECKPOINT_EVERY = 100
+DEFAULT_CHECKPOINT_INTERVAL = 300
+
+CLIP_MODEL_NAME = "ViT-B/32"
+
+# Clustering defaults, and the fixed UMAP/HDBSCAN settings (part of the cluster cache key)
+DEFAULT_NEIGHBORS = 15
+DEFAULT_MIN_CLUSTER_SIZE = 10
+UMAP_SETTINGS = {'min_dist': 0.0, 'metric': 'cosine', 'random_state': 42}
+HDBSCAN_SETTINGS = {'metric': 'euclidean', 'cluster_selection_method': 'eom'}
+
+
+def build_knn_graph(embeddings, n_neighbors=DEFAULT_NEIGHBORS):
+    """
+    Nearest-neighbour graph of the embeddings, built the way umap.UMAP builds
+    it internally (same metric and seed), for umap.UMAP(precomputed_knn=...).
+    Works on a writable copy: pynndescent rejects the read-only store memmap.
+    """
+    from sklearn.utils import check_random_state
+    from umap.umap_ import nearest_neighbors
+    
+    return nearest_neighbors(
+        np.array(embeddings, dtype=np.float32), n_neighbors, UMAP_SETTINGS['metric'], {}, False,
+        check_random_state(UMAP_SETTINGS['random_state']), n_jobs=1
+    )
+
 
 class VideoClusterer:
-    def __init__(self, channels_dir="channels", cache_dir="video_embeddings_cache"):
+    def __init__(self, channels_dir="channels", cache_dir="video_embeddings_cache", decoder=DEFAULT_DECODER,
+                 backend=DEFAULT_BACKEND, aggregation=DEFAULT_AGGREGATION, sampler=None, thumbnails=False,
+                 shard=None, namespace=None, use_daemon=False, threads=None):
         self.channels_dir = Path(channels_dir)
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(exist_ok=True)
+        self.decoder = get_decoder(decoder)
+        # Which frames go to CLIP, and how their embeddings are pooled into one per video
+        self.sampler = sampler or get_sampler(DEFAULT_SAMPLER)
+        self.aggregation = aggregation
+        # Thumbnails for the channel guide are saved from the frames decoded for CLIP
+        self.thumbnails = ThumbnailWriter(self.cache_dir) if thumbnails else None
+        # Embeddings live in a namespace derived from model + sampling, unless one is given
+        self._namespace = namespace
+        # (index, count) when this run computes one shard; its store, checkpoint and quarantine live apart
+        self.shard = shard
+        self.shard_description = None
         
-        # Load CLIP model
-        print("🔧 Loading CLIP model...")
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model, self.preprocess = clip.load("ViT-B/32", device=self.device)
-        print(f"✅ CLIP model loaded on {self.device}")
+        # The CLIP encoder is loaded on first use, unless a warm embedding daemon does the encoding
+        # The backend actually used (torch if onnxruntime is missing): it names the namespace
+        self.backend = resolve_backend(backend)
+        self.threads = threads
+        self._encoder = None
+        self.use_daemon = use_daemon
         
         self.video_files = []
         self.embeddings = None
+        self.embeddings_2d = None
         self.cluster_labels = None
+    
+    @property
+    def namespace(self):
+        """Embedding namespace: the explicit one, or derived from the model and sampling settings."""
+        return self._namespace or namespace_name(CLIP_MODEL_NAME, self.sampler.describe(), self.backend)
+    
+    @property
+    def store_root(self):
+        return namespace_dir(self.cache_dir, self.namespace)
+    
+    @property
+    def work_dir(self):
+        """Where this run writes its store and checkpoint: the namespace, or this shard of it."""
+        return shard_dir(self.store_root, *self.shard) if self.shard else self.store_root
+    
+    @property
+    def encoder(self):
+        """CLIP image encoder for the selected backend, loaded once."""
+        if self._encoder is None:
+            self._encoder = get_encoder(self.backend, CLIP_MODEL_NAME, self.cache_dir, threads=self.threads)
+            self.backend = self._encoder.name
+        return self._encoder
+    
+    @property
+    def preprocess(self):
+        return self.encoder.preprocess
+    
+    @staticmethod
+    def describe_video(video_file, channel):
+        """Metadata dict for one video file, as stored alongside its embedding."""
+        video_file = Path(video_file)
+        stat = video_file.stat()
+        return {
+            'path': video_file,
+            'name': video_file.name,
+            'channel': channel,
+            'size_mb': stat.st_size / (1024 * 1024),
+            'size_bytes': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns
+        }
+    
+    def find_all_videos(self, rescan=False):
+        """
+        Find all video files in the channel folders (and their subfolders).
         
-    def find_all_videos(self):
-        """Find all video files in channels directory."""
-        video_extensions = ['.mp4', '.mov', '.avi', '.mkv', '.webm']
+        Unchanged folders are served from the discovery manifest; `rescan`
+        lists and stats everything again (see video_discovery.py).
+        """
         self.video_files = []
         
         print(f"🔍 Scanning {self.channels_dir} for videos...")
-        for channel_dir in self.channels_dir.iterdir():
-            if channel_dir.is_dir() and not channel_dir.name.startswith('.'):
-                for video_file in channel_dir.iterdir():
-                    if video_file.suffix.lower() in video_extensions:
-                        self.video_files.append({
-                            'path': video_file,
-                            'name': video_file.name,
-                            'channel': channel_dir.name,
-                            'size_mb': video_file.stat().st_size / (1024 * 1024)
-                        })
+        for video_info in discover_videos(self.channels_dir, self.cache_dir, min_depth=1, rescan=rescan):
+            video_info['channel'] = video_info.pop('folder')
+            self.video_files.append(video_info)
         
         print(f"✅ Found {len(self.video_files)} videos across {len(set(v['channel'] for v in self.video_files))} channels")
         return self.video_files
@@ -73,32 +174,32 @@ class VideoClusterer:
     def extract_frames(self, video_path, num_frames=5):
         """Extract evenly-spaced frames from video."""
         try:
-            cap = cv2.VideoCapture(str(video_path))
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            
-            if total_frames == 0:
-                cap.release()
-                return []
-            
-            # Get evenly spaced frame indices
-            frame_indices = np.linspace(0, total_frames - 1, num_frames, dtype=int)
-            frames = []
-            
-            for idx in frame_indices:
-                cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
-                ret, frame = cap.read()
-                if ret:
-                    # Convert BGR to RGB
-                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    frames.append(frame_rgb)
-            
-            cap.release()
-            return frames
+            return [frame for _, frame in decode_sampled_frames(self.decoder, video_path, num_frames)]
             
         except Exception as e:
-            print(f"❌ Error extracting frames from {video_path.name}: {e}")
+            print(f"❌ Error extracting frames from {Path(video_path).name}: {e}")
             return []
     
+    def preprocess_frames(self, frames):
+        """Apply CLIP preprocessing to RGB frames. Returns a (len(frames), 3, H, W) float32 array."""
+        from PIL import Image
+        
+        return np.stack([np.asarray(self.preprocess(Image.fromarray(frame))) for frame in frames])
+    
+    def encode_images(self, images):
+        """Encode preprocessed images with CLIP in a single forward pass."""
+        return self.encoder.encode(images)
+    
+    def encode_frames(self, frames):
+        """Encode RGB frames with CLIP in a single forward pass. Returns (len(frames), dim) array."""
+        return self.encode_images(self.preprocess_frames(frames))
+    
+    @staticmethod
+    def aggregate_frame_embeddings(frame_embeddings):
+        """Average frame embeddings into one L2-normalized video embedding."""
+        avg_embedding = np.mean(frame_embeddings, axis=0)
+        return avg_embedding / np.linalg.norm(avg_embedding)
+    
     def compute_video_embedding(self, video_path, num_frames=5):
         """Compute CLIP embedding for a video by averaging frame embeddings."""
         frames = self.extract_frames(video_path, num_frames)
@@ -106,147 +207,776 @@ class VideoClusterer:
         if not frames:
             return None
         
-        embeddings = []
-        with torch.no_grad():
-            for frame in frames:
-                # Preprocess and encode
-                from PIL import Image
-                pil_image = Image.fromarray(frame)
-                image_input = self.preprocess(pil_image).unsqueeze(0).to(self.device)
-                embedding = self.model.encode_image(image_input)
-                embeddings.append(embedding.cpu().numpy())
-        
-        # Average embeddings across frames
-        avg_embedding = np.mean(embeddings, axis=0)
-        # Normalize
-        avg_embedding = avg_embedding / np.linalg.norm(avg_embedding)
-        
-        return avg_embedding.flatten()
-    
-    def compute_all_embeddings(self, force_recompute=False):
-        """Compute embeddings for all videos with caching."""
-        cache_file = self.cache_dir / "video_embeddings.pkl"
-        
-        # Try to load from cache
-        if cache_file.exists() and not force_recompute:
-            print("📦 Loading embeddings from cache...")
-            with open(cache_file, 'rb') as f:
-                cached_data = pickle.load(f)
-                self.video_files = cached_data['video_files']
-                self.embeddings = cached_data['embeddings']
-                print(f"✅ Loaded {len(self.video_files)} cached embeddings")
-                return self.embeddings
-        
-        # Compute embeddings
+        return self.aggregate_frame_embeddings(self.encode_frames(frames))
+    
+    def _iter_preprocessed_inline(self, video_infos, sampler):
+        """Decode and preprocess videos one at a time in this process (no timeout)."""
+        for video_idx, video_info in enumerate(video_infos):
+            start = time.monotonic()
+            try:
+                frames, timestamps, details = sampler.sample(self.decoder, video_info['path'])
+                if not frames:
+                    details.update(error='no frames decoded', reason='no-frames')
+                elif self.thumbnails is not None:
+                    self.thumbnails.write_safely(frames, self.thumbnails.path_for(video_info), video_info['name'])
+            except Exception as e:
+                print(f"❌ Error extracting frames from {video_info['name']}: {e}")
+                frames, timestamps, details = [], None, {'error': str(e), 'reason': 'error'}
+            images = self.preprocess_frames([frame for _, frame in frames]) if frames else None
+            # Full-resolution frames are not needed past preprocessing
+            del frames
+            details['decode_seconds'] = time.monotonic() - start
+            yield video_idx, images, timestamps, details
+            del images
+    
+    def compute_frame_embeddings_batched(self, video_infos, num_frames=None, batch_size=DEFAULT_BATCH_SIZE,
+                                         decode_workers=0, queue_depth=None, video_timeout=None,
+                                         memory_budget=None, on_frames=None, on_decoded=None):
+        """
+        Compute per-frame embeddings with frames from many videos stacked into shared batches.
+        
+        Frames are buffered until `batch_size` images are pending, encoded in one
+        forward pass, and the rows are routed back to their video. With
+        `decode_workers` > 0, decoding and preprocessing run in a process pool
+        that overlaps with CLIP inference; at most `queue_depth` decoded videos are
+        held at once, so memory stays flat regardless of collection size.
+        Frames are picked by the clusterer's sampler, or `num_frames` evenly spaced
+        ones if given; per-video sampling details (intro_frames) are added to the
+        video dicts. With thumbnails enabled, each video's thumbnail is saved
+        from the same decoded frames (video dicts need a 'fingerprint').
+        
+        With a `video_timeout` (seconds), each video is decoded in a killable
+        worker process (at least one, even without `decode_workers`), so a file
+        that hangs the decoder fails instead of stalling the run.
+        
+        With a `memory_budget` (MemoryBudget), batches shrink and decoding
+        pauses while memory use is near the budget.
+        
+        With `use_daemon`, the work goes to a running embedding_daemon.py (CLIP
+        already loaded); without one, or if it fails, it runs in this process.
+        
+        Callbacks: `on_decoded(video_info, outcome)` for every video, with
+        outcome holding 'decode_seconds' and, for failures, 'error' and 'reason';
+        `on_frames(video_info, frame_embeddings, timestamps)` as each video's
+        frames are encoded.
+        
+        Returns:
+            A list aligned with video_infos of (frame_embeddings, timestamps),
+            or None for videos that produced no frames
+        """
+        sampler = UniformSampler(num_frames) if num_frames else self.sampler
+        options = {'batch_size': batch_size, 'decode_workers': decode_workers, 'queue_depth': queue_depth,
+                   'video_timeout': video_timeout, 'memory_budget': memory_budget}
+        results = []
+        if self.use_daemon and video_infos:
+            results = daemon_embed(self, video_infos, sampler, CLIP_MODEL_NAME,
+                                   on_frames=on_frames, on_decoded=on_decoded, **options)
+        if len(results) < len(video_infos):
+            results += self.compute_frame_embeddings_local(video_infos[len(results):], sampler,
+                                                           on_frames=on_frames, on_decoded=on_decoded, **options)
+        return results
+    
+    def compute_frame_embeddings_local(self, video_infos, sampler, batch_size=DEFAULT_BATCH_SIZE,
+                                       decode_workers=0, queue_depth=None, video_timeout=None,
+                                       memory_budget=None, on_frames=None, on_decoded=None):
+        """
+        compute_frame_embeddings_batched in this process (also what the embedding daemon runs).
+        
+        Preprocessed frames are copied into one reusable CLIP input batch and
+        released; frame embeddings are written into preallocated blocks, each
+        video's rows a contiguous slice. With a MemoryBudget, the batch shrinks
+        and decoding pauses while usage is near the budget.
+        """
+        if video_timeout and decode_workers == 0:
+            decode_workers = 1
+        if decode_workers > 0:
+            decoded = iter_preprocessed_videos(
+                video_infos, self.decoder.name, self.preprocess, sampler,
+                workers=decode_workers, queue_depth=queue_depth or DEFAULT_QUEUE_DEPTH * decode_workers,
+                timeout=video_timeout, thumbnails=self.thumbnails,
+                admit=memory_budget.has_headroom if memory_budget else None
+            )
+        else:
+            decoded = self._iter_preprocessed_inline(video_infos, sampler)
+        
+        results = [None] * len(video_infos)
+        expected_frames = {}
+        frame_times = {}
+        slots = {}
+        block = None
+        block_used = 0
+        batch = None
+        batch_rows = 0
+        batch_owners = []
+        current_batch_size = batch_size
+        
+        def reserve(owner, dim):
+            """Contiguous rows for one video's frame embeddings in the current block."""
+            nonlocal block, block_used
+            rows = expected_frames[owner]
+            if block is None or block_used + rows > len(block):
+                block = np.empty((max(rows, FRAME_BLOCK_ROWS), dim), dtype=np.float32)
+                block_used = 0
+            block_used += rows
+            return [block[block_used - rows:block_used], 0]
+        
+        def flush():
+            nonlocal batch_rows
+            if not batch_rows:
+                return
+            embeddings = self.encode_images(batch[:batch_rows])
+            row = 0
+            for owner, rows in batch_owners:
+                if owner not in slots:
+                    slots[owner] = reserve(owner, embeddings.shape[1])
+                slot = slots[owner]
+                slot[0][slot[1]:slot[1] + rows] = embeddings[row:row + rows]
+                slot[1] += rows
+                row += rows
+                if slot[1] == expected_frames[owner]:
+                    # All frames of this video are encoded: hand them over
+                    del slots[owner], expected_frames[owner]
+                    results[owner] = (slot[0], frame_times.pop(owner))
+                    if on_frames:
+                        on_frames(video_infos[owner], *results[owner])
+            batch_rows = 0
+            batch_owners.clear()
+        
+        # A manual bar: wrapping the iterator would keep the last video's images referenced
+        progress = tqdm(total=len(video_infos), desc="Processing videos")
+        for video_idx, images, timestamps, details in decoded:
+            progress.update()
+            outcome = {key: details.pop(key) for key in ('decode_seconds', 'error', 'reason') if key in details}
+            video_infos[video_idx].update(details)
+            if on_decoded:
+                on_decoded(video_infos[video_idx], outcome)
+            if images is None or len(images) == 0:
+                continue
+            expected_frames[video_idx] = len(images)
+            frame_times[video_idx] = np.asarray(timestamps, dtype=np.float32)
+            copied = 0
+            while copied < len(images):
+                if batch is None:
+                    batch = np.empty((current_batch_size,) + images.shape[1:], dtype=images.dtype)
+                rows = min(len(images) - copied, len(batch) - batch_rows)
+                batch[batch_rows:batch_rows + rows] = images[copied:copied + rows]
+                batch_owners.append((video_idx, rows))
+                batch_rows += rows
+                copied += rows
+                if batch_rows == len(batch):
+                    flush()
+            # Its frames now live in the batch
+            del images
+            
+            if memory_budget is not None:
+                if memory_budget.over():
+                    # Encode what is pending now and continue with a smaller batch
+                    flush()
+                    current_batch_size = memory_budget.throttle(current_batch_size)
+                    batch = None
+                elif current_batch_size < batch_size and memory_budget.relaxed():
+                    flush()
+                    current_batch_size = min(batch_size, current_batch_size * 2)
+                    batch = None
+        progress.close()
+        flush()
+        return results
+    
+    def compute_embeddings_batched(self, video_infos, num_frames=None, batch_size=DEFAULT_BATCH_SIZE,
+                                   decode_workers=0, queue_depth=None):
+        """
+        Compute aggregated video embeddings via compute_frame_embeddings_batched.
+        
+        Returns:
+            (embeddings, valid_videos) for the videos that produced at least one frame
+        """
+        results = self.compute_frame_embeddings_batched(
+            video_infos, num_frames, batch_size=batch_size,
+            decode_workers=decode_workers, queue_depth=queue_depth
+        )
+        valid = [i for i, result in enumerate(results) if result is not None]
+        if not valid:
+            return np.array([]), []
+        embeddings = aggregate(
+            np.concatenate([results[i][0] for i in valid]), [len(results[i][0]) for i in valid],
+            self.aggregation, frame_times=np.concatenate([results[i][1] for i in valid])
+        )
+        return embeddings, [video_infos[i] for i in valid]
+    
+    def _read_cache(self):
+        """Load the embedding store (memory-mapped), or None if there isn't one."""
+        store = open_store(self.cache_dir, model=CLIP_MODEL_NAME, namespace=self.namespace)
+        if not store.exists():
+            return None
+        metadata = store.read_metadata()
+        return {
+            'store': store,
+            'metadata': metadata,
+            'video_files': rows_from_columns(metadata['columns'], metadata['count']),
+            'embeddings': store.open_embeddings(metadata),
+            'frames': store.load_frames(metadata),
+        }
+    
+    def _write_cache(self, frame_embeddings=None, frame_times=None):
+        extra = {'backend': self.backend, 'sampling': self.sampler.describe()}
+        if self.shard_description:
+            extra['shard'] = self.shard_description
+        EmbeddingStore(self.work_dir / "store").write(
+            self.video_files, self.embeddings, model=CLIP_MODEL_NAME, extra=extra,
+            frame_embeddings=frame_embeddings, frame_times=frame_times, aggregation=self.aggregation
+        )
+    
+    def load_cached_embeddings(self):
+        """Load embeddings from cache as-is, computing them only if no cache exists."""
+        cached_data = self._read_cache()
+        if cached_data is None:
+            return self.compute_all_embeddings()
+        
+        print("📦 Loading embeddings from cache...")
+        self.video_files = cached_data['video_files']
+        self.embeddings = cached_data['store'].aggregated(self.aggregation, cached_data['metadata'])
+        print(f"✅ Loaded {len(self.video_files)} cached embeddings ({self.aggregation} of frames)")
+        return self.embeddings
+    
+    def _fingerprint_videos(self, video_infos, cached_videos, full_hash=False):
+        """
+        Attach a content fingerprint to each video, skipping the hash when size and
+        mtime are unchanged (per the store, else the discovery manifest). New
+        fingerprints are hashed in parallel and remembered in the manifest.
+        
+        Every video is stat'ed again first: the manifest skips directories whose
+        mtime is unchanged, which misses files rewritten in place.
+        """
+        cached_by_path = {str(v['path']): v for v in cached_videos if v.get('fingerprint')}
+        manifest = VideoManifest(self.cache_dir)
+        manifest.refresh(video_infos)
+        
+        to_hash = []
+        for video_info in video_infos:
+            if 'mtime_ns' not in video_info:
+                video_info.update(self.describe_video(video_info['path'], video_info['channel']))
+            
+            cached = cached_by_path.get(str(video_info['path']))
+            if (cached
+                    and cached.get('size_bytes') == video_info['size_bytes']
+                    and cached.get('mtime_ns') == video_info['mtime_ns']
+                    and not (full_hash and cached['fingerprint'].startswith('p:'))):
+                video_info['fingerprint'] = cached['fingerprint']
+            else:
+                to_hash.append(video_info)
+        
+        hashed = manifest.fingerprint(to_hash, full=full_hash)
+        if hashed:
+            print(f"🔑 Fingerprinted {hashed} new or changed videos")
+        resolve_partial_collisions(video_infos)
+        manifest.record_fingerprints(video_infos)
+        manifest.save()
+    
+    def compute_all_embeddings(self, force_recompute=False, batch_size=DEFAULT_BATCH_SIZE,
+                               decode_workers=0, queue_depth=None, full_hash=False, resume=False,
+                               checkpoint_every=DEFAULT_CHECKPOINT_EVERY,
+                               checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL,
+                               video_timeout=DEFAULT_VIDEO_TIMEOUT, retry_quarantined=False,
+                               skip_duplicates=False, memory_budget_mb=None):
+        """
+        Compute embeddings for all videos with an incremental, fingerprint-keyed cache.
+        
+        Only videos whose content fingerprint isn't cached are decoded and encoded;
+        cache entries for files that disappeared are dropped. `force_recompute`
+        ignores the cache entirely.
+        
+        Newly computed embeddings are checkpointed every `checkpoint_every` videos
+        or `checkpoint_interval` seconds (and on Ctrl-C). With `resume`, videos
+        already in the checkpoint of an interrupted run are not computed again.
+        
+        Each video is decoded under a `video_timeout` budget. Videos that time out
+        or fail are quarantined by fingerprint and skipped by later runs until
+        the file changes (or `retry_quarantined`).
+        
+        With `skip_duplicates`, non-canonical copies listed in the near-duplicate
+        index (near_duplicates.py) are left out before any decoding.
+        
+        With `memory_budget_mb`, encoding is throttled to stay under that much
+        memory (see memory_budget.py), and peak memory plus the largest Python
+        allocations are reported at the end.
+        """
+        if not self.channels_dir.exists():
+            print(f"❌ Channels directory not found: {self.channels_dir}")
+            return self.load_cached_embeddings() if self._read_cache() is not None else None
+        
+        cached_data = None if force_recompute else self._read_cache()
+        cached_videos = cached_data['video_files'] if cached_data else []
+        cached_embeddings = cached_data['embeddings'] if cached_data else None
+        cached_frames = cached_data['frames'] if cached_data else None
+        if cached_frames:
+            cached_frame_offsets = frame_offsets(cached_frames[2])
+        
+        def cached_entry(row):
+            """(frame_embeddings, frame_times, fallback_embedding) for a cache row."""
+            if cached_frames and cached_frames[2][row]:
+                start, end = cached_frame_offsets[row], cached_frame_offsets[row + 1]
+                return cached_frames[0][start:end], cached_frames[1][start:end], None
+            # Stores from before per-frame embeddings only have the pooled vector
+            return None, None, cached_embeddings[row]
+        
         if not self.video_files:
             self.find_all_videos()
+        self._fingerprint_videos(self.video_files, cached_videos, full_hash=full_hash)
+        # Duplicate skipping and sharding narrow video_files; the quarantine is pruned against all of them
+        discovered = list(self.video_files)
+        if skip_duplicates:
+            self.skip_duplicates()
+        if self.shard:
+            index, count = self.shard
+            self.shard_description = shard_info(self.video_files, index, count)
+            total = len(self.video_files)
+            self.video_files = select_shard(self.video_files, index, count)
+            print(f"🧩 Shard {index}/{count}: {len(self.video_files)} of {total} videos")
         
-        print(f"🎬 Computing CLIP embeddings for {len(self.video_files)} videos...")
-        print("⏱️  This may take 5-10 minutes...")
+        # Cached rows by fingerprint; entries from older caches without one are adopted by path + size
+        cached_rows = {}
+        legacy_rows = {}
+        for row, video_info in enumerate(cached_videos):
+            if video_info.get('fingerprint'):
+                cached_rows.setdefault(video_info['fingerprint'], row)
+            else:
+                legacy_rows[(str(video_info['path']), round(video_info.get('size_mb', -1), 6))] = row
         
-        embeddings = []
-        valid_videos = []
+        # Frame embeddings from an interrupted run's checkpoint
+        checkpoint = EmbeddingCheckpoint(self.work_dir / "checkpoint", every=checkpoint_every,
+                                         interval=checkpoint_interval, model=CLIP_MODEL_NAME)
+        checkpoint_rows = {}
+        if checkpoint.exists():
+            checkpoint_videos, checkpoint_frames, checkpoint_times, saved_at = checkpoint.load()
+            if resume:
+                print(f"⏩ Resuming from checkpoint saved {saved_at} ({len(checkpoint_videos)} embeddings)")
+                checkpoint_rows = {v['fingerprint']: (f, t, None)
+                                   for v, f, t in zip(checkpoint_videos, checkpoint_frames, checkpoint_times)}
+            else:
+                print(f"⚠️  Ignoring checkpoint from an interrupted run ({len(checkpoint_videos)} embeddings, "
+                      f"saved {saved_at}). Pass --resume to reuse it.")
         
-        for video_info in tqdm(self.video_files, desc="Processing videos"):
-            embedding = self.compute_video_embedding(video_info['path'])
-            if embedding is not None:
-                embeddings.append(embedding)
-                valid_videos.append(video_info)
+        quarantine = Quarantine(self.work_dir if self.shard else self.cache_dir)
+        if self.shard:
+            # Shards write their own quarantine (merged later) but honour the main one
+            quarantine.entries = {**Quarantine(self.cache_dir).entries, **quarantine.entries}
+        if retry_quarantined:
+            quarantine.clear()
+        else:
+            quarantine.prune(discovered)
         
-        self.embeddings = np.array(embeddings)
+        reused = {}
+        resumed = 0
+        quarantined = 0
+        to_compute = []
+        for idx, video_info in enumerate(self.video_files):
+            row = cached_rows.get(video_info['fingerprint'])
+            if row is None:
+                row = legacy_rows.get((str(video_info['path']), round(video_info['size_mb'], 6)))
+            if row is not None:
+                reused[idx] = cached_entry(row)
+            elif video_info['fingerprint'] in checkpoint_rows:
+                reused[idx] = checkpoint_rows[video_info['fingerprint']]
+                # Keep resumed work in the next checkpoints too
+                video_info['frame_count'] = len(reused[idx][0])
+                checkpoint.video_files.append(video_info)
+                checkpoint.frame_embeddings.append(reused[idx][0])
+                checkpoint.frame_times.append(reused[idx][1])
+                resumed += 1
+            elif video_info['fingerprint'] in quarantine:
+                quarantined += 1
+            else:
+                to_compute.append(idx)
+        
+        # Cached files that no longer exist are not carried over
+        current_paths = {str(v['path']) for v in self.video_files}
+        dropped = sum(1 for v in cached_videos if str(v['path']) not in current_paths)
+        
+        print(f"♻️  Reusing {len(reused) - resumed} cached embeddings, computing {len(to_compute)} new/changed"
+              + (f", dropping {dropped} stale" if dropped else ""))
+        if quarantined:
+            print(f"🚫 Skipping {quarantined} quarantined videos (see {quarantine.file.name}, "
+                  "--retry-quarantined to try again)")
+        if resumed:
+            print(f"⏩ Checkpoint skipped {resumed} of {resumed + len(to_compute)} videos "
+                  f"({100 * resumed / (resumed + len(to_compute)):.0f}% of the remaining work)")
+        
+        computed = {}
+        decode_times = []
+        memory_budget = MemoryBudget(memory_budget_mb) if memory_budget_mb else None
+        if memory_budget:
+            memory_budget.start()
+        
+        def record_outcome(video_info, outcome):
+            decode_times.append((outcome['decode_seconds'], video_info['name']))
+            if 'reason' in outcome:
+                quarantine.add(video_info, outcome['reason'], outcome.get('error'), outcome['decode_seconds'])
+        
+        if to_compute:
+            print(f"🎬 Computing CLIP embeddings for {len(to_compute)} videos (batch size {batch_size})...")
+            try:
+                results = self.compute_frame_embeddings_batched(
+                    [self.video_files[i] for i in to_compute],
+                    batch_size=batch_size, decode_workers=decode_workers, queue_depth=queue_depth,
+                    video_timeout=video_timeout, memory_budget=memory_budget,
+                    on_frames=checkpoint.add, on_decoded=record_outcome
+                )
+            except KeyboardInterrupt:
+                quarantine.save()
+                checkpoint.save()
+                print(f"\n💾 Interrupted: checkpointed {len(checkpoint.video_files)} embeddings. "
+                      "Re-run with --resume to continue.")
+                raise
+            computed = {idx: result + (None,) for idx, result in zip(to_compute, results) if result is not None}
+            self.report_latency(decode_times)
+            failed = len(to_compute) - len(computed)
+            if failed:
+                print(f"🚫 Quarantined {failed} videos that failed or timed out (see {quarantine.file.name})")
+            self.report_sampling([len(entry[0]) for entry in computed.values()], "this run")
+            if self.sampler.intro:
+                skipped = [self.video_files[idx].get('intro_frames', 0) for idx in computed]
+                print(f"⏭️  Intro skipped in {sum(1 for n in skipped if n)} of {len(skipped)} videos "
+                      f"({sum(skipped)} frames)")
+        
+        # Rebuild in discovery order; videos that failed to decode are left out
+        entries = []
+        valid_videos = []
+        for idx, video_info in enumerate(self.video_files):
+            entry = reused.get(idx) or computed.get(idx)
+            if entry is not None:
+                video_info['frame_count'] = 0 if entry[0] is None else len(entry[0])
+                entries.append(entry)
+                valid_videos.append(video_info)
         self.video_files = valid_videos
         
-        # Cache results
-        print("💾 Caching embeddings...")
-        with open(cache_file, 'wb') as f:
-            pickle.dump({
-                'video_files': self.video_files,
-                'embeddings': self.embeddings
-            }, f)
+        cached_keys = [(str(v['path']), v.get('fingerprint')) for v in cached_videos]
+        if (cached_data and not self.shard
+                and cached_keys == [(str(v['path']), v['fingerprint']) for v in self.video_files]):
+            # Same videos as the store: pool from it (derived aggregations are cached there)
+            self.embeddings = cached_data['store'].aggregated(self.aggregation, cached_data['metadata'])
+        else:
+            dim = next((len(e[2]) if e[0] is None else e[0].shape[1] for e in entries), 0)
+            frame_embeddings = np.concatenate([e[0] for e in entries if e[0] is not None] or [np.zeros((0, dim))])
+            frame_times = np.concatenate([e[1] for e in entries if e[0] is not None] or [np.zeros(0)])
+            fallback = np.zeros((len(entries), dim), dtype=np.float32)
+            for i, entry in enumerate(entries):
+                if entry[0] is None:
+                    fallback[i] = entry[2]
+            self.embeddings = aggregate(frame_embeddings, [v['frame_count'] for v in self.video_files],
+                                        self.aggregation, frame_times=frame_times, fallback=fallback)
+            
+            legacy = sum(1 for e in entries if e[0] is None)
+            if legacy:
+                print(f"💡 {legacy} cached videos predate per-frame embeddings and keep their stored "
+                      "embedding; run with --force to re-encode them")
+            print("💾 Caching embeddings...")
+            self._write_cache(frame_embeddings, frame_times)
+        checkpoint.clear()
+        quarantine.save()
+        self.report_sampling([v['frame_count'] for v in self.video_files if v['frame_count']], "collection")
         
-        print(f"✅ Computed embeddings for {len(self.embeddings)} videos (shape: {self.embeddings.shape})")
+        if memory_budget:
+            memory_budget.report()
+        print(f"✅ Embeddings ready for {len(self.embeddings)} videos (shape: {self.embeddings.shape})")
         return self.embeddings
     
-    def cluster_videos(self, n_neighbors=15, min_cluster_size=10, min_samples=1, assign_all=True):
-        """Cluster videos using UMAP + HDBSCAN."""
+    def skip_duplicates(self):
+        """Drop non-canonical near-duplicates (per the saved index) from self.video_files."""
+        index = load_duplicate_index(self.cache_dir)
+        if index is None:
+            print(f"⚠️  No {DUPLICATE_INDEX_NAME} in {self.cache_dir}; run near_duplicates.py build first")
+            return
+        total = len(self.video_files)
+        self.video_files = index.canonical_only(self.video_files)
+        if total > len(self.video_files):
+            print(f"🔁 Skipping {total - len(self.video_files)} near-duplicate copies")
+    
+    def enable_intro_skip(self, rebuild=False):
+        """
+        Skip the shared CRT intro when sampling frames. Uses the saved intro
+        reference, else the one recorded in the embedding store, else builds one
+        from the collection.
+        """
+        reference = None if rebuild else load_intro_reference(self.cache_dir)
+        if reference is None and not rebuild:
+            for namespace in list_namespaces(self.cache_dir):
+                store = EmbeddingStore(namespace_dir(self.cache_dir, namespace) / "store")
+                recorded = store.read_metadata().get('sampling', {}).get('intro')
+                if recorded:
+                    reference = IntroReference.from_dict(recorded)
+                    save_intro_reference(reference, self.cache_dir, source=f'embedding store {namespace}')
+                    break
+        
+        if reference is None:
+            if not self.video_files:
+                self.find_all_videos()
+            print(f"🔍 Looking for a shared intro in {len(self.video_files)} videos...")
+            reference = build_intro_reference([v['path'] for v in self.video_files], self.decoder)
+            save_intro_reference(reference, self.cache_dir, source=str(self.channels_dir))
+        
+        if reference:
+            print(f"⏭️  Skipping shared intro ({len(reference.hashes)} reference hashes)")
+        else:
+            print("⚠️  No shared intro found; sampling from the first frame")
+        self.sampler.intro = reference
+        return reference
+    
+    @staticmethod
+    def report_latency(decode_times):
+        """Print p50/p95/max per-video decode time and the slowest videos."""
+        if not decode_times:
+            return None
+        
+        seconds = np.array([t for t, _ in decode_times])
+        p50, p95 = np.percentile(seconds, [50, 95])
+        slowest = sorted(decode_times, reverse=True)[:3]
+        print(f"⏱️  Per-video decode time: p50 {p50:.2f}s · p95 {p95:.2f}s · max {seconds.max():.2f}s")
+        print(f"   Slowest: {', '.join(f'{name} ({t:.1f}s)' for t, name in slowest)}")
+        return {'p50': float(p50), 'p95': float(p95), 'max': float(seconds.max())}
+    
+    def report_sampling(self, frame_counts, scope):
+        """Print how many CLIP frames adaptive sampling used compared to uniform sampling."""
+        if self.sampler.name == 'uniform' or not frame_counts:
+            return None
+        
+        frame_counts = np.asarray(frame_counts)
+        baseline = UniformSampler().num_frames * len(frame_counts)
+        saved = baseline - frame_counts.sum()
+        print(f"🎞️  Scene sampling ({scope}): {frame_counts.sum()} frames for {len(frame_counts)} videos, "
+              f"uniform would encode {baseline} "
+              f"({100 * abs(saved) / baseline:.0f}% {'fewer' if saved >= 0 else 'more'} CLIP passes)")
+        print(f"   Frames per video: min {frame_counts.min()} · median {np.median(frame_counts):.0f} · "
+              f"max {frame_counts.max()} | {np.sum(frame_counts <= self.sampler.min_frames)} static, "
+              f"{np.sum(frame_counts >= self.sampler.max_frames)} at the cap")
+        return {'videos': len(frame_counts), 'frames': int(frame_counts.sum()), 'uniform_frames': baseline}
+    
+    def cluster_params(self, n_neighbors=DEFAULT_NEIGHBORS, min_cluster_size=DEFAULT_MIN_CLUSTER_SIZE, min_samples=1,
+                       noise_policy=DEFAULT_NOISE_POLICY):
+        """Everything a saved clustering depends on besides the embeddings."""
+        return {'n_neighbors': n_neighbors, 'min_cluster_size': min_cluster_size, 'min_samples': min_samples,
+                'noise_policy': noise_policy, 'aggregation': self.aggregation}
+    
+    def assign_clusters(self, n_neighbors=DEFAULT_NEIGHBORS, min_cluster_size=DEFAULT_MIN_CLUSTER_SIZE, min_samples=1,
+                        noise_policy=DEFAULT_NOISE_POLICY, drift_limit=DRIFT_LIMIT, novelty_limit=NOVELTY_LIMIT):
+        """
+        Label videos the saved clustering model hasn't seen, keeping every other label.
+        
+        New embeddings are transformed with the saved UMAP reducers and labelled
+        with hdbscan.approximate_predict (see cluster_model.py).
+        
+        Returns:
+            The labels of all videos, or None when a full cluster_videos refit is
+            needed (no model, parameters changed, drift or novelty over the limit)
+        """
         if not CLUSTERING_AVAILABLE:
             print("❌ Clustering libraries not available. Install: pip install umap-learn hdbscan scikit-learn")
             return None
+        import hdbscan
         
         if self.embeddings is None:
             print("❌ No embeddings available. Run compute_all_embeddings() first.")
             return None
         
+        model = ClusterModel(self.store_root / CLUSTER_MODEL_DIR)
+        params = self.cluster_params(n_neighbors, min_cluster_size, min_samples, noise_policy)
+        keys, saved_labels, saved_reduced, saved_2d = model.load_assignments() if model.exists() else ([], [], [], [])
+        saved_rows = {key: row for row, key in enumerate(keys)}
+        new_indices = [i for i, v in enumerate(self.video_files) if video_key(v) not in saved_rows]
+        
+        reason = model.refit_reason(params, len(new_indices), drift_limit)
+        if reason:
+            print(f"🔄 Full refit needed: {reason}")
+            return None
+        
+        print(f"\n🧲 Assigning {len(new_indices)} new videos to the saved clustering "
+              f"({len(self.video_files) - len(new_indices)} keep their channel)...")
+        labels = np.full(len(self.video_files), -1, dtype=int)
+        embeddings_2d = np.zeros((len(self.video_files), saved_2d.shape[1]), dtype=np.float32)
+        for i, video_info in enumerate(self.video_files):
+            row = saved_rows.get(video_key(video_info))
+            if row is not None:
+                labels[i] = saved_labels[row]
+                embeddings_2d[i] = saved_2d[row]
+        
+        if new_indices:
+            reducer, reducer_2d, hdbscan_model = model.load_models()
+            new_embeddings = np.asarray(self.embeddings[new_indices])
+            new_reduced = reducer.transform(new_embeddings)
+            new_labels, _ = hdbscan.approximate_predict(hdbscan_model, new_reduced)
+            
+            novelty = float(np.mean(model.novel(new_reduced, new_labels, saved_reduced)))
+            if novelty > novelty_limit:
+                print(f"🔄 Full refit needed: {novelty:.0%} of the new videos are unlike any clustered video "
+                      f"(limit {novelty_limit:.0%})")
+                return None
+            
+            # Same as a full fit: outliers are resolved against every clustered video
+            new_labels = reassign_noise(new_labels, new_reduced, noise_policy,
+                                        reference=np.vstack([saved_reduced, new_reduced]),
+                                        reference_labels=np.concatenate([saved_labels, new_labels]))
+            
+            labels[new_indices] = new_labels
+            embeddings_2d[new_indices] = reducer_2d.transform(new_embeddings)
+            model.append([self.video_files[i] for i in new_indices], new_labels, new_reduced,
+                         embeddings_2d[new_indices])
+        
+        self.cluster_labels = labels
+        self.embeddings_2d = embeddings_2d
+        joined = defaultdict(int)
+        for label in labels[new_indices]:
+            joined[int(label)] += 1
+        print("✅ Assigned: " + (", ".join(f"{count} → {'noise' if label == -1 else f'cluster {label}'}"
+                                            for label, count in sorted(joined.items())) or "nothing new"))
+        return self.cluster_labels
+    
+    def cluster_videos(self, n_neighbors=DEFAULT_NEIGHBORS, min_cluster_size=DEFAULT_MIN_CLUSTER_SIZE, min_samples=1,
+                       noise_policy=DEFAULT_NOISE_POLICY, use_cache=True):
+        """
+        Cluster videos using UMAP + HDBSCAN.
+        
+        Results are cached by embeddings and parameters (see cluster_cache.py):
+        an identical request is loaded from disk instead of refitting.
+        """
+        if self.embeddings is None:
+            print("❌ No embeddings available. Run compute_all_embeddings() first.")
+            return None
+        
+        params = self.cluster_params(n_neighbors, min_cluster_size, min_samples, noise_policy)
+        cache = ClusterCache(self.store_root / CLUSTER_CACHE_DIR)
+        digest = embeddings_hash(self.embeddings)
+        cache_key = cache.key(digest, {**params, 'umap': UMAP_SETTINGS, 'hdbscan': HDBSCAN_SETTINGS})
+        if use_cache and self._use_cached_clustering(cache.load(cache_key)):
+            return self.cluster_labels
+        
+        if not CLUSTERING_AVAILABLE:
+            print("❌ Clustering libraries not available. Install: pip install umap-learn hdbscan scikit-learn")
+            return None
+        import umap
+        import hdbscan
+        
         print("\n🔮 Clustering videos...")
         print(f"📊 Input: {self.embeddings.shape[0]} videos with {self.embeddings.shape[1]}-dim embeddings")
         
-        # Step 1: Dimensionality reduction with UMAP
+        # Step 1: Dimensionality reduction with UMAP, both fits sharing one kNN graph
+        timings = {}
+        start = time.perf_counter()
+        knn = self.knn_graph(n_neighbors, digest)
+        timings['kNN'] = time.perf_counter() - start
+        start = time.perf_counter()
         print(f"   🔸 UMAP: Reducing {self.embeddings.shape[1]} → 5 dimensions...")
         reducer = umap.UMAP(
             n_neighbors=n_neighbors,
             n_components=5,
-            min_dist=0.0,
-            metric='cosine',
-            random_state=42,
-            verbose=False
+            precomputed_knn=knn,
+            verbose=False,
+            **UMAP_SETTINGS
         )
         reduced_embeddings = reducer.fit_transform(self.embeddings)
+        timings['UMAP 5-D'] = time.perf_counter() - start
         print(f"   ✅ UMAP complete: {reduced_embeddings.shape}")
         
         # Step 2: Clustering with HDBSCAN
         print(f"   🔸 HDBSCAN: Finding clusters (min_cluster_size={min_cluster_size}, min_samples={min_samples})...")
+        start = time.perf_counter()
         clusterer = hdbscan.HDBSCAN(
             min_cluster_size=min_cluster_size,
             min_samples=min_samples,
-            metric='euclidean',
-            cluster_selection_method='eom',
-            prediction_data=True  # Enable prediction for outliers
+            prediction_data=True,  # Enable prediction for outliers
+            **HDBSCAN_SETTINGS
         )
         self.cluster_labels = clusterer.fit_predict(reduced_embeddings)
         
-        # Step 2b: Assign outliers to nearest cluster if requested
-        if assign_all:
-            noise_mask = self.cluster_labels == -1
-            num_noise = np.sum(noise_mask)
-            if num_noise > 0:
-                print(f"   🔸 Assigning {num_noise} outliers to nearest clusters...")
-                # Use approximate_predict to assign outliers
-                noise_predictions, _ = hdbscan.approximate_predict(clusterer, reduced_embeddings[noise_mask])
-                self.cluster_labels[noise_mask] = noise_predictions
-                
-                # If any still remain as -1, assign to nearest cluster by distance
-                still_noise = self.cluster_labels == -1
-                if np.sum(still_noise) > 0:
-                    from sklearn.metrics.pairwise import euclidean_distances
-                    noise_indices = np.where(still_noise)[0]
-                    assigned_indices = np.where(~still_noise)[0]
-                    
-                    for idx in noise_indices:
-                        distances = euclidean_distances(
-                            reduced_embeddings[idx].reshape(1, -1),
-                            reduced_embeddings[assigned_indices]
-                        )
-                        nearest = assigned_indices[np.argmin(distances)]
-                        self.cluster_labels[idx] = self.cluster_labels[nearest]
+        # Step 2b: Resolve outliers by the noise policy
+        noise_mask = self.cluster_labels == -1
+        num_noise = np.sum(noise_mask)
+        if num_noise > 0 and noise_policy != 'keep':
+            if num_noise == len(noise_mask):
+                print("   ⚠️  HDBSCAN found no clusters, every video stays noise (try a smaller --min-cluster-size)")
+            else:
+                print(f"   🔸 Assigning {num_noise} outliers ({noise_policy})...")
+                if noise_policy == 'nearest-neighbor':
+                    # Use approximate_predict first, then the nearest clustered video for what remains
+                    noise_predictions, _ = hdbscan.approximate_predict(clusterer, reduced_embeddings[noise_mask])
+                    self.cluster_labels[noise_mask] = noise_predictions
+                self.cluster_labels = reassign_noise(self.cluster_labels, reduced_embeddings, noise_policy)
+        
+        timings['HDBSCAN'] = time.perf_counter() - start
         
         # Step 3: Also create 2D projection for visualization
         print("   🔸 Creating 2D visualization projection...")
+        start = time.perf_counter()
         reducer_2d = umap.UMAP(
             n_neighbors=n_neighbors,
             n_components=2,
-            min_dist=0.0,
-            metric='cosine',
-            random_state=42,
-            verbose=False
+            precomputed_knn=knn,
+            verbose=False,
+            **UMAP_SETTINGS
         )
         self.embeddings_2d = reducer_2d.fit_transform(self.embeddings)
+        timings['UMAP 2-D'] = time.perf_counter() - start
+        print("   ⏱️  " + ", ".join(f"{step} {seconds:.1f}s" for step, seconds in timings.items()))
+        
+        # Keep the fitted models so new videos can be assigned without a refit
+        ClusterModel(self.store_root / CLUSTER_MODEL_DIR).save(
+            reducer, reducer_2d, clusterer, params,
+            self.video_files, self.cluster_labels, reduced_embeddings, self.embeddings_2d,
+            fit_reach(reducer, self.embeddings, reduced_embeddings)
+        )
+        cache.save(cache_key, digest, params, self.cluster_labels, reduced_embeddings, self.embeddings_2d)
         
-        # Analyze clusters
+        print(f"\n✅ Clustering complete!")
+        self.print_cluster_summary()
+        return self.cluster_labels
+    
+    def knn_graph(self, n_neighbors=DEFAULT_NEIGHBORS, digest=None):
+        """
+        Cosine kNN graph of the embeddings, built once for both UMAP fits and
+        cached per embeddings and n_neighbors (see cluster_cache.py).
+        
+        Returns:
+            (knn_indices, knn_distances, search_index), for umap.UMAP(precomputed_knn=...)
+        """
+        cache = ClusterCache(self.store_root / CLUSTER_CACHE_DIR)
+        key = cache.key(digest or embeddings_hash(self.embeddings),
+                        {'knn': n_neighbors, 'metric': UMAP_SETTINGS['metric'],
+                         'random_state': UMAP_SETTINGS['random_state']})
+        graph = cache.load_knn(key)
+        if graph is not None:
+            print(f"   ♻️  Reusing cached kNN graph ({n_neighbors} neighbours)")
+            return graph
+        
+        print(f"   🔸 kNN graph: {n_neighbors} nearest neighbours per video...")
+        graph = build_knn_graph(self.embeddings, n_neighbors)
+        cache.save_knn(key, graph)
+        return graph
+    
+    def load_cached_clustering(self):
+        """
+        Use the most recent cached clustering of the current embeddings, whatever
+        its parameters. Returns True if there was one.
+        """
+        if self.embeddings is None:
+            return False
+        cache = ClusterCache(self.store_root / CLUSTER_CACHE_DIR)
+        return self._use_cached_clustering(cache.latest(embeddings_hash(self.embeddings)))
+    
+    def _use_cached_clustering(self, entry):
+        if entry is None:
+            return False
+        self.cluster_labels = entry['labels']
+        self.embeddings_2d = entry['embeddings_2d']
+        params = entry['params']
+        print(f"\n📦 Using cached clustering from {entry['created']} (min_cluster_size={params['min_cluster_size']}, "
+              f"n_neighbors={params['n_neighbors']})")
+        self.print_cluster_summary()
+        return True
+    
+    def print_cluster_summary(self):
+        """Print the number of clusters, noise and cluster sizes of the current labels."""
         unique_clusters = np.unique(self.cluster_labels)
         num_clusters = len(unique_clusters[unique_clusters >= 0])  # Exclude -1 (noise)
         num_noise = np.sum(self.cluster_labels == -1)
         
-        print(f"\n✅ Clustering complete!")
         print(f"   📊 Found {num_clusters} clusters")
         print(f"   🔇 {num_noise} videos marked as noise/outliers")
         
@@ -258,14 +988,14 @@ class VideoClusterer:
                 print(f"   Noise: {count} videos")
             else:
                 print(f"   Cluster {cluster_id}: {count} videos")
-        
-        return self.cluster_labels
     
     def visualize_clusters(self, save_path="video_clusters_visualization.png"):
         """Create 2D visualization of video clusters."""
         if not PLOTTING_AVAILABLE:
             print("❌ Plotting libraries not available. Install: pip install matplotlib seaborn")
             return
+        import matplotlib.pyplot as plt
+        import seaborn as sns
         
         if self.embeddings_2d is None or self.cluster_labels is None:
             print("❌ No clustering results to visualize. Run cluster_videos() first.")
@@ -412,57 +1142,206 @@ class VideoClusterer:
                 print(f"      • {video['name'][:60]}...")
 
 
+def ensure_clusters(clusterer, args, reuse_latest=True):
+    """Labels for visualize/report/preview: this run's, else cached, else a fresh clustering."""
+    if clusterer.cluster_labels is not None:
+        return
+    print("⚠️  Loading cached results...")
+    clusterer.load_cached_embeddings()
+    if reuse_latest and clusterer.load_cached_clustering():
+        return
+    clusterer.cluster_videos(n_neighbors=args.neighbors, min_cluster_size=args.min_cluster_size,
+                             noise_policy=args.noise_policy)
+
+
 def main():
     parser = argparse.ArgumentParser(description="Advanced Video Clustering with CLIP")
-    parser.add_argument("command", choices=['analyze', 'visualize', 'report', 'preview', 'full'],
+    parser.add_argument("command", choices=['analyze', 'visualize', 'report', 'preview', 'full', 'merge',
+                                            'autotune', 'sweep'],
                        help="Command to run")
     parser.add_argument("--channels-dir", default="channels", help="Directory containing video channels")
     parser.add_argument("--force", action="store_true", help="Force recompute embeddings")
-    parser.add_argument("--min-cluster-size", type=int, default=10, 
-                       help="Minimum cluster size (default: 10)")
-    parser.add_argument("--neighbors", type=int, default=15,
-                       help="UMAP n_neighbors parameter (default: 15)")
+    parser.add_argument("--resume", action="store_true",
+                       help="Reuse embeddings checkpointed by an interrupted run")
+    parser.add_argument("--checkpoint-every", type=int, default=DEFAULT_CHECKPOINT_EVERY,
+                       help=f"Checkpoint after this many new embeddings (default: {DEFAULT_CHECKPOINT_EVERY})")
+    parser.add_argument("--checkpoint-interval", type=float, default=DEFAULT_CHECKPOINT_INTERVAL,
+                       help=f"Checkpoint at least this often, in seconds (default: {DEFAULT_CHECKPOINT_INTERVAL})")
+    parser.add_argument("--rescan", action="store_true",
+                       help="List and stat every channel folder instead of trusting the discovery manifest")
+    parser.add_argument("--full-hash", action="store_true",
+                       help="Fingerprint videos over their full content instead of sampled chunks")
+    # Unset, visualize/report/preview reuse the last cached clustering of these embeddings
+    parser.add_argument("--min-cluster-size", type=int, default=None,
+                       help=f"Minimum cluster size (default: {DEFAULT_MIN_CLUSTER_SIZE})")
+    parser.add_argument("--neighbors", type=int, default=None,
+                       help=f"UMAP n_neighbors parameter (default: {DEFAULT_NEIGHBORS})")
+    parser.add_argument("--noise-policy", choices=NOISE_POLICIES, default=None,
+                       help=f"What happens to videos HDBSCAN calls noise (default: {DEFAULT_NOISE_POLICY})")
+    parser.add_argument("--sweep-neighbors", type=int, nargs='+', default=None,
+                       help="sweep: n_neighbors values to try (default: --neighbors)")
+    parser.add_argument("--sweep-min-cluster-sizes", type=int, nargs='+', default=DEFAULT_SWEEP_MIN_CLUSTER_SIZES,
+                       help=f"sweep: min_cluster_size values to try (default: "
+                            f"{' '.join(map(str, DEFAULT_SWEEP_MIN_CLUSTER_SIZES))})")
+    parser.add_argument("--sweep-jobs", type=int, default=None,
+                       help="sweep: parallel HDBSCAN fits (default: one per core)")
+    parser.add_argument("--sweep-output", default="cluster_sweep.json",
+                       help="sweep: JSON file for the results table (default: cluster_sweep.json)")
+    parser.add_argument("--decoder", choices=list(DECODERS), default=DEFAULT_DECODER,
+                       help=f"Frame decoding backend (default: {DEFAULT_DECODER})")
+    parser.add_argument("--backend", choices=ENCODER_BACKENDS, default=DEFAULT_BACKEND,
+                       help=f"CLIP image encoder backend (default: {DEFAULT_BACKEND})")
+    parser.add_argument("--aggregation", choices=AGGREGATIONS, default=DEFAULT_AGGREGATION,
+                       help=f"How frame embeddings are pooled per video (default: {DEFAULT_AGGREGATION})")
+    parser.add_argument("--sampler", choices=SAMPLERS, default=DEFAULT_SAMPLER,
+                       help=f"Frame sampling strategy (default: {DEFAULT_SAMPLER})")
+    parser.add_argument("--num-frames", type=int, default=5,
+                       help="Frames per video for the uniform sampler (default: 5)")
+    parser.add_argument("--min-frames", type=int, default=None,
+                       help="Scene sampler: fewest frames per video (default: 2)")
+    parser.add_argument("--max-frames", type=int, default=None,
+                       help="Scene sampler: most frames per video (default: 12)")
+    parser.add_argument("--scene-threshold", type=float, default=None,
+                       help="Scene sampler: change score that starts a new scene, 0-1 (default: 0.12)")
+    parser.add_argument("--skip-intro", action="store_true",
+                       help="Start sampling after the shared CRT intro (reference built on first use)")
+    parser.add_argument("--rebuild-intro", action="store_true",
+                       help="Rebuild the intro reference from the collection (implies --skip-intro)")
+    parser.add_argument("--namespace", default=None,
+                       help="Embedding namespace to use (default: derived from model, sampler and backend)")
+    parser.add_argument("--shard", type=parse_shard, default=None, metavar="I/N",
+                       help="Compute embeddings only for shard I of N (by fingerprint); combine with merge")
+    parser.add_argument("--keep-shards", action="store_true",
+                       help="merge: keep the shard stores after merging them")
+    parser.add_argument("--skip-duplicates", action="store_true",
+                       help="Leave out non-canonical copies found by near_duplicates.py build")
+    parser.add_argument("--thumbnails", action="store_true",
+                       help="Save a WebP thumbnail of each newly encoded video for channel sprite sheets")
+    parser.add_argument("--no-daemon", action="store_true",
+                       help="Compute embeddings in this process even if embedding_daemon.py is running")
+    # Unset (None) settings come from this host's autotune profile, if any
+    parser.add_argument("--batch-size", type=int, default=None,
+                       help=f"Frames per CLIP forward pass, across videos (default: host profile, "
+                            f"else {DEFAULT_BATCH_SIZE})")
+    parser.add_argument("--decode-workers", type=int, default=None,
+                       help="Decoder processes running alongside CLIP inference "
+                            "(default: host profile, else 0 = decode inline)")
+    parser.add_argument("--threads", type=int, default=None,
+                       help="Torch/ONNX intra-op threads for CLIP (default: host profile, else library default)")
+    parser.add_argument("--autotune-videos", type=int, default=DEFAULT_SAMPLE_SIZE,
+                       help=f"autotune: videos embedded per trial (default: {DEFAULT_SAMPLE_SIZE})")
+    parser.add_argument("--max-rss-mb", type=float, default=None,
+                       help="autotune: memory ceiling for a configuration, in MB (default: half the RAM)")
+    parser.add_argument("--video-timeout", type=float, default=DEFAULT_VIDEO_TIMEOUT,
+                       help=f"Seconds allowed to decode one video before it is quarantined "
+                            f"(default: {DEFAULT_VIDEO_TIMEOUT}, 0 = no limit, decode inline)")
+    parser.add_argument("--retry-quarantined", action="store_true",
+                       help="Clear the quarantine and try previously failed videos again")
+    parser.add_argument("--memory-budget", type=float, default=None, metavar="MB",
+                       help="Throttle embedding to stay under this much memory (with decoder processes) "
+                            "and report peak RSS and top allocations")
+    parser.add_argument("--queue-depth", type=int, default=None,
+                       help=f"Max decoded videos waiting for CLIP (default: {DEFAULT_QUEUE_DEPTH} per worker)")
     
     args = parser.parse_args()
+    if args.shard and args.command != 'analyze':
+        parser.error("--shard only applies to the analyze command")
+    clustering_given = any(value is not None for value in (args.min_cluster_size, args.neighbors, args.noise_policy))
+    if args.min_cluster_size is None:
+        args.min_cluster_size = DEFAULT_MIN_CLUSTER_SIZE
+    if args.neighbors is None:
+        args.neighbors = DEFAULT_NEIGHBORS
+    if args.noise_policy is None:
+        args.noise_policy = DEFAULT_NOISE_POLICY
     
     # Create clusterer
-    clusterer = VideoClusterer(channels_dir=args.channels_dir)
+    clusterer = VideoClusterer(channels_dir=args.channels_dir, decoder=args.decoder, backend=args.backend,
+                               aggregation=args.aggregation, thumbnails=args.thumbnails, shard=args.shard,
+                               sampler=get_sampler(args.sampler, num_frames=args.num_frames,
+                                                   min_frames=args.min_frames, max_frames=args.max_frames,
+                                                   threshold=args.scene_threshold),
+                               namespace=args.namespace, use_daemon=not args.no_daemon)
+    if args.command != 'autotune':
+        apply_host_profile(args, clusterer.cache_dir, clusterer.backend,
+                           defaults={'batch_size': DEFAULT_BATCH_SIZE, 'decode_workers': 0})
+        clusterer.threads = args.threads
+    if args.skip_intro or args.rebuild_intro:
+        # The intro reference is part of the sampling setup, and so of the namespace
+        clusterer.enable_intro_skip(rebuild=args.rebuild_intro)
+    print(f"🗂️  Embedding namespace: {clusterer.namespace}")
+    
+    if args.command == 'merge':
+        print("🧩 Merging embedding shards...")
+        merged = merge_shards(clusterer.store_root, clusterer.cache_dir, keep_shards=args.keep_shards)
+        if merged is not None:
+            print(f"✅ Merged {merged} videos into {clusterer.store_root / 'store'}")
+        return
+    
+    if args.command == 'autotune':
+        clusterer.find_all_videos(rescan=args.rescan)
+        autotune(clusterer, sample_size=args.autotune_videos, max_rss_mb=args.max_rss_mb,
+                 video_timeout=args.video_timeout)
+        return
+    
+    if args.command == 'sweep':
+        if not CLUSTERING_AVAILABLE:
+            print("❌ Clustering libraries not available. Install: pip install umap-learn hdbscan scikit-learn")
+            return
+        if clusterer.load_cached_embeddings() is None:
+            return
+        results = sweep(clusterer, args.sweep_neighbors or [args.neighbors], args.sweep_min_cluster_sizes,
+                        jobs=args.sweep_jobs)
+        with open(args.sweep_output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Sweep results saved to: {args.sweep_output}")
+        return
     
     if args.command in ['analyze', 'full']:
         # Step 1: Find videos and compute embeddings
-        clusterer.find_all_videos()
-        clusterer.compute_all_embeddings(force_recompute=args.force)
+        if not clusterer.video_files or args.rescan:
+            clusterer.find_all_videos(rescan=args.rescan)
+        clusterer.compute_all_embeddings(
+            force_recompute=args.force,
+            batch_size=args.batch_size,
+            decode_workers=args.decode_workers,
+            queue_depth=args.queue_depth,
+            full_hash=args.full_hash,
+            resume=args.resume,
+            checkpoint_every=args.checkpoint_every,
+            checkpoint_interval=args.checkpoint_interval,
+            video_timeout=args.video_timeout,
+            retry_quarantined=args.retry_quarantined,
+            skip_duplicates=args.skip_duplicates,
+            memory_budget_mb=args.memory_budget
+        )
+        
+        if args.shard:
+            print(f"🧩 Shard {args.shard[0]}/{args.shard[1]} saved to {clusterer.work_dir / 'store'}")
+            print("   Cluster after all shards finish: python3 advanced_video_clusterer.py merge")
+            return
         
         # Step 2: Cluster videos
         clusterer.cluster_videos(
             n_neighbors=args.neighbors,
-            min_cluster_size=args.min_cluster_size
+            min_cluster_size=args.min_cluster_size,
+            noise_policy=args.noise_policy
         )
     
     if args.command in ['visualize', 'full']:
         # Create visualization
-        if clusterer.cluster_labels is None:
-            print("⚠️  Loading cached results...")
-            clusterer.compute_all_embeddings()
-            clusterer.cluster_videos()
+        ensure_clusters(clusterer, args, reuse_latest=not clustering_given)
         
         clusterer.visualize_clusters()
     
     if args.command in ['report', 'full']:
         # Export report
-        if clusterer.cluster_labels is None:
-            print("⚠️  Loading cached results...")
-            clusterer.compute_all_embeddings()
-            clusterer.cluster_videos()
+        ensure_clusters(clusterer, args, reuse_latest=not clustering_given)
         
         clusterer.export_cluster_report()
     
     if args.command in ['preview', 'full']:
         # Preview reorganization
-        if clusterer.cluster_labels is None:
-            print("⚠️  Loading cached results...")
-            clusterer.compute_all_embeddings()
-            clusterer.cluster_videos()
+        ensure_clusters(clusterer, args, reuse_latest=not clustering_given)
         
         clusterer.preview_reorganization()
     
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the embedding pipeline.
+Runs each configuration against the same video collection and prints a comparison table.
+
+    python3 benchmark_embedding_pipeline.py decoders --channels-dir channels --limit 100
+    python3 benchmark_embedding_pipeline.py batching --batch-sizes 1 64 256
+    python3 benchmark_embedding_pipeline.py startup
+    python3 benchmark_embedding_pipeline.py backends --backends torch onnx onnx-int8
+    python3 benchmark_embedding_pipeline.py daemon --limit 10
+    python3 benchmark_embedding_pipeline.py clustering --synthetic 20000
+"""
+
+import sys
+import json
+import time
+import statistics
+import subprocess
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from frame_decoders import available_decoders, find_videos, get_decoder, sample_frame_indices
+from memory_budget import peak_rss_mb, run_isolated
+
+
+def _decode_trial(decoder_name, video_paths, num_frames):
+    decoder = get_decoder(decoder_name)
+    baseline_mb = peak_rss_mb()
+    frames_decoded = 0
+    failures = 0
+
+    start = time.perf_counter()
+    for video_path in video_paths:
+        try:
+            total_frames = decoder.probe(video_path)['frame_count']
+            frames = decoder.read_frames(video_path, sample_frame_indices(total_frames, num_frames))
+            frames_decoded += len(frames)
+        except Exception:
+            failures += 1
+    elapsed = time.perf_counter() - start
+
+    return {
+        'decoder': decoder_name,
+        'videos': len(video_paths),
+        'frames': frames_decoded,
+        'failures': failures,
+        'seconds': elapsed,
+        'frames_per_sec': frames_decoded / elapsed if elapsed > 0 else 0.0,
+        'baseline_rss_mb': baseline_mb,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def benchmark_decoders(video_paths, decoder_names, num_frames=5):
+    """Decode the same videos with every backend and compare throughput and memory."""
+    print(f"🎬 Benchmarking {len(decoder_names)} decoders on {len(video_paths)} videos ({num_frames} frames each)")
+
+    results = []
+    for name in decoder_names:
+        print(f"   🔸 {name}...")
+        results.append(run_isolated(_decode_trial, name, video_paths, num_frames))
+
+    print(f"\n{'Decoder':<16}{'Frames':>8}{'Fail':>6}{'Time (s)':>10}{'Frames/s':>10}{'Peak RSS (MB)':>15}")
+    print("-" * 65)
+    for r in results:
+        print(f"{r['decoder']:<16}{r['frames']:>8}{r['failures']:>6}{r['seconds']:>10.2f}"
+              f"{r['frames_per_sec']:>10.1f}{r['peak_rss_mb']:>15.0f}")
+    return results
+
+
+def _per_frame_embeddings(clusterer, video_infos, num_frames):
+    """Reference path: one CLIP forward pass of batch size 1 per frame."""
+    import numpy as np
+
+    embeddings = []
+    valid_videos = []
+    for video_info in video_infos:
+        frames = clusterer.extract_frames(video_info['path'], num_frames)
+        if frames:
+            frame_embeddings = np.concatenate([clusterer.encode_frames([frame]) for frame in frames])
+            embeddings.append(clusterer.aggregate_frame_embeddings(frame_embeddings))
+            valid_videos.append(video_info)
+    return np.array(embeddings), valid_videos
+
+
+def benchmark_batching(channels_dir, limit, batch_sizes, num_frames=5):
+    """Compare cross-video batched CLIP inference against the per-frame path, including parity."""
+    import numpy as np
+    from advanced_video_clusterer import VideoClusterer
+
+    clusterer = VideoClusterer(channels_dir=channels_dir)
+    video_infos = clusterer.find_all_videos()[:limit]
+
+    print(f"\n🎬 Per-frame reference on {len(video_infos)} videos...")
+    start = time.perf_counter()
+    reference, _ = _per_frame_embeddings(clusterer, video_infos, num_frames)
+    results = [{'mode': 'per-frame', 'batch_size': 1, 'seconds': time.perf_counter() - start,
+                'max_abs_diff': 0.0, 'min_cosine': 1.0}]
+
+    for batch_size in batch_sizes:
+        print(f"🎬 Batched (batch size {batch_size})...")
+        start = time.perf_counter()
+        embeddings, _ = clusterer.compute_embeddings_batched(video_infos, num_frames, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+        results.append({
+            'mode': 'batched',
+            'batch_size': batch_size,
+            'seconds': elapsed,
+            'max_abs_diff': float(np.max(np.abs(embeddings - reference))),
+            'min_cosine': float(np.min(np.sum(embeddings * reference, axis=1))),
+        })
+
+    print(f"\n{'Mode':<12}{'Batch':>7}{'Time (s)':>10}{'Videos/s':>10}{'Max |diff|':>12}{'Min cos':>10}")
+    print("-" * 61)
+    for r in results:
+        r['videos_per_sec'] = len(video_infos) / r['seconds'] if r['seconds'] > 0 else 0.0
+        print(f"{r['mode']:<12}{r['batch_size']:>7}{r['seconds']:>10.2f}{r['videos_per_sec']:>10.2f}"
+              f"{r['max_abs_diff']:>12.2e}{r['min_cosine']:>10.6f}")
+    return results
+
+
+def benchmark_backends(channels_dir, cache_dir, limit, backends, batch_size=64, num_frames=5):
+    """
+    Compare CLIP encoder backends on the same videos: throughput, plus per-video
+    cosine similarity against the torch embeddings (parity check).
+    """
+    import numpy as np
+    from advanced_video_clusterer import VideoClusterer
+
+    video_infos = VideoClusterer(channels_dir=channels_dir, cache_dir=cache_dir).find_all_videos()[:limit]
+    reference = None
+    results = []
+
+    for backend in ['torch'] + [b for b in backends if b != 'torch']:
+        clusterer = VideoClusterer(channels_dir=channels_dir, cache_dir=cache_dir, backend=backend)
+        clusterer.encoder  # load (and export/quantize) outside the timed section
+
+        print(f"🎬 {backend}...")
+        start = time.perf_counter()
+        embeddings, valid_videos = clusterer.compute_embeddings_batched(video_infos, num_frames, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+
+        if reference is None:
+            reference = {str(v['path']): e for v, e in zip(valid_videos, embeddings)}
+        cosines = np.array([np.dot(e, reference[str(v['path'])])
+                            for v, e in zip(valid_videos, embeddings) if str(v['path']) in reference])
+        results.append({
+            'backend': backend,
+            'videos': len(valid_videos),
+            'seconds': elapsed,
+            'videos_per_sec': len(valid_videos) / elapsed if elapsed > 0 else 0.0,
+            'mean_cosine': float(cosines.mean()) if len(cosines) else None,
+            'min_cosine': float(cosines.min()) if len(cosines) else None,
+        })
+
+    print(f"\n{'Backend':<12}{'Videos':>8}{'Time (s)':>10}{'Videos/s':>10}{'Mean cos':>10}{'Min cos':>10}")
+    print("-" * 60)
+    for r in results:
+        print(f"{r['backend']:<12}{r['videos']:>8}{r['seconds']:>10.2f}{r['videos_per_sec']:>10.2f}"
+              f"{r['mean_cosine']:>10.4f}{r['min_cosine']:>10.4f}")
+    return results
+
+
+STARTUP_SCENARIOS = {
+    'import': "import advanced_video_clusterer",
+    'cache-only': (
+        "from advanced_video_clusterer import VideoClusterer\n"
+        "VideoClusterer(cache_dir={cache_dir!r}).load_cached_embeddings()"
+    ),
+    'model-load': (
+        "from advanced_video_clusterer import VideoClusterer\n"
+        "VideoClusterer(cache_dir={cache_dir!r}).encoder"
+    ),
+}
+
+
+def benchmark_startup(cache_dir, repeats=3):
+    """Wall time from interpreter start for cache-only commands vs. loading CLIP."""
+    script_dir = str(Path(__file__).parent)
+    results = []
+
+    for scenario, body in STARTUP_SCENARIOS.items():
+        code = f"import sys\nsys.path.insert(0, {script_dir!r})\n" + body.format(cache_dir=cache_dir)
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            timings.append(time.perf_counter() - start)
+        results.append({'scenario': scenario, 'median_seconds': statistics.median(timings),
+                        'min_seconds': min(timings)})
+
+    print(f"\n{'Scenario':<14}{'Median (s)':>12}{'Min (s)':>10}")
+    print("-" * 36)
+    for r in results:
+        print(f"{r['scenario']:<14}{r['median_seconds']:>12.2f}{r['min_seconds']:>10.2f}")
+    return results
+
+
+DAEMON_SCENARIO = (
+    "from advanced_video_clusterer import VideoClusterer\n"
+    "clusterer = VideoClusterer(channels_dir={channels_dir!r}, cache_dir={cache_dir!r}, use_daemon={use_daemon})\n"
+    "clusterer.compute_frame_embeddings_batched(clusterer.find_all_videos()[:{limit}])"
+)
+
+
+def _wait_for_daemon(process, cache_dir, timeout=600):
+    from embedding_daemon import connect
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and process.poll() is None:
+        connection = connect(cache_dir)
+        if connection is not None:
+            connection.close()
+            return True
+        time.sleep(0.5)
+    return False
+
+
+def benchmark_daemon(channels_dir, cache_dir, limit, repeats=3):
+    """
+    Incremental latency: wall time from interpreter start to embeddings for
+    `limit` videos, loading CLIP in-process vs. sending them to a warm daemon.
+    """
+    from embedding_daemon import connect, request
+
+    script_dir = str(Path(__file__).parent)
+    process = None
+    connection = connect(cache_dir)
+    if connection is None:
+        print("🔧 Starting an embedding daemon...")
+        process = subprocess.Popen([sys.executable, str(Path(script_dir) / 'embedding_daemon.py'), 'serve',
+                                    '--cache-dir', cache_dir],
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if not _wait_for_daemon(process, cache_dir):
+            process.kill()
+            print("❌ The embedding daemon did not come up")
+            return []
+    else:
+        connection.close()
+
+    results = []
+    try:
+        for scenario, use_daemon in [('in-process', False), ('daemon', True)]:
+            print(f"🎬 {scenario} ({limit} videos)...")
+            code = f"import sys\nsys.path.insert(0, {script_dir!r})\n" + DAEMON_SCENARIO.format(
+                channels_dir=channels_dir, cache_dir=cache_dir, use_daemon=use_daemon, limit=limit)
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                subprocess.run([sys.executable, '-c', code], check=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                timings.append(time.perf_counter() - start)
+            results.append({'scenario': scenario, 'videos': limit, 'median_seconds': statistics.median(timings),
+                            'min_seconds': min(timings)})
+    finally:
+        if process is not None:
+            with connect(cache_dir) as connection:
+                request(connection, {'op': 'stop'})
+            process.wait()
+
+    print(f"\n{'Scenario':<14}{'Videos':>8}{'Median (s)':>12}{'Min (s)':>10}")
+    print("-" * 44)
+    for r in results:
+        print(f"{r['scenario']:<14}{r['videos']:>8}{r['median_seconds']:>12.2f}{r['min_seconds']:>10.2f}")
+    if len(results) == 2 and results[1]['median_seconds'] > 0:
+        print(f"\n⚡ Warm daemon: {results[0]['median_seconds'] / results[1]['median_seconds']:.1f}x faster")
+    return results
+
+
+def _umap_fit(embeddings, n_neighbors, n_components, knn=None):
+    import umap
+    from advanced_video_clusterer import UMAP_SETTINGS
+
+    start = time.perf_counter()
+    umap.UMAP(n_neighbors=n_neighbors, n_components=n_components, precomputed_knn=knn or (None, None, None),
+              verbose=False, **UMAP_SETTINGS).fit_transform(embeddings)
+    return time.perf_counter() - start
+
+
+def _clustering_trial(scenario, embeddings, n_neighbors, knn_file):
+    """Both UMAP fits in a fresh process, after compiling numba kernels on a small sample."""
+    import pickle
+    import warnings
+    from advanced_video_clusterer import build_knn_graph
+
+    warnings.filterwarnings('ignore')
+    warmup = embeddings[:300]
+    _umap_fit(warmup, n_neighbors, 2)
+    _umap_fit(warmup, n_neighbors, 2, build_knn_graph(warmup, n_neighbors))
+
+    knn = None
+    knn_seconds = None
+    start = time.perf_counter()
+    if scenario == 'shared kNN':
+        knn = build_knn_graph(embeddings, n_neighbors)
+        knn_seconds = time.perf_counter() - start
+        # Left for the cached run (pickling prepares the search graph, not part of this run)
+        with open(knn_file, 'wb') as f:
+            pickle.dump(knn, f)
+    elif scenario == 'cached kNN':
+        with open(knn_file, 'rb') as f:
+            knn = pickle.load(f)
+        knn_seconds = time.perf_counter() - start
+    return {
+        'scenario': scenario,
+        'knn_seconds': knn_seconds,
+        'umap_5d_seconds': _umap_fit(embeddings, n_neighbors, 5, knn),
+        'umap_2d_seconds': _umap_fit(embeddings, n_neighbors, 2, knn),
+    }
+
+
+def benchmark_clustering(cache_dir, synthetic=0, n_neighbors=15):
+    """
+    Time split of the 5-D and 2-D UMAP fits: each building its own kNN graph
+    (before), sharing one graph built once (after), and with the graph loaded
+    from the cluster cache (parameter changes that keep n_neighbors).
+    """
+    import tempfile
+    import numpy as np
+    from advanced_video_clusterer import VideoClusterer
+
+    if synthetic:
+        # Unit-norm clusters shaped like CLIP embeddings
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(max(2, synthetic // 500), 512))
+        embeddings = centers[rng.integers(len(centers), size=synthetic)] + rng.normal(scale=0.5, size=(synthetic, 512))
+        embeddings = (embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)).astype(np.float32)
+    else:
+        clusterer = VideoClusterer(cache_dir=cache_dir)
+        if clusterer.load_cached_embeddings() is None:
+            print(f"❌ No cached embeddings in {cache_dir} (use --synthetic N)")
+            return []
+        embeddings = np.asarray(clusterer.embeddings, dtype=np.float32)
+
+    print(f"🔮 {len(embeddings)} embeddings, {n_neighbors} neighbours")
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        knn_file = str(Path(tmp_dir) / 'knn.pkl')
+        for scenario in ('before', 'shared kNN', 'cached kNN'):
+            print(f"🎬 {scenario}...")
+            results.append(run_isolated(_clustering_trial, scenario, embeddings, n_neighbors, knn_file))
+
+    print(f"\n{'Scenario':<14}{'kNN (s)':>9}{'UMAP 5-D (s)':>14}{'UMAP 2-D (s)':>14}{'Total (s)':>11}")
+    print("-" * 62)
+    for r in results:
+        r['total_seconds'] = (r['knn_seconds'] or 0) + r['umap_5d_seconds'] + r['umap_2d_seconds']
+        knn_column = f"{r['knn_seconds']:>9.2f}" if r['knn_seconds'] is not None else f"{'in fits':>9}"
+        print(f"{r['scenario']:<14}{knn_column}{r['umap_5d_seconds']:>14.2f}{r['umap_2d_seconds']:>14.2f}"
+              f"{r['total_seconds']:>11.2f}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the video embedding pipeline")
+    parser.add_argument("command", choices=['decoders', 'batching', 'startup', 'backends', 'daemon', 'clustering'], help="Benchmark to run")
+    parser.add_argument("--channels-dir", default="channels", help="Directory containing video channels")
+    parser.add_argument("--cache-dir", default="video_embeddings_cache", help="Embedding cache directory")
+    parser.add_argument("--limit", type=int, default=50, help="Number of videos to benchmark (default: 50)")
+    parser.add_argument("--num-frames", type=int, default=5, help="Frames sampled per video (default: 5)")
+    parser.add_argument("--decoders", nargs='+', default=None,
+                       help="Decoders to compare (default: all available)")
+    parser.add_argument("--batch-sizes", type=int, nargs='+', default=[16, 64, 256],
+                       help="Batch sizes to compare for the batching benchmark")
+    parser.add_argument("--backends", nargs='+', default=['torch', 'onnx', 'onnx-int8'],
+                       help="Encoder backends to compare (torch is always the parity reference)")
+    parser.add_argument("--synthetic", type=int, default=0,
+                       help="Clustering benchmark on N synthetic embeddings instead of the cached ones")
+    parser.add_argument("--neighbors", type=int, default=15, help="UMAP n_neighbors for the clustering benchmark")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+
+    args = parser.parse_args()
+
+    if args.command == 'startup':
+        results = benchmark_startup(args.cache_dir)
+    elif args.command == 'clustering':
+        results = benchmark_clustering(args.cache_dir, args.synthetic, args.neighbors)
+    else:
+        video_paths = find_videos(args.channels_dir, args.cache_dir)[:args.limit]
+        if not video_paths:
+            print(f"❌ No videos found in {args.channels_dir}")
+            return
+
+        if args.command == 'decoders':
+            results = benchmark_decoders(video_paths, args.decoders or available_decoders(), args.num_frames)
+        elif args.command == 'batching':
+            results = benchmark_batching(args.channels_dir, args.limit, args.batch_sizes, args.num_frames)
+        elif args.command == 'daemon':
+            results = benchmark_daemon(args.channels_dir, args.cache_dir, args.limit)
+        elif args.command == 'backends':
+            results = benchmark_backends(args.channels_dir, args.cache_dir, args.limit, args.backends,
+                                         num_frames=args.num_frames)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
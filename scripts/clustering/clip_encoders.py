@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+CLIP image encoder backends.
+
+    torch       PyTorch CLIP (fp32 on CPU, fp16 on CUDA)
+    onnx        CLIP visual tower exported to ONNX, run with ONNX Runtime
+    onnx-int8   same, with int8 dynamic quantization of the weights
+
+All backends share one preprocessing step (ClipPreprocess) and take
+(N, 3, 224, 224) float32 batches, so they can be swapped per deployment.
+The ONNX models are exported once per cache directory and reused; exporting
+needs torch + clip, running them only needs onnxruntime.
+"""
+
+import uuid
+import inspect
+import importlib.util
+from pathlib import Path
+
+import numpy as np
+
+ENCODER_BACKENDS = ['torch', 'onnx', 'onnx-int8']
+DEFAULT_BACKEND = 'torch'
+
+ONNX_AVAILABLE = importlib.util.find_spec('onnxruntime') is not None
+
+# Normalization constants used by CLIP's own preprocessing
+CLIP_MEAN = np.array([0.48145466, 0.4578275, 0.40821073], dtype=np.float32).reshape(3, 1, 1)
+CLIP_STD = np.array([0.26862954, 0.26130258, 0.27577711], dtype=np.float32).reshape(3, 1, 1)
+
+
+class ClipPreprocess:
+    """
+    CLIP preprocessing without torch: bicubic resize of the short side, center
+    crop, scale to [0, 1] and normalize. Matches clip.load()'s transform on PIL
+    images and is picklable, so decoder processes can run it.
+    """
+
+    def __init__(self, n_px=224):
+        self.n_px = n_px
+
+    def __call__(self, image):
+        from PIL import Image
+
+        image = image.convert('RGB')
+        width, height = image.size
+        # torchvision computes the long side as int(size * long / short)
+        if width <= height:
+            size = (self.n_px, int(self.n_px * height / width))
+        else:
+            size = (int(self.n_px * width / height), self.n_px)
+        if size != image.size:
+            image = image.resize(size, Image.BICUBIC)
+
+        width, height = image.size
+        left = int(round((width - self.n_px) / 2.0))
+        top = int(round((height - self.n_px) / 2.0))
+        image = image.crop((left, top, left + self.n_px, top + self.n_px))
+
+        pixels = np.asarray(image, dtype=np.float32).transpose(2, 0, 1) / 255.0
+        return (pixels - CLIP_MEAN) / CLIP_STD
+
+
+def model_slug(model_name):
+    return model_name.replace('/', '-').replace('@', '-')
+
+
+class TorchClipEncoder:
+    """PyTorch CLIP image encoder."""
+
+    name = 'torch'
+
+    def __init__(self, model_name, threads=None):
+        import torch
+        import clip
+
+        if threads:
+            torch.set_num_threads(threads)
+        print("🔧 Loading CLIP model...")
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.model, self.preprocess = clip.load(model_name, device=self.device)
+        print(f"✅ CLIP model loaded on {self.device}")
+
+    def encode(self, images):
+        import torch
+
+        with torch.no_grad():
+            embeddings = self.model.encode_image(torch.from_numpy(np.ascontiguousarray(images)).to(self.device))
+        return embeddings.float().cpu().numpy()
+
+
+class OnnxClipEncoder:
+    """CLIP visual tower in ONNX Runtime, optionally int8-quantized."""
+
+    def __init__(self, model_name, cache_dir, quantize=False, threads=None):
+        import onnxruntime as ort
+
+        self.name = 'onnx-int8' if quantize else 'onnx'
+        self.model_path = export_onnx(model_name, cache_dir, quantize=quantize)
+        self.preprocess = ClipPreprocess()
+        self.device = 'cpu'
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        print(f"🔧 Loading ONNX CLIP encoder ({self.model_path.name})...")
+        self.session = ort.InferenceSession(str(self.model_path), options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        print(f"✅ ONNX CLIP encoder loaded")
+
+    def encode(self, images):
+        images = np.ascontiguousarray(images, dtype=np.float32)
+        return self.session.run(None, {self.input_name: images})[0]
+
+
+def _tmp_path(path):
+    # Unique per writer: shard processes (possibly on other hosts) may export at the same time
+    return path.with_name(f"{path.name}.{uuid.uuid4().hex[:12]}.tmp")
+
+
+def export_onnx(model_name, cache_dir, quantize=False):
+    """Export (and optionally quantize) the CLIP visual tower once; returns the .onnx path."""
+    onnx_dir = Path(cache_dir) / "onnx"
+    onnx_dir.mkdir(parents=True, exist_ok=True)
+    fp32_path = onnx_dir / f"{model_slug(model_name)}-visual.onnx"
+    int8_path = onnx_dir / f"{model_slug(model_name)}-visual-int8.onnx"
+
+    if not fp32_path.exists():
+        import torch
+        import clip
+
+        print(f"📦 Exporting {model_name} visual encoder to ONNX...")
+        model, _ = clip.load(model_name, device='cpu', jit=False)
+        visual = model.visual.float().eval()
+        n_px = visual.input_resolution
+        tmp_path = _tmp_path(fp32_path)
+        export_kwargs = {}
+        if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+            # Newer torch defaults to the dynamo exporter (extra onnxscript dependency)
+            export_kwargs['dynamo'] = False
+        torch.onnx.export(
+            visual, torch.randn(1, 3, n_px, n_px), str(tmp_path),
+            input_names=['images'], output_names=['embeddings'],
+            dynamic_axes={'images': {0: 'batch'}, 'embeddings': {0: 'batch'}},
+            opset_version=17,
+            **export_kwargs,
+        )
+        tmp_path.replace(fp32_path)
+        print(f"✅ Exported {fp32_path}")
+
+    if not quantize:
+        return fp32_path
+
+    if not int8_path.exists():
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        print("📦 Quantizing ONNX encoder to int8...")
+        tmp_path = _tmp_path(int8_path)
+        quantize_dynamic(str(fp32_path), str(tmp_path), weight_type=QuantType.QInt8)
+        tmp_path.replace(int8_path)
+        print(f"✅ Quantized {int8_path}")
+    return int8_path
+
+
+def resolve_backend(backend):
+    """
+    The backend that will actually encode: `backend`, or DEFAULT_BACKEND when
+    onnxruntime is missing. Namespaces and store metadata must use this one.
+    """
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}'. Choose from: {', '.join(ENCODER_BACKENDS)}")
+    if backend != 'torch' and not ONNX_AVAILABLE:
+        print(f"⚠️  Backend '{backend}' needs onnxruntime (pip install onnx onnxruntime), "
+              f"falling back to '{DEFAULT_BACKEND}'")
+        return DEFAULT_BACKEND
+    return backend
+
+
+def get_encoder(backend, model_name, cache_dir, threads=None):
+    """Instantiate an encoder backend by name (see resolve_backend; the encoder's .name is the one used)."""
+    backend = resolve_backend(backend)
+    if backend == 'torch':
+        return TorchClipEncoder(model_name, threads=threads)
+    return OnnxClipEncoder(model_name, cache_dir, quantize=(backend == 'onnx-int8'), threads=threads)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+On-disk cache of clustering results.
+
+UMAP + HDBSCAN take minutes on the full collection, and visualize, report,
+preview and reorganize_by_clusters.py used to refit them whenever labels
+weren't in memory. Results are cached next to the embedding store:
+
+    video_embeddings_cache/namespaces/<namespace>/cluster_cache/
+        <key>.npz    labels, 5-D reduction, 2-D projection
+        <key>.json   embeddings hash, clustering parameters, date
+        knn-<key>.pkl   cosine kNN graph (indices, distances, NNDescent index)
+
+The key is derived from a hash of the embedding matrix and every clustering
+parameter (including the fixed UMAP settings and the umap/hdbscan versions),
+so any change to the embeddings or the parameters misses the cache and an
+identical request is served from disk. The newest MAX_ENTRIES are kept.
+
+The kNN graph both UMAP fits start from only depends on the embeddings and
+n_neighbors, so it is cached separately (newest MAX_KNN_ENTRIES): changing
+min_cluster_size refits UMAP and HDBSCAN but skips the neighbour search.
+"""
+
+import os
+import json
+import pickle
+import hashlib
+from datetime import datetime
+from importlib import metadata as package_metadata
+from pathlib import Path
+
+import numpy as np
+
+CLUSTER_CACHE_DIR = "cluster_cache"
+
+# Bump when the cached arrays or the clustering code change meaning
+CLUSTER_CACHE_VERSION = 1
+
+MAX_ENTRIES = 16
+
+# kNN graphs keep an NNDescent index (a copy of the embeddings), so fewer of them
+MAX_KNN_ENTRIES = 4
+
+
+def embeddings_hash(embeddings):
+    """Content hash of an embedding matrix (shape, dtype and values)."""
+    embeddings = np.ascontiguousarray(embeddings)
+    digest = hashlib.sha256(f"{embeddings.shape}{embeddings.dtype}".encode())
+    digest.update(memoryview(embeddings).cast('B'))
+    return digest.hexdigest()
+
+
+def _library_versions():
+    versions = {}
+    for package in ('umap-learn', 'hdbscan', 'scikit-learn'):
+        try:
+            versions[package] = package_metadata.version(package)
+        except package_metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+class ClusterCache:
+    """Clustering results of one namespace, keyed by embeddings and parameters."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def key(self, embeddings_digest, params):
+        text = json.dumps({'version': CLUSTER_CACHE_VERSION, 'embeddings': embeddings_digest, 'params': params,
+                           'libraries': _library_versions()}, sort_keys=True)
+        return hashlib.sha256(text.encode()).hexdigest()[:20]
+
+    def load(self, key):
+        """{'labels', 'reduced', 'embeddings_2d', 'params'} for a key, or None."""
+        entry_file = self.directory / f"{key}.npz"
+        info_file = self.directory / f"{key}.json"
+        if not entry_file.exists() or not info_file.exists():
+            return None
+        with open(info_file, 'r') as f:
+            info = json.load(f)
+        with np.load(entry_file) as data:
+            entry = {name: data[name] for name in ('labels', 'reduced', 'embeddings_2d')}
+        # Mark it as recently used, so pruning keeps it
+        os.utime(info_file)
+        return {**entry, 'params': info['params'], 'created': info['created']}
+
+    def latest(self, embeddings_digest):
+        """Most recently used entry for these embeddings, whatever its parameters, or None."""
+        if not self.directory.exists():
+            return None
+        candidates = []
+        for info_file in self.directory.glob("*.json"):
+            with open(info_file, 'r') as f:
+                info = json.load(f)
+            if info.get('embeddings') == embeddings_digest:
+                candidates.append((info_file.stat().st_mtime, info_file.stem))
+        return self.load(max(candidates)[1]) if candidates else None
+
+    def save(self, key, embeddings_digest, params, labels, reduced, embeddings_2d):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.directory / f"{key}.tmp.npz"
+        np.savez(tmp_file, labels=np.asarray(labels), reduced=np.asarray(reduced, dtype=np.float32),
+                 embeddings_2d=np.asarray(embeddings_2d, dtype=np.float32))
+        os.replace(tmp_file, self.directory / f"{key}.npz")
+        # The .json is written last: an entry without it is never read
+        tmp_file = self.directory / f"{key}.json.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump({'embeddings': embeddings_digest, 'params': params,
+                       'created': datetime.now().isoformat(timespec='seconds')}, f, indent=2)
+        os.replace(tmp_file, self.directory / f"{key}.json")
+        self.prune()
+
+    def load_knn(self, key):
+        """(knn_indices, knn_distances, search_index) for a key, or None."""
+        knn_file = self.directory / f"knn-{key}.pkl"
+        if not knn_file.exists():
+            return None
+        with open(knn_file, 'rb') as f:
+            graph = pickle.load(f)
+        os.utime(knn_file)
+        return graph
+
+    def save_knn(self, key, graph):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.directory / f"knn-{key}.pkl.tmp"
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(graph, f)
+        os.replace(tmp_file, self.directory / f"knn-{key}.pkl")
+        knn_files = sorted(self.directory.glob("knn-*.pkl"), key=lambda path: path.stat().st_mtime, reverse=True)
+        for knn_file in knn_files[MAX_KNN_ENTRIES:]:
+            knn_file.unlink(missing_ok=True)
+
+    def prune(self, keep=MAX_ENTRIES):
+        info_files = sorted(self.directory.glob("*.json"), key=lambda path: path.stat().st_mtime, reverse=True)
+        for info_file in info_files[keep:]:
+            info_file.unlink(missing_ok=True)
+            (self.directory / f"{info_file.stem}.npz").unlink(missing_ok=True)
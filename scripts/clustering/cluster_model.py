@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Fitted clustering models, kept so new videos can join channels without a refit.
+
+Every full cluster_videos run saves, next to the namespace's embedding store:
+
+    video_embeddings_cache/namespaces/<namespace>/cluster_model/
+        model.json        clustering parameters, fit date and counts
+        models.pkl        5-D UMAP reducer, 2-D UMAP reducer, HDBSCAN (with prediction data)
+        assignments.npz   key (fingerprint), final label, 5-D and 2-D coordinates per video
+
+VideoClusterer.assign_clusters (add_videos_and_recluster.py --assign-only)
+transforms only the videos the model hasn't seen and labels them with
+hdbscan.approximate_predict; videos already in the model keep their label, so
+existing channels are left as they are. The new videos are appended to
+assignments.npz. A full refit is asked for instead when:
+
+- the clustering parameters or aggregation differ from the fitted ones,
+- videos assigned since the fit would exceed DRIFT_LIMIT of the fitted
+  collection (the reduction no longer describes the collection), or
+- more than NOVELTY_LIMIT of the new videos are novel: HDBSCAN calls them
+  noise and they land farther from every fitted video than the model's
+  reach (likely a theme the model has never seen).
+
+The reach is measured at fit time: the 95th percentile of the distance from
+each fitted video to its nearest neighbour in the 5-D space, plus the 95th
+percentile of how far a fitted video moves when transformed again (UMAP's
+transform only approximates the fit).
+"""
+
+import os
+import json
+import pickle
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+CLUSTER_MODEL_DIR = "cluster_model"
+
+# Videos assigned since the last fit, as a fraction of the fitted collection
+DRIFT_LIMIT = 0.25
+
+# Share of novel videos among the new ones that calls for a refit
+NOVELTY_LIMIT = 0.25
+
+# Fitted videos transformed again to measure the reach
+REACH_SAMPLE = 200
+
+
+def fit_reach(reducer, embeddings, reduced, sample=REACH_SAMPLE, seed=0):
+    """How far from the fitted videos a new one may land and still count as seen."""
+    from sklearn.metrics.pairwise import euclidean_distances
+
+    if len(reduced) < 2:
+        return 0.0
+    rows = np.random.default_rng(seed).permutation(len(reduced))[:sample]
+    distances = euclidean_distances(reduced[rows], reduced)
+    distances[np.arange(len(rows)), rows] = np.inf
+    jitter = np.linalg.norm(reducer.transform(np.asarray(embeddings[rows])) - reduced[rows], axis=1)
+    return float(np.percentile(distances.min(axis=1), 95) + np.percentile(jitter, 95))
+
+
+def video_key(video_info):
+    """Key a video is remembered by: its content fingerprint (path for legacy rows)."""
+    return video_info.get('fingerprint') or str(video_info['path'])
+
+
+class ClusterModel:
+    """The saved clustering of one embedding namespace."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.metadata_file = self.directory / "model.json"
+        self.models_file = self.directory / "models.pkl"
+        self.assignments_file = self.directory / "assignments.npz"
+
+    def exists(self):
+        return self.metadata_file.exists()
+
+    def read_metadata(self):
+        with open(self.metadata_file, 'r') as f:
+            return json.load(f)
+
+    def load_models(self):
+        """(reducer_5d, reducer_2d, hdbscan_model)"""
+        with open(self.models_file, 'rb') as f:
+            models = pickle.load(f)
+        return models['reducer'], models['reducer_2d'], models['hdbscan']
+
+    def load_assignments(self):
+        """(keys, labels, reduced, embeddings_2d) of every video the model covers."""
+        with np.load(self.assignments_file) as data:
+            return list(data['keys']), data['labels'], data['reduced'], data['embeddings_2d']
+
+    def save(self, reducer, reducer_2d, hdbscan_model, params, video_files, labels, reduced, embeddings_2d,
+             reach):
+        """Save a fresh fit (replacing any previous one)."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.models_file.with_suffix('.pkl.tmp')
+        with open(tmp_file, 'wb') as f:
+            pickle.dump({'reducer': reducer, 'reducer_2d': reducer_2d, 'hdbscan': hdbscan_model}, f)
+        os.replace(tmp_file, self.models_file)
+        self._save_assignments([video_key(v) for v in video_files], labels, reduced, embeddings_2d)
+        self._save_metadata({
+            'created': datetime.now().isoformat(),
+            'params': params,
+            'fitted_count': len(video_files),
+            'reach': float(reach),
+            'assigned_since_fit': 0,
+        })
+
+    def append(self, video_files, labels, reduced, embeddings_2d):
+        """Remember videos assigned to the existing fit."""
+        keys, old_labels, old_reduced, old_2d = self.load_assignments()
+        self._save_assignments(keys + [video_key(v) for v in video_files],
+                               np.concatenate([old_labels, labels]),
+                               np.vstack([old_reduced, reduced]),
+                               np.vstack([old_2d, embeddings_2d]))
+        metadata = self.read_metadata()
+        metadata['assigned_since_fit'] += len(video_files)
+        self._save_metadata(metadata)
+
+    def refit_reason(self, params, new_count, drift_limit=DRIFT_LIMIT):
+        """Why adding `new_count` videos needs a full refit, or None if assignment is fine."""
+        if not self.exists():
+            return "no saved clustering model"
+        metadata = self.read_metadata()
+        if metadata['params'] != params:
+            changed = sorted(key for key in params if metadata['params'].get(key) != params[key])
+            return f"clustering parameters changed ({', '.join(changed)})"
+        assigned = metadata['assigned_since_fit'] + new_count
+        if assigned > drift_limit * metadata['fitted_count']:
+            return (f"{assigned} videos added since the fit of {metadata['fitted_count']} "
+                    f"(limit {drift_limit:.0%})")
+        return None
+
+    def novel(self, reduced, predicted, saved_reduced):
+        """Mask of new videos (5-D coordinates, approximate_predict labels) the model can't place."""
+        from sklearn.metrics.pairwise import euclidean_distances
+
+        if not len(saved_reduced):
+            return predicted == -1
+        nearest = euclidean_distances(reduced, saved_reduced).min(axis=1)
+        return (predicted == -1) & (nearest > self.read_metadata()['reach'])
+
+    def _save_assignments(self, keys, labels, reduced, embeddings_2d):
+        tmp_file = self.directory / "assignments.tmp.npz"
+        np.savez(tmp_file, keys=np.array(keys, dtype=str), labels=np.asarray(labels),
+                 reduced=np.asarray(reduced, dtype=np.float32),
+                 embeddings_2d=np.asarray(embeddings_2d, dtype=np.float32))
+        os.replace(tmp_file, self.assignments_file)
+
+    def _save_metadata(self, metadata):
+        tmp_file = self.metadata_file.with_suffix('.json.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(metadata, f, indent=2)
+        os.replace(tmp_file, self.metadata_file)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Clustering parameter sweep (`advanced_video_clusterer.py sweep`).
+
+Instead of one full run per setting, the sweep fits the 5-D UMAP reduction
+once per n_neighbors value (starting from the cached kNN graph) and runs the
+HDBSCAN fits of every min_cluster_size on it in parallel processes, with
+min_samples=1 like cluster_videos. Per configuration it records:
+
+    clusters         number of clusters HDBSCAN found
+    noise            fraction of videos left as noise (before --noise-policy)
+    sizes            smallest, median and largest cluster
+    DBCV             HDBSCAN's relative validity, a fast approximation of
+                     density-based cluster validity (higher is better, max 1)
+    silhouette       on the clustered videos in the 5-D space (at most
+                     SILHOUETTE_SAMPLE of them), higher is better
+    seconds          HDBSCAN fit plus metrics
+
+The reduction time per n_neighbors is reported separately, as it is shared.
+Results are printed as one table and saved as JSON.
+"""
+
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+DEFAULT_SWEEP_MIN_CLUSTER_SIZES = [3, 5, 7, 10, 15]
+
+# Videos the silhouette is computed on (it is quadratic in their number)
+SILHOUETTE_SAMPLE = 5000
+
+
+def _fit_configuration(reduced, n_neighbors, min_cluster_size, min_samples, hdbscan_settings):
+    """One HDBSCAN fit and its quality metrics (runs in a worker process)."""
+    import warnings
+    import hdbscan
+    from sklearn.metrics import silhouette_score
+
+    warnings.filterwarnings('ignore')
+    start = time.perf_counter()
+    model = hdbscan.HDBSCAN(min_cluster_size=min_cluster_size, min_samples=min_samples, gen_min_span_tree=True,
+                            **hdbscan_settings)
+    labels = model.fit_predict(reduced)
+    clustered = labels != -1
+    sizes = np.bincount(labels[clustered]) if np.any(clustered) else np.array([], dtype=int)
+
+    dbcv = None
+    silhouette = None
+    if len(sizes) > 1:
+        try:
+            dbcv = float(model.relative_validity_)
+        except (ValueError, ZeroDivisionError):
+            pass
+        if np.sum(clustered) > len(sizes):
+            silhouette = float(silhouette_score(reduced[clustered], labels[clustered],
+                                                sample_size=min(int(np.sum(clustered)), SILHOUETTE_SAMPLE),
+                                                random_state=0))
+    return {
+        'n_neighbors': n_neighbors,
+        'min_cluster_size': min_cluster_size,
+        'min_samples': min_samples,
+        'clusters': len(sizes),
+        'noise_fraction': float(np.mean(~clustered)),
+        'size_min': int(sizes.min()) if len(sizes) else 0,
+        'size_median': float(np.median(sizes)) if len(sizes) else 0.0,
+        'size_max': int(sizes.max()) if len(sizes) else 0,
+        'dbcv': dbcv,
+        'silhouette': silhouette,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def _format_metric(value):
+    return f"{value:>8.3f}" if value is not None else f"{'-':>8}"
+
+
+def sweep(clusterer, neighbors_grid, min_cluster_sizes, jobs=None, min_samples=1):
+    """
+    Fit every combination of the grids on the clusterer's embeddings.
+
+    Returns:
+        A list with one result dict per configuration (n_neighbors major)
+    """
+    import umap
+    from advanced_video_clusterer import HDBSCAN_SETTINGS, UMAP_SETTINGS
+
+    jobs = jobs or os.cpu_count() or 1
+    print(f"\n🧪 Sweeping {len(neighbors_grid) * len(min_cluster_sizes)} configurations on "
+          f"{len(clusterer.embeddings)} videos ({len(neighbors_grid)} UMAP reductions, {jobs} HDBSCAN workers)")
+
+    results = []
+    reduction_seconds = {}
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = []
+        for n_neighbors in neighbors_grid:
+            start = time.perf_counter()
+            knn = clusterer.knn_graph(n_neighbors)
+            print(f"   🔸 UMAP: Reducing {clusterer.embeddings.shape[1]} → 5 dimensions (n_neighbors={n_neighbors})...")
+            reduced = umap.UMAP(n_neighbors=n_neighbors, n_components=5, precomputed_knn=knn, verbose=False,
+                                **UMAP_SETTINGS).fit_transform(clusterer.embeddings)
+            reduction_seconds[n_neighbors] = time.perf_counter() - start
+            # HDBSCAN fits on this reduction run while the next one is computed
+            futures += [pool.submit(_fit_configuration, reduced, n_neighbors, size, min_samples, HDBSCAN_SETTINGS)
+                        for size in min_cluster_sizes]
+        results = [future.result() for future in futures]
+
+    print(f"\n{'Neighbors':>9}{'Min size':>9}{'Clusters':>9}{'Noise':>7}{'Sizes (min/med/max)':>21}"
+          f"{'DBCV':>8}{'Silhouette':>11}{'Time (s)':>9}")
+    print("-" * 83)
+    for r in results:
+        sizes = f"{r['size_min']}/{r['size_median']:.0f}/{r['size_max']}"
+        print(f"{r['n_neighbors']:>9}{r['min_cluster_size']:>9}{r['clusters']:>9}"
+              f"{r['noise_fraction']:>7.0%}{sizes:>21}{_format_metric(r['dbcv'])}"
+              f"{_format_metric(r['silhouette']):>11}{r['seconds']:>9.2f}")
+    print("\n⏱️  UMAP per n_neighbors (shared by its rows): "
+          + ", ".join(f"{n} → {seconds:.1f}s" for n, seconds in reduction_seconds.items()))
+
+    scored = [r for r in results if r['dbcv'] is not None]
+    if scored:
+        best = max(scored, key=lambda r: r['dbcv'])
+        print(f"💡 Highest DBCV: --neighbors {best['n_neighbors']} --min-cluster-size {best['min_cluster_size']} "
+              f"({best['clusters']} clusters, {best['noise_fraction']:.0%} noise)")
+    for r in results:
+        r['umap_seconds'] = reduction_seconds[r['n_neighbors']]
+    return results
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Reader for the near-duplicate index built by near_duplicates.py.
+
+Kept free of decoding dependencies so the export and Stream upload scripts can
+skip non-canonical copies without OpenCV installed.
+"""
+
+import json
+from pathlib import Path
+
+from video_discovery import VideoManifest
+
+DUPLICATE_INDEX_NAME = "near_duplicates.json"
+
+
+class DuplicateIndex:
+    """A saved near-duplicate index: which fingerprints are non-canonical copies."""
+
+    def __init__(self, data):
+        self.data = data
+        self.groups = data.get('groups', [])
+        self.duplicate_fingerprints = {
+            duplicate['fingerprint'] for group in self.groups for duplicate in group['duplicates']
+        } - {group['canonical']['fingerprint'] for group in self.groups}
+
+    def is_canonical(self, fingerprint):
+        return fingerprint not in self.duplicate_fingerprints
+
+    def canonical_mask(self, fingerprints):
+        """
+        Which of `fingerprints` to keep: canonical files only, and byte-identical
+        files (same fingerprint) once, first one wins.
+        """
+        keep = []
+        seen = set()
+        for fingerprint in fingerprints:
+            if not fingerprint:
+                # Rows from before fingerprints ('' in migrated stores) can't be matched against the index
+                keep.append(True)
+                continue
+            keep.append(fingerprint not in seen and self.is_canonical(fingerprint))
+            seen.add(fingerprint)
+        return keep
+
+    def canonical_only(self, video_infos):
+        """Drop non-canonical copies from video dicts that have a 'fingerprint'."""
+        keep = self.canonical_mask(video_info.get('fingerprint') for video_info in video_infos)
+        return [video_info for video_info, kept in zip(video_infos, keep) if kept]
+
+    def canonical_paths(self, paths, cache_dir="video_embeddings_cache"):
+        """
+        canonical_only for plain file paths. They are fingerprinted through the
+        discovery manifest of `cache_dir`, like near_duplicates.py does, so
+        their fingerprints match the ones the index was built from.
+        """
+        video_infos = [{'path': path} for path in paths]
+        manifest = VideoManifest(cache_dir)
+        manifest.refresh(video_infos)
+        # Files that can't be stat'ed can't be matched either: they are kept
+        manifest.fingerprint([video_info for video_info in video_infos if 'size_bytes' in video_info])
+        manifest.save()
+        return [video_info['path'] for video_info in self.canonical_only(video_infos)]
+
+
+def load_duplicate_index(cache_dir="video_embeddings_cache"):
+    """The saved DuplicateIndex of a cache directory, or None."""
+    index_file = Path(cache_dir) / DUPLICATE_INDEX_NAME
+    if not index_file.exists():
+        return None
+    with open(index_file, 'r') as f:
+        return DuplicateIndex(json.load(f))
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Long-lived embedding daemon that keeps CLIP loaded between runs.
+
+Every script that embeds new videos otherwise starts a fresh process and loads
+the model again, which dominates small incremental runs. The daemon loads it
+once and serves batches of videos over a Unix socket in the cache directory
+(video_embeddings_cache/embedding_daemon.sock). Clients send the video dicts
+together with their sampler, decoder and pipeline options, so the daemon
+computes exactly what the client would have computed in-process, and get back
+per-frame embeddings plus the decode outcome of every video.
+
+Clients (VideoClusterer with use_daemon) connect when the daemon is running
+for their cache directory, model and backend, and compute in-process
+otherwise. Requests are served one at a time.
+
+The socket only accepts clients that know the key written next to it
+(readable by the daemon's user only).
+
+Usage:
+    python3 embedding_daemon.py serve &
+    python3 embedding_daemon.py status
+    python3 embedding_daemon.py stop
+"""
+
+import os
+import copy
+import time
+import argparse
+from pathlib import Path
+from multiprocessing.connection import Client, Listener
+
+SOCKET_NAME = "embedding_daemon.sock"
+KEY_NAME = "embedding_daemon.key"
+
+# Videos per request, so callbacks (checkpoints, quarantine) keep up on long runs
+DAEMON_CHUNK_SIZE = 64
+
+
+def socket_path(cache_dir):
+    return Path(cache_dir) / SOCKET_NAME
+
+
+def connect(cache_dir):
+    """Connection to the daemon serving `cache_dir`, or None if none is running."""
+    address = socket_path(cache_dir)
+    key_file = Path(cache_dir) / KEY_NAME
+    if not address.exists() or not key_file.exists():
+        return None
+    try:
+        return Client(str(address), family='AF_UNIX', authkey=key_file.read_bytes())
+    except (OSError, EOFError):
+        # Stale socket from a daemon that was killed
+        return None
+
+
+def request(connection, message):
+    connection.send(message)
+    reply = connection.recv()
+    if 'error' in reply:
+        raise RuntimeError(reply['error'])
+    return reply
+
+
+def daemon_embed(clusterer, video_infos, sampler, model, on_frames=None, on_decoded=None, **options):
+    """
+    Compute per-frame embeddings through the daemon, in chunks.
+
+    Video dicts are updated with the sampling details and the callbacks are
+    called as each chunk comes back, as compute_frame_embeddings_batched would.
+
+    Returns:
+        Results (as compute_frame_embeddings_batched) for the leading videos
+        the daemon handled: all of them, fewer if it went away mid-run, or
+        none if no daemon is serving this cache, model and backend
+    """
+    connection = connect(clusterer.cache_dir)
+    if connection is None:
+        return []
+
+    results = []
+    with connection:
+        try:
+            status = request(connection, {'op': 'status'})
+        except (OSError, EOFError, RuntimeError) as e:
+            print(f"⚠️  Embedding daemon not responding ({e}); computing in this process")
+            return []
+        if (status['model'], status['backend']) != (model, clusterer.backend):
+            print(f"⚠️  Embedding daemon serves {status['model']} ({status['backend']}), "
+                  f"not {model} ({clusterer.backend}); computing in this process")
+            return []
+        print(f"🔌 Embedding {len(video_infos)} videos with the warm daemon (pid {status['pid']})")
+
+        # The daemon may run elsewhere in the tree: send absolute paths
+        thumbnails = None
+        if clusterer.thumbnails is not None:
+            thumbnails = copy.copy(clusterer.thumbnails)
+            thumbnails.output_dir = thumbnails.output_dir.resolve()
+
+        for start in range(0, len(video_infos), DAEMON_CHUNK_SIZE):
+            chunk = video_infos[start:start + DAEMON_CHUNK_SIZE]
+            try:
+                reply = request(connection, {
+                    'op': 'embed',
+                    'videos': [dict(v, path=Path(v['path']).resolve()) for v in chunk],
+                    'sampler': sampler,
+                    'decoder': clusterer.decoder.name,
+                    'thumbnails': thumbnails,
+                    'options': options,
+                })
+            except (OSError, EOFError, RuntimeError) as e:
+                print(f"⚠️  Embedding daemon failed ({e}); computing the remaining "
+                      f"{len(video_infos) - start} videos in this process")
+                break
+            for video_info, returned, outcome, result in zip(chunk, reply['videos'], reply['outcomes'],
+                                                             reply['results']):
+                video_info.update({key: value for key, value in returned.items() if key != 'path'})
+                if on_decoded:
+                    on_decoded(video_info, outcome)
+                if result is not None and on_frames:
+                    on_frames(video_info, *result)
+                results.append(result)
+            if 'memory' in reply and options.get('memory_budget') is not None:
+                options['memory_budget'].absorb(reply['memory'])
+    return results
+
+
+def serve(cache_dir, backend, model):
+    """Load the encoder and answer requests until stopped."""
+    from advanced_video_clusterer import VideoClusterer
+    from clip_encoders import resolve_backend
+    from frame_decoders import get_decoder
+    from host_profile import load_host_profile
+
+    cache_dir = Path(cache_dir)
+    address = socket_path(cache_dir)
+    if address.exists():
+        connection = connect(cache_dir)
+        if connection is not None:
+            connection.close()
+            print(f"❌ An embedding daemon is already serving {cache_dir}")
+            return
+        address.unlink()
+
+    # Batch size and decoder workers come with each request; threads are the daemon's own
+    backend = resolve_backend(backend)
+    profile = load_host_profile(cache_dir, backend)
+    threads = profile['settings']['threads'] if profile else None
+    clusterer = VideoClusterer(cache_dir=cache_dir, backend=backend, threads=threads)
+    print(f"🔧 Loading CLIP {model} ({backend})...")
+    start = time.perf_counter()
+    clusterer.encoder
+    print(f"✅ Model ready in {time.perf_counter() - start:.1f}s")
+
+    key_file = cache_dir / KEY_NAME
+    key = os.urandom(32)
+    fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+
+    listener = Listener(str(address), family='AF_UNIX', authkey=key)
+    os.chmod(address, 0o600)
+    started = time.time()
+    served = {'requests': 0, 'videos': 0}
+    print(f"🔌 Embedding daemon listening on {address} (pid {os.getpid()})")
+
+    try:
+        while True:
+            try:
+                connection = listener.accept()
+            except (OSError, EOFError) as e:
+                # A client that failed the key check or hung up during the handshake
+                print(f"⚠️  Rejected connection: {e}")
+                continue
+            with connection:
+                while True:
+                    try:
+                        message = connection.recv()
+                    except (OSError, EOFError):
+                        break
+                    op = message.get('op')
+                    if op == 'status':
+                        connection.send({'pid': os.getpid(), 'model': model, 'backend': clusterer.backend,
+                                         'cache_dir': str(cache_dir.resolve()),
+                                         'uptime': time.time() - started, **served})
+                    elif op == 'embed':
+                        start = time.perf_counter()
+                        try:
+                            reply = _embed(clusterer, message, get_decoder)
+                        except Exception as e:
+                            print(f"❌ Request failed: {e}")
+                            reply = {'error': str(e)}
+                        connection.send(reply)
+                        served['requests'] += 1
+                        served['videos'] += len(message['videos'])
+                        print(f"📨 Embedded {len(message['videos'])} videos in {time.perf_counter() - start:.2f}s")
+                    elif op == 'stop':
+                        connection.send({'stopped': True})
+                        return
+                    else:
+                        connection.send({'error': f"unknown request {op!r}"})
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        key_file.unlink(missing_ok=True)
+        address.unlink(missing_ok=True)
+        print(f"👋 Embedding daemon stopped after {served['requests']} requests ({served['videos']} videos)")
+
+
+def _embed(clusterer, message, get_decoder):
+    """Run one embed request with the client's sampler, decoder and options."""
+    if clusterer.decoder.name != message['decoder']:
+        clusterer.decoder = get_decoder(message['decoder'])
+    clusterer.thumbnails = message['thumbnails']
+    video_infos = message['videos']
+    outcomes = [None] * len(video_infos)
+    positions = {id(video_info): i for i, video_info in enumerate(video_infos)}
+
+    def record_outcome(video_info, outcome):
+        outcomes[positions[id(video_info)]] = outcome
+
+    # The client's budget applies to this process; its numbers go back with the reply
+    memory_budget = message['options'].get('memory_budget')
+    if memory_budget is not None:
+        memory_budget.start()
+    try:
+        results = clusterer.compute_frame_embeddings_local(video_infos, message['sampler'],
+                                                           on_decoded=record_outcome, **message['options'])
+        reply = {'videos': video_infos, 'outcomes': outcomes, 'results': results}
+        if memory_budget is not None:
+            reply['memory'] = memory_budget.summary()
+    finally:
+        if memory_budget is not None:
+            memory_budget.stop()
+    return reply
+
+
+def main():
+    from clip_encoders import DEFAULT_BACKEND, ENCODER_BACKENDS
+
+    parser = argparse.ArgumentParser(description="Keep CLIP loaded and embed videos for other scripts")
+    parser.add_argument("command", choices=['serve', 'status', 'stop'], help="Command to run")
+    parser.add_argument("--cache-dir", default="video_embeddings_cache",
+                       help="Cache directory (default: video_embeddings_cache)")
+    parser.add_argument("--backend", choices=ENCODER_BACKENDS, default=DEFAULT_BACKEND,
+                       help=f"CLIP image encoder backend (default: {DEFAULT_BACKEND})")
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        from advanced_video_clusterer import CLIP_MODEL_NAME
+        serve(args.cache_dir, args.backend, CLIP_MODEL_NAME)
+        return
+
+    connection = connect(args.cache_dir)
+    if connection is None:
+        print(f"❌ No embedding daemon running for {args.cache_dir}")
+        return
+    with connection:
+        if args.command == 'status':
+            status = request(connection, {'op': 'status'})
+            print(f"🔌 Embedding daemon pid {status['pid']}: {status['model']} ({status['backend']})")
+            print(f"   Cache: {status['cache_dir']}")
+            print(f"   Up {status['uptime'] / 60:.1f} min, "
+                  f"{status['requests']} requests, {status['videos']} videos embedded")
+        elif args.command == 'stop':
+            request(connection, {'op': 'stop'})
+            print("✅ Embedding daemon stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Overlapped decode/encode pipeline for the video clusterer.
+
+Worker processes decode and CLIP-preprocess videos while the parent process
+runs CLIP inference. Each worker handles one video at a time under a
+wall-clock budget: a worker that exceeds it (a truncated file hanging
+cv2.VideoCapture, a pathological stream) is killed and replaced, and the video
+is reported as timed out instead of stalling the run.
+
+A manager thread hands out videos and collects results into a queue of
+`queue_depth` decoded videos. When CLIP falls behind the queue fills up, no new
+videos are handed out, and memory stays flat on large runs.
+"""
+
+import time
+import queue
+import threading
+import multiprocessing
+from multiprocessing.connection import wait
+from pathlib import Path
+
+import numpy as np
+
+from frame_decoders import get_decoder
+
+# Decoded videos allowed in flight per worker
+DEFAULT_QUEUE_DEPTH = 4
+
+# Wall-clock budget for decoding one video, in seconds
+DEFAULT_VIDEO_TIMEOUT = 120
+
+_worker_decoder = None
+_worker_preprocess = None
+
+
+def _init_worker(decoder_name, preprocess):
+    global _worker_decoder, _worker_preprocess
+    _worker_decoder = get_decoder(decoder_name)
+    _worker_preprocess = preprocess
+
+    # One intra-op thread per decoder process; the parent owns the cores for inference
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+
+
+def _decode_and_preprocess(video_idx, video_path, sampler, thumbnails=None, thumbnail_file=None):
+    from PIL import Image
+
+    try:
+        frames, timestamps, details = sampler.sample(_worker_decoder, video_path)
+    except Exception as e:
+        return video_idx, None, None, {'error': str(e), 'reason': 'error'}
+
+    if not frames:
+        return video_idx, None, None, {**details, 'error': 'no frames decoded', 'reason': 'no-frames'}
+
+    if thumbnails is not None:
+        thumbnails.write_safely(frames, thumbnail_file, Path(video_path).name)
+    images = np.stack([np.asarray(_worker_preprocess(Image.fromarray(frame))) for _, frame in frames])
+    return video_idx, images, timestamps, details
+
+
+def decode_and_preprocess_timed(video_idx, video_path, sampler, thumbnails=None, thumbnail_file=None):
+    """Decode one video and add how long it took to its details."""
+    start = time.monotonic()
+    video_idx, images, timestamps, details = _decode_and_preprocess(video_idx, video_path, sampler,
+                                                                    thumbnails, thumbnail_file)
+    details['decode_seconds'] = time.monotonic() - start
+    return video_idx, images, timestamps, details
+
+
+def _worker_main(conn, decoder_name, preprocess):
+    _init_worker(decoder_name, preprocess)
+    # Budgets start once the worker has finished importing, not at spawn
+    conn.send('ready')
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        conn.send(decode_and_preprocess_timed(*task))
+
+
+class _Worker:
+    """A decoder process and the parent's end of its pipe."""
+
+    def __init__(self, context, decoder_name, preprocess):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, decoder_name, preprocess),
+                                       daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+        self.task = None
+        self.started = None
+
+    def submit(self, task):
+        self.task = task
+        self.started = time.monotonic()
+        self.conn.send(task)
+
+    def kill(self):
+        self.process.terminate()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.kill()
+
+
+def _manage(video_infos, sampler, workers, results, timeout, stop, spawn, thumbnails=None, admit=None):
+    """Manager thread: hand out videos, collect results, replace workers that hang or die."""
+    pending = iter(enumerate(video_infos))
+    pool = [spawn() for _ in range(workers)]
+
+    def put(item):
+        # Block while the consumer is behind, but notice a stop request
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def fail(worker, reason, error):
+        put((worker.task[0], None, None, {'error': error, 'reason': reason,
+                                          'decode_seconds': time.monotonic() - worker.started}))
+
+    try:
+        exhausted = False
+        while not stop.is_set():
+            for worker in pool:
+                if worker.ready and worker.task is None and not exhausted:
+                    # Over the memory budget: let videos in flight drain first (one always runs)
+                    if admit is not None and any(w.task is not None for w in pool) and not admit():
+                        break
+                    try:
+                        video_idx, video_info = next(pending)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    thumbnail_file = thumbnails.path_for(video_info) if thumbnails is not None else None
+                    worker.submit((video_idx, str(video_info['path']), sampler, thumbnails, thumbnail_file))
+
+            busy = [worker for worker in pool if worker.task is not None]
+            starting = [worker for worker in pool if not worker.ready]
+            if not busy and (exhausted or not starting):
+                break
+
+            wait_for = 0.5
+            if timeout and busy:
+                now = time.monotonic()
+                wait_for = max(0.0, min(wait_for, min(w.started + timeout - now for w in busy)))
+            ready = wait([w.conn for w in busy + starting], timeout=wait_for)
+
+            for idx, worker in enumerate(pool):
+                if not worker.ready:
+                    if worker.conn in ready:
+                        try:
+                            worker.ready = worker.conn.recv() == 'ready'
+                        except (EOFError, OSError):
+                            raise RuntimeError(f"decoder process failed to start "
+                                               f"(exit code {worker.process.exitcode})")
+                    continue
+                if worker.task is None:
+                    continue
+                if worker.conn in ready:
+                    try:
+                        result = worker.conn.recv()
+                    except (EOFError, OSError):
+                        # The process died mid-video (segfault, OOM kill)
+                        worker.process.join(1)
+                        fail(worker, 'crash', f"decoder process exited with code {worker.process.exitcode}")
+                        worker.kill()
+                        pool[idx] = spawn()
+                        continue
+                    worker.task = None
+                    put(result)
+                elif timeout and time.monotonic() - worker.started > timeout:
+                    fail(worker, 'timeout', f"no result after {timeout:.0f}s")
+                    worker.kill()
+                    pool[idx] = spawn()
+    except Exception as e:
+        put(e)
+    finally:
+        for worker in pool:
+            if worker.task is None:
+                worker.stop()
+            else:
+                worker.kill()
+        put(None)
+
+
+def iter_preprocessed_videos(video_infos, decoder_name, preprocess, sampler,
+                             workers=2, queue_depth=None, timeout=DEFAULT_VIDEO_TIMEOUT, thumbnails=None,
+                             admit=None):
+    """
+    Decode the frames picked by `sampler` and preprocess them in worker processes.
+
+    Yields (video_idx, images, timestamps, details) in completion order, where
+    images is a (frames, 3, H, W) float32 array or None if the video failed,
+    timestamps are the frame times in seconds and details is the sampler's
+    per-video dict (e.g. intro_frames) plus 'decode_seconds'. Failed videos also
+    carry 'error' and 'reason' ('error', 'no-frames', 'timeout' or 'crash').
+
+    With a ThumbnailWriter in `thumbnails`, workers also save each video's
+    thumbnail from the frames they decoded.
+
+    `admit()` (e.g. MemoryBudget.has_headroom) is asked before each new video
+    is handed out while others are in flight; False holds it back.
+    """
+    queue_depth = max(1, queue_depth or DEFAULT_QUEUE_DEPTH * workers)
+    context = multiprocessing.get_context('spawn')
+    results = queue.Queue(maxsize=queue_depth)
+    stop = threading.Event()
+
+    manager = threading.Thread(
+        target=_manage, daemon=True,
+        args=(video_infos, sampler, workers, results, timeout, stop,
+              lambda: _Worker(context, decoder_name, preprocess), thumbnails, admit)
+    )
+    manager.start()
+    try:
+        while True:
+            item = results.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            video_idx, images, timestamps, details = item
+            if 'error' in details:
+                print(f"❌ Error extracting frames from {video_infos[video_idx]['name']}: {details['error']}")
+            yield item
+            # Don't hold the images while waiting for the next video
+            del item, images
+    finally:
+        stop.set()
+        manager.join()
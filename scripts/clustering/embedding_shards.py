@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Split embedding computation across machines (or processes) and merge the results.
+
+`advanced_video_clusterer.py analyze --shard i/N` keeps only the videos whose
+fingerprint hashes to shard i of N, so every node agrees on the split without
+coordinating. Each shard writes a regular embedding store inside the
+embedding namespace of the run:
+
+    video_embeddings_cache/namespaces/<namespace>/shards/shard-<i>-of-<N>/store/
+
+whose metadata describes the shard: its index and count, the model and
+sampling settings, and a digest of the fingerprints of the whole collection it
+was split from. `merge` checks that a complete, consistent set of shards is
+present and combines them into the namespace's store.
+
+Usage (N processes against one directory):
+    python3 advanced_video_clusterer.py analyze --shard 1/2 &
+    python3 advanced_video_clusterer.py analyze --shard 2/2 &
+    wait
+    python3 advanced_video_clusterer.py merge
+"""
+
+import re
+import shutil
+import hashlib
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from embedding_store import EmbeddingStore, rows_from_columns
+from video_quarantine import Quarantine
+
+SHARDS_DIR_NAME = "shards"
+
+# Settings every shard of a merge must agree on
+CONSISTENT_KEYS = ('model', 'dim', 'aggregation', 'backend', 'sampling')
+
+
+def parse_shard(text):
+    """argparse type for 'i/N' (1-based). Returns (index, count)."""
+    match = re.fullmatch(r'\s*(\d+)\s*/\s*(\d+)\s*', text)
+    if not match:
+        raise argparse.ArgumentTypeError(f"expected i/N, e.g. 1/4 (got {text!r})")
+    index, count = int(match.group(1)), int(match.group(2))
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"shard index must be between 1 and {count} (got {index})")
+    return index, count
+
+
+def shard_of(fingerprint, count):
+    """1-based shard a fingerprint belongs to."""
+    digest = hashlib.blake2b(fingerprint.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % count + 1
+
+
+def select_shard(video_infos, index, count):
+    """The videos (with fingerprints) that belong to shard `index` of `count`."""
+    return [video_info for video_info in video_infos if shard_of(video_info['fingerprint'], count) == index]
+
+
+def collection_digest(video_infos):
+    """Digest of the fingerprints of a whole collection, independent of order."""
+    digest = hashlib.blake2b(digest_size=16)
+    for fingerprint in sorted(video_info['fingerprint'] for video_info in video_infos):
+        digest.update(fingerprint.encode())
+    return digest.hexdigest()
+
+
+def shard_dir(store_root, index, count):
+    return Path(store_root) / SHARDS_DIR_NAME / f"shard-{index}-of-{count}"
+
+
+def shard_info(video_infos, index, count):
+    """The 'shard' entry recorded in a shard store's metadata."""
+    return {
+        'index': index,
+        'count': count,
+        'partition': 'blake2b(fingerprint) % count',
+        'collection_videos': len(video_infos),
+        'collection_digest': collection_digest(video_infos),
+    }
+
+
+def find_shards(store_root):
+    """[(directory, metadata)] for every shard store of a namespace."""
+    shards = []
+    for directory in sorted((Path(store_root) / SHARDS_DIR_NAME).glob("shard-*-of-*")):
+        store = EmbeddingStore(directory / "store")
+        if store.exists():
+            shards.append((directory, store.read_metadata()))
+    return shards
+
+
+def validate_shards(shards):
+    """
+    Check that shards form one complete, consistent set.
+
+    Returns a list of problems (empty if the shards can be merged).
+    """
+    if not shards:
+        return ["no shard stores found"]
+
+    problems = []
+    infos = [metadata.get('shard') for _, metadata in shards]
+    if any(info is None for info in infos):
+        return [f"{directory.name} has no shard description" for (directory, _), info in zip(shards, infos)
+                if info is None]
+
+    count = infos[0]['count']
+    if any(info['count'] != count for info in infos):
+        problems.append(f"shards were split different ways: {sorted({info['count'] for info in infos})}")
+    indices = sorted(info['index'] for info in infos)
+    missing = sorted(set(range(1, count + 1)) - set(indices))
+    if missing:
+        problems.append(f"missing shards {', '.join(f'{i}/{count}' for i in missing)}")
+    if len(indices) != len(set(indices)):
+        problems.append("duplicate shard indices")
+    if len({info['collection_digest'] for info in infos}) > 1:
+        problems.append("shards were computed from different video collections (re-run them on the same files)")
+
+    for key in CONSISTENT_KEYS:
+        # An empty shard has no embedding dimension to compare
+        values = {repr(metadata.get(key)) for _, metadata in shards if key != 'dim' or metadata['count']}
+        if len(values) > 1:
+            problems.append(f"shards disagree on {key}")
+
+    seen = {}
+    for (directory, metadata), info in zip(shards, infos):
+        for fingerprint in metadata['columns']['fingerprint']:
+            if shard_of(fingerprint, info['count']) != info['index']:
+                problems.append(f"{directory.name} contains a video that belongs to another shard")
+                break
+            if fingerprint in seen:
+                problems.append(f"video {fingerprint} is in both {seen[fingerprint]} and {directory.name}")
+            seen[fingerprint] = directory.name
+    return problems
+
+
+def merge_shards(store_root, quarantine_dir, keep_shards=False):
+    """
+    Validate the shard stores of a namespace and combine them into its store.
+
+    Shard quarantines are folded into the one in `quarantine_dir`. Merged shard
+    directories are removed unless `keep_shards`. Returns the number of merged
+    videos, or None if validation failed.
+    """
+    shards = find_shards(store_root)
+    problems = validate_shards(shards)
+    if problems:
+        print("❌ Cannot merge shards:")
+        for problem in problems:
+            print(f"   - {problem}")
+        return None
+
+    shards.sort(key=lambda shard: shard[1]['shard']['index'])
+    with_frames = any(metadata.get('frames_file') for _, metadata in shards)
+
+    video_files = []
+    embeddings = []
+    frame_embeddings = []
+    frame_times = []
+    for directory, metadata in shards:
+        store = EmbeddingStore(directory / "store")
+        rows = rows_from_columns(metadata['columns'], metadata['count'])
+        print(f"   📦 {directory.name}: {metadata['count']} videos")
+        if not rows:
+            continue
+        embeddings.append(np.asarray(store.open_embeddings(metadata)))
+        frames = store.load_frames(metadata, mmap=False)
+        if frames is not None:
+            frame_embeddings.append(frames[0])
+            frame_times.append(frames[1])
+        else:
+            # Rows reused from a store without frames keep only their pooled embedding
+            for row in rows:
+                row['frame_count'] = 0
+        video_files.extend(rows)
+
+    first = shards[0][1]
+    dim = max(metadata['dim'] for _, metadata in shards)
+    extra = {key: first[key] for key in ('backend', 'sampling') if key in first}
+    extra['merged_from'] = [directory.name for directory, _ in shards]
+    EmbeddingStore(Path(store_root) / "store").write(
+        video_files, np.concatenate(embeddings) if embeddings else np.zeros((0, dim), np.float32),
+        model=first['model'], extra=extra,
+        frame_embeddings=np.concatenate(frame_embeddings or [np.zeros((0, dim), np.float32)]) if with_frames else None,
+        frame_times=np.concatenate(frame_times or [np.zeros(0, np.float32)]) if with_frames else None,
+        aggregation=first['aggregation']
+    )
+
+    quarantine = Quarantine(quarantine_dir)
+    for directory, _ in shards:
+        quarantine.entries.update(Quarantine(directory).entries)
+    quarantine.save()
+
+    if not keep_shards:
+        for directory, _ in shards:
+            shutil.rmtree(directory, ignore_errors=True)
+        shards_root = Path(store_root) / SHARDS_DIR_NAME
+        if not any(shards_root.iterdir()):
+            shards_root.rmdir()
+    return len(video_files)
@@ -0,0 +1,538 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped, schema-versioned embedding store.
+
+Replaces video_embeddings.pkl with a directory of plain files per namespace.
+A namespace is derived from the model and frame sampling that produced the
+embeddings (see namespace_name), so stores of different setups coexist:
+
+    video_embeddings_cache/namespaces/<namespace>/store/
+        metadata.json            version header + columnar per-video metadata
+        embeddings.<id>.npy      contiguous float32 (num_videos, dim) matrix
+        frames.<id>.npy          float32 (total_frames, dim) per-frame embeddings
+        frame_times.<id>.npy     float32 (total_frames,) frame timestamps in seconds
+        aggregated/<id>.<method>.npy   video embeddings re-derived from the frames
+
+The matrices are opened with mmap_mode='r', so loading is O(1) and readers can
+slice rows without materializing the whole thing. metadata.json names the
+files it belongs to and is replaced last, which makes every write atomic for
+readers.
+
+Each video's frames are stored back to back, in the order of the metadata
+rows; the `frame_count` column gives the run lengths. embeddings.<id>.npy holds
+the aggregation the store was written with; other aggregations are computed
+from the frames on first use and cached under aggregated/. Stores written
+before frames were kept (version 1) have no frame files and a frame_count of 0.
+
+Usage:
+    python3 embedding_store.py migrate   # one-shot conversion of video_embeddings.pkl
+    python3 embedding_store.py info --namespace vit-b-32.uniform-5
+    python3 embedding_store.py aggregate --aggregation max   # re-derive video embeddings from frames
+    python3 embedding_store.py namespaces
+    python3 embedding_store.py prune --namespace vit-l-14.uniform-8   # or --keep <namespace>
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import pickle
+import argparse
+import uuid
+import hashlib
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from frame_aggregation import AGGREGATIONS, DEFAULT_AGGREGATION, aggregate, frame_offsets
+
+STORE_FORMAT = "interdimensionalcable-embeddings"
+STORE_VERSION = 2
+
+# Per-video metadata columns and their defaults for rows that don't have them
+COLUMNS = {
+    'path': '',
+    'name': '',
+    'channel': '',
+    'size_mb': 0.0,
+    'size_bytes': 0,
+    'mtime_ns': 0,
+    'fingerprint': '',
+    'frame_count': 0,
+    'intro_frames': 0,
+}
+
+LEGACY_PICKLE_NAME = "video_embeddings.pkl"
+
+# Stores of different models / sampling setups live side by side under this directory
+NAMESPACES_DIR_NAME = "namespaces"
+
+
+class EmbeddingStore:
+    """Embedding matrix plus columnar metadata under one directory."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.metadata_file = self.directory / "metadata.json"
+
+    def exists(self):
+        return self.metadata_file.exists()
+
+    def read_metadata(self):
+        """Read and validate the metadata header."""
+        with open(self.metadata_file, 'r') as f:
+            metadata = json.load(f)
+
+        if metadata.get('format') != STORE_FORMAT:
+            raise ValueError(f"{self.metadata_file} is not an embedding store")
+        if metadata.get('version', 0) > STORE_VERSION:
+            raise ValueError(
+                f"{self.metadata_file} has store version {metadata['version']}, "
+                f"this code reads up to {STORE_VERSION}"
+            )
+        return metadata
+
+    def open_embeddings(self, metadata=None, mmap=True):
+        """Open the embedding matrix, memory-mapped read-only by default."""
+        metadata = metadata or self.read_metadata()
+        embeddings = np.load(self.directory / metadata['embeddings_file'], mmap_mode='r' if mmap else None)
+        if embeddings.shape != (metadata['count'], metadata['dim']):
+            raise ValueError(
+                f"Embedding matrix shape {embeddings.shape} does not match metadata "
+                f"({metadata['count']}, {metadata['dim']})"
+            )
+        return embeddings
+
+    def rows(self, indices):
+        """Materialize only the given rows of the embedding matrix."""
+        return np.asarray(self.open_embeddings()[indices])
+
+    def load_frames(self, metadata=None, mmap=True):
+        """
+        Return (frame_embeddings, frame_times, frame_counts), or None if the
+        store has no per-frame embeddings.
+        """
+        metadata = metadata or self.read_metadata()
+        if not metadata.get('frames_file'):
+            return None
+        mmap_mode = 'r' if mmap else None
+        frame_embeddings = np.load(self.directory / metadata['frames_file'], mmap_mode=mmap_mode)
+        frame_times = np.load(self.directory / metadata['frame_times_file'], mmap_mode=mmap_mode)
+        frame_counts = np.asarray(metadata['columns']['frame_count'], dtype=np.int64)
+        if len(frame_embeddings) != frame_counts.sum() or len(frame_times) != len(frame_embeddings):
+            raise ValueError(
+                f"Frame matrix has {len(frame_embeddings)} rows, metadata counts {frame_counts.sum()}"
+            )
+        return frame_embeddings, frame_times, frame_counts
+
+    def aggregated(self, method=DEFAULT_AGGREGATION, metadata=None, mmap=True):
+        """
+        Video embeddings under `method`, derived from the stored frames.
+
+        The aggregation the store was written with is the main matrix; any other
+        is computed once and cached under aggregated/ until the next write.
+        Videos without frames keep their stored embedding.
+        """
+        metadata = metadata or self.read_metadata()
+        if method == metadata.get('aggregation', DEFAULT_AGGREGATION):
+            return self.open_embeddings(metadata, mmap=mmap)
+
+        cache_file = self.directory / "aggregated" / f"{_write_id(metadata)}.{method}.npy"
+        if cache_file.exists():
+            return np.load(cache_file, mmap_mode='r' if mmap else None)
+
+        frames = self.load_frames(metadata)
+        if frames is None:
+            print(f"⚠️  {self.directory} has no per-frame embeddings; "
+                  f"using its {metadata.get('aggregation', DEFAULT_AGGREGATION)} embeddings")
+            return self.open_embeddings(metadata, mmap=mmap)
+
+        frame_embeddings, frame_times, frame_counts = frames
+        embeddings = aggregate(frame_embeddings, frame_counts, method, frame_times=frame_times,
+                               fallback=self.open_embeddings(metadata))
+        cache_file.parent.mkdir(exist_ok=True)
+        tmp_file = cache_file.with_suffix('.tmp')
+        with open(tmp_file, 'wb') as f:
+            np.save(f, embeddings)
+        os.replace(tmp_file, cache_file)
+        return embeddings
+
+    def load(self, mmap=True, aggregation=None):
+        """
+        Return (video_files, embeddings) with video_files as the familiar list of dicts.
+        `aggregation` picks how frames are pooled (default: the one the store was written with).
+        """
+        metadata = self.read_metadata()
+        if aggregation:
+            embeddings = self.aggregated(aggregation, metadata, mmap=mmap)
+        else:
+            embeddings = self.open_embeddings(metadata, mmap=mmap)
+        return rows_from_columns(metadata['columns'], metadata['count']), embeddings
+
+    def write(self, video_files, embeddings, model=None, extra=None, frame_embeddings=None,
+              frame_times=None, aggregation=DEFAULT_AGGREGATION):
+        """
+        Atomically replace the store contents.
+
+        `frame_embeddings`/`frame_times` are the flat per-frame arrays, laid out
+        by the `frame_count` of each video dict. Without them, no frames are kept.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2:
+            embeddings = embeddings.reshape(len(video_files), -1) if len(video_files) else np.zeros((0, 0), np.float32)
+        if len(video_files) != len(embeddings):
+            raise ValueError(f"{len(video_files)} videos but {len(embeddings)} embeddings")
+
+        columns = columns_from_rows(video_files)
+        if frame_embeddings is None:
+            columns['frame_count'] = [0] * len(video_files)
+        elif len(frame_embeddings) != sum(columns['frame_count']) or len(frame_times) != len(frame_embeddings):
+            raise ValueError(f"{len(frame_embeddings)} frame embeddings but frame counts add up to "
+                             f"{sum(columns['frame_count'])}")
+
+        previous = self.read_metadata() if self.exists() else None
+
+        write_id = uuid.uuid4().hex[:12]
+        files = {'embeddings_file': f"embeddings.{write_id}.npy"}
+        self._save_array(files['embeddings_file'], embeddings)
+        if frame_embeddings is not None:
+            files['frames_file'] = f"frames.{write_id}.npy"
+            files['frame_times_file'] = f"frame_times.{write_id}.npy"
+            self._save_array(files['frames_file'], np.asarray(frame_embeddings, dtype=np.float32))
+            self._save_array(files['frame_times_file'], np.asarray(frame_times, dtype=np.float32))
+
+        metadata = {
+            'format': STORE_FORMAT,
+            'version': STORE_VERSION,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'model': model,
+            'count': int(embeddings.shape[0]),
+            'dim': int(embeddings.shape[1]),
+            'dtype': 'float32',
+            'aggregation': aggregation,
+            **files,
+            'columns': columns,
+        }
+        if extra:
+            metadata.update(extra)
+
+        tmp_file = self.metadata_file.with_suffix('.json.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(metadata, f)
+        os.replace(tmp_file, self.metadata_file)
+
+        # Readers that still have the old files mapped keep working after the unlink
+        if previous:
+            for key in ('embeddings_file', 'frames_file', 'frame_times_file'):
+                if previous.get(key):
+                    (self.directory / previous[key]).unlink(missing_ok=True)
+            for stale in (self.directory / "aggregated").glob(f"{_write_id(previous)}.*"):
+                stale.unlink(missing_ok=True)
+
+    def _save_array(self, filename, array):
+        with open(self.directory / filename, 'wb') as f:
+            np.save(f, np.ascontiguousarray(array))
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def _write_id(metadata):
+    """The id shared by the files of one store write."""
+    return metadata['embeddings_file'].split('.')[1]
+
+
+class EmbeddingCheckpoint:
+    """
+    Periodic checkpoints of embeddings computed during a long run.
+
+    Entries are flushed to a separate store every `every` videos or `interval`
+    seconds, whichever comes first. Each flush rewrites the checkpoint store,
+    which is atomic, so a crash leaves the previous checkpoint intact.
+    """
+
+    def __init__(self, directory, every=100, interval=300, model=None):
+        self.store = EmbeddingStore(directory)
+        self.every = every
+        self.interval = interval
+        self.model = model
+        self.video_files = []
+        self.frame_embeddings = []
+        self.frame_times = []
+        self._unsaved = 0
+        self._last_save = time.monotonic()
+
+    def exists(self):
+        return self.store.exists()
+
+    def load(self):
+        """
+        Return (video_files, frame_embeddings, frame_times, saved_at) from the last
+        checkpoint, with one frame array per video.
+        """
+        metadata = self.store.read_metadata()
+        video_files = rows_from_columns(metadata['columns'], metadata['count'])
+        frame_embeddings, frame_times, frame_counts = self.store.load_frames(metadata, mmap=False)
+        bounds = frame_offsets(frame_counts)[1:-1]
+        return (video_files, np.split(frame_embeddings, bounds), np.split(frame_times, bounds),
+                metadata['created'])
+
+    def add(self, video_info, frame_embeddings, frame_times):
+        video_info['frame_count'] = len(frame_embeddings)
+        self.video_files.append(video_info)
+        self.frame_embeddings.append(frame_embeddings)
+        self.frame_times.append(frame_times)
+        self._unsaved += 1
+        if self._unsaved >= self.every or time.monotonic() - self._last_save >= self.interval:
+            self.save()
+
+    def save(self):
+        if not self._unsaved:
+            return
+        frame_embeddings = np.concatenate(self.frame_embeddings)
+        frame_times = np.concatenate(self.frame_times)
+        embeddings = aggregate(frame_embeddings, [len(f) for f in self.frame_embeddings])
+        self.store.write(self.video_files, embeddings, model=self.model, extra={'checkpoint': True},
+                         frame_embeddings=frame_embeddings, frame_times=frame_times)
+        self._unsaved = 0
+        self._last_save = time.monotonic()
+
+    def clear(self):
+        shutil.rmtree(self.store.directory, ignore_errors=True)
+
+
+def columns_from_rows(video_files):
+    """Turn a list of video dicts into JSON-safe columns."""
+    columns = {}
+    for column, default in COLUMNS.items():
+        values = [video.get(column, default) for video in video_files]
+        if column == 'path':
+            values = [str(v) for v in values]
+        elif isinstance(default, float):
+            values = [float(v) for v in values]
+        elif isinstance(default, int):
+            values = [int(v) for v in values]
+        columns[column] = values
+    return columns
+
+
+def rows_from_columns(columns, count):
+    """Turn columns back into a list of video dicts (paths as Path objects)."""
+    rows = [{} for _ in range(count)]
+    for column, values in columns.items():
+        for row, value in zip(rows, values):
+            row[column] = Path(value) if column == 'path' else value
+    return rows
+
+
+def migrate_pickle(pickle_file, store, model=None):
+    """One-shot conversion of a legacy video_embeddings.pkl into a store."""
+    with open(pickle_file, 'rb') as f:
+        cached_data = pickle.load(f)
+
+    video_files = cached_data['video_files']
+    embeddings = np.asarray(cached_data['embeddings'], dtype=np.float32)
+    store.write(video_files, embeddings, model=model, extra={'migrated_from': str(pickle_file)})
+    return len(video_files)
+
+
+def namespace_name(model, sampling=None, backend=None):
+    """
+    Namespace for embeddings produced by a model and sampling setup, e.g.
+    vit-b-32.uniform-5, vit-b-32.scene-2-12-0.12-2-48.intro-3f9c2a7e or vit-l-14.uniform-8.onnx-int8.
+
+    The intro part carries a digest of the intro reference (hashes and
+    parameters), so rebuilding the reference starts a new namespace instead of
+    reusing embeddings sampled against the old one. Aggregation is not part of
+    it: every aggregation is derived from the same stored frames.
+    """
+    sampling = sampling or {'sampler': 'uniform', 'num_frames': 5}
+    settings = [f"{value:g}" if isinstance(value, float) else str(value)
+                for key, value in sampling.items() if key not in ('sampler', 'intro')]
+    parts = [_slug(model or 'unknown-model'), '-'.join([sampling['sampler']] + settings)]
+    if sampling.get('intro'):
+        parts.append(f"intro-{_digest(sampling['intro'])}")
+    if backend and backend != 'torch':
+        parts.append(backend)
+    return '.'.join(parts)
+
+
+def _digest(settings):
+    return hashlib.blake2b(json.dumps(settings, sort_keys=True).encode(), digest_size=4).hexdigest()
+
+
+def _slug(text):
+    return re.sub(r'[^a-z0-9]+', '-', text.lower()).strip('-')
+
+
+def namespace_dir(cache_dir, namespace):
+    return Path(cache_dir) / NAMESPACES_DIR_NAME / namespace
+
+
+def list_namespaces(cache_dir):
+    """Names of the namespaces in a cache directory that hold a store."""
+    root = Path(cache_dir) / NAMESPACES_DIR_NAME
+    if not root.exists():
+        return []
+    return sorted(d.name for d in root.iterdir() if EmbeddingStore(d / "store").exists())
+
+
+def resolve_namespace(cache_dir, namespace=None):
+    """
+    The namespace to read: `namespace` if given, else the only one in the cache
+    directory (None if there is none). Raises ValueError if several exist.
+    """
+    if namespace:
+        return namespace
+    namespaces = list_namespaces(cache_dir)
+    if len(namespaces) > 1:
+        raise ValueError(f"{cache_dir} has several embedding namespaces, pick one with --namespace: "
+                         + ", ".join(namespaces))
+    return namespaces[0] if namespaces else None
+
+
+def _migrate_flat_layout(cache_dir, model=None):
+    """Move a store (or pickle) from before namespaces into the namespace it was computed with."""
+    flat_store = EmbeddingStore(cache_dir / "store")
+    legacy_file = cache_dir / LEGACY_PICKLE_NAME
+
+    if flat_store.exists():
+        metadata = flat_store.read_metadata()
+        namespace = namespace_name(metadata.get('model') or model, metadata.get('sampling'), metadata.get('backend'))
+        target = namespace_dir(cache_dir, namespace) / "store"
+        if not EmbeddingStore(target).exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(flat_store.directory, target)
+            print(f"📦 Moved {flat_store.directory} to namespace {namespace}")
+    elif legacy_file.exists() and not list_namespaces(cache_dir):
+        # Pickles were always 5 uniformly sampled frames
+        store = EmbeddingStore(namespace_dir(cache_dir, namespace_name(model)) / "store")
+        print(f"📦 Migrating {legacy_file} to memory-mapped store...")
+        count = migrate_pickle(legacy_file, store, model=model)
+        print(f"✅ Migrated {count} embeddings to {store.directory}")
+
+
+def open_store(cache_dir="video_embeddings_cache", model=None, namespace=None):
+    """
+    Open the store of a namespace in `cache_dir` (see resolve_namespace),
+    migrating a store or pickle from before namespaces on first use.
+
+    Returns the EmbeddingStore (which may not exist yet if there is nothing to migrate).
+    """
+    cache_dir = Path(cache_dir)
+    _migrate_flat_layout(cache_dir, model)
+    namespace = resolve_namespace(cache_dir, namespace) or namespace_name(model)
+    return EmbeddingStore(namespace_dir(cache_dir, namespace) / "store")
+
+
+def _directory_size(directory):
+    return sum(f.stat().st_size for f in Path(directory).rglob('*') if f.is_file())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect, migrate or prune embedding stores")
+    parser.add_argument("command", choices=['migrate', 'info', 'aggregate', 'namespaces', 'prune'],
+                       help="Command to run")
+    parser.add_argument("--cache-dir", default="video_embeddings_cache",
+                       help="Cache directory (default: video_embeddings_cache)")
+    parser.add_argument("--namespace", default=None,
+                       help="Embedding namespace (default: the only one in the cache directory)")
+    parser.add_argument("--keep", default=None, help="prune: remove every namespace except this one")
+    parser.add_argument("--model", default="ViT-B/32", help="Model recorded for migrated pickles")
+    parser.add_argument("--aggregation", choices=AGGREGATIONS, default=DEFAULT_AGGREGATION,
+                       help=f"Frame aggregation for the aggregate command (default: {DEFAULT_AGGREGATION})")
+
+    args = parser.parse_args()
+
+    if args.command in ('info', 'aggregate'):
+        try:
+            resolve_namespace(args.cache_dir, args.namespace)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return
+
+    if args.command == 'migrate':
+        legacy_file = Path(args.cache_dir) / LEGACY_PICKLE_NAME
+        if not legacy_file.exists():
+            print(f"❌ No pickle cache found at {legacy_file}")
+            return
+        store = EmbeddingStore(namespace_dir(args.cache_dir, args.namespace or namespace_name(args.model)) / "store")
+        count = migrate_pickle(legacy_file, store, model=args.model)
+        print(f"✅ Migrated {count} embeddings to {store.directory}")
+
+    elif args.command == 'info':
+        store = open_store(args.cache_dir, namespace=args.namespace)
+        if not store.exists():
+            print(f"❌ No embedding store in {args.cache_dir}")
+            return
+        metadata = store.read_metadata()
+        print(f"📦 {store.directory}")
+        print(f"   Version: {metadata['version']}")
+        print(f"   Model: {metadata.get('model')}")
+        print(f"   Videos: {metadata['count']} × {metadata['dim']} ({metadata['dtype']})")
+        frame_counts = metadata['columns'].get('frame_count', [])
+        if metadata.get('frames_file'):
+            print(f"   Frames: {sum(frame_counts)} "
+                  f"({sum(1 for c in frame_counts if c)} videos with per-frame embeddings)")
+        print(f"   Aggregation: {metadata.get('aggregation', DEFAULT_AGGREGATION)}")
+        if metadata.get('sampling'):
+            sampling = {k: v for k, v in metadata['sampling'].items() if k != 'intro'}
+            print(f"   Sampling: {', '.join(f'{k}={v}' for k, v in sampling.items())}")
+            if 'intro' in metadata['sampling']:
+                intro_frames = metadata['columns'].get('intro_frames', [])
+                print(f"   Intro skipped: {sum(1 for n in intro_frames if n)} videos "
+                      f"({len(metadata['sampling']['intro']['hashes'])} reference hashes)")
+        print(f"   Channels: {len(set(metadata['columns']['channel']))}")
+        print(f"   Written: {metadata['created']}")
+
+    elif args.command == 'aggregate':
+        store = open_store(args.cache_dir, namespace=args.namespace)
+        if not store.exists():
+            print(f"❌ No embedding store in {args.cache_dir}")
+            return
+        start = time.perf_counter()
+        embeddings = store.aggregated(args.aggregation)
+        print(f"✅ {args.aggregation} embeddings for {len(embeddings)} videos "
+              f"ready in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    elif args.command == 'namespaces':
+        _migrate_flat_layout(Path(args.cache_dir), args.model)
+        namespaces = list_namespaces(args.cache_dir)
+        if not namespaces:
+            print(f"❌ No embedding namespaces in {args.cache_dir}")
+            return
+        print(f"📦 {len(namespaces)} embedding namespaces in {Path(args.cache_dir) / NAMESPACES_DIR_NAME}:")
+        for namespace in namespaces:
+            directory = namespace_dir(args.cache_dir, namespace)
+            metadata = EmbeddingStore(directory / "store").read_metadata()
+            print(f"   {namespace}")
+            print(f"      {metadata['count']} videos, {metadata.get('model')}, "
+                  f"{_directory_size(directory) / (1024 * 1024):.1f} MB, written {metadata['created']}")
+
+    elif args.command == 'prune':
+        namespaces = list_namespaces(args.cache_dir)
+        if args.keep:
+            if args.keep not in namespaces:
+                print(f"❌ No namespace {args.keep} in {args.cache_dir}")
+                return
+            doomed = [namespace for namespace in namespaces if namespace != args.keep]
+        elif args.namespace:
+            if args.namespace not in namespaces:
+                print(f"❌ No namespace {args.namespace} in {args.cache_dir}")
+                return
+            doomed = [args.namespace]
+        else:
+            print("❌ Pass --namespace <name> to remove, or --keep <name> to remove all others")
+            return
+        for namespace in doomed:
+            directory = namespace_dir(args.cache_dir, namespace)
+            size = _directory_size(directory)
+            shutil.rmtree(directory)
+            print(f"🗑️  Removed {namespace} ({size / (1024 * 1024):.1f} MB)")
+        print(f"✅ Pruned {len(doomed)} namespaces")
+
+
+if __name__ == "__main__":
+    main()
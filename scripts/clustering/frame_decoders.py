@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Pluggable frame decoders for the video clusterer.
+
+Every backend takes a video path plus the frame indices to sample and returns
+(frame_index, RGB uint8 array) pairs, so VideoClusterer doesn't care how the
+frames were decoded:
+
+    opencv-seek     cap.set(CAP_PROP_POS_FRAMES) per frame (original behaviour)
+    opencv          one sequential grab() pass, retrieve() only sampled frames
+    pyav            PyAV with threaded decoding, seeks only across large gaps
+    pyav-keyframes  PyAV decoding only the keyframe nearest each sample
+    ffmpeg          ffmpeg rawvideo pipe, scaled to CLIP resolution in ffmpeg
+"""
+
+import shutil
+import subprocess
+import importlib.util
+
+import cv2
+import numpy as np
+
+# Re-exported: the extension list lives with discovery, which must not need cv2
+from video_discovery import VIDEO_EXTENSIONS, discover_videos
+
+# PyAV is imported by the PyAV decoders only when they are used
+PYAV_AVAILABLE = importlib.util.find_spec('av') is not None
+
+# CLIP ViT-B/32 resizes the short side to 224px before center-cropping
+CLIP_INPUT_SIZE = 224
+
+DEFAULT_DECODER = 'opencv'
+
+
+def sample_frame_indices(total_frames, num_frames, start_frame=0):
+    """Evenly spaced frame indices from `start_frame` to the end of the video."""
+    if total_frames <= start_frame:
+        return np.array([], dtype=int)
+    return np.linspace(start_frame, total_frames - 1, num_frames, dtype=int)
+
+
+def decode_sampled_frames(decoder, video_path, num_frames=5):
+    """Decode `num_frames` evenly spaced frames. Returns [(frame_index, rgb_frame), ...]."""
+    return decode_timed_frames(decoder, video_path, num_frames)[0]
+
+
+def decode_timed_frames(decoder, video_path, num_frames=5, start_frame=0, info=None):
+    """
+    Decode `num_frames` evenly spaced frames (from `start_frame` on) along with their timestamps.
+
+    Returns ([(frame_index, rgb_frame), ...], timestamps in seconds). Videos
+    without a usable frame rate get their frame indices as timestamps.
+    """
+    info = info or decoder.probe(video_path)
+    if info['frame_count'] == 0:
+        return [], np.array([], dtype=np.float32)
+    frames = decoder.read_frames(video_path, sample_frame_indices(info['frame_count'], num_frames, start_frame))
+    return frames, frame_timestamps(frames, info['fps'])
+
+
+def frame_timestamps(frames, fps):
+    """Timestamps in seconds of decoded (frame_index, frame) pairs."""
+    indices = np.array([idx for idx, _ in frames], dtype=np.float32)
+    return indices / fps if fps > 0 else indices
+
+
+def scaled_size(width, height, short_side):
+    """Output (width, height) with the short side scaled to `short_side`, kept even."""
+    if not short_side or min(width, height) <= short_side:
+        return width, height
+    scale = short_side / min(width, height)
+    return (max(2, int(round(width * scale / 2)) * 2),
+            max(2, int(round(height * scale / 2)) * 2))
+
+
+class FrameDecoder:
+    """Base class: probe a video and read a set of frames from it."""
+
+    name = None
+
+    def __init__(self, short_side=None):
+        # Downscale decoded frames so their short side is `short_side` (None = full resolution)
+        self.short_side = short_side
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    def probe(self, video_path):
+        """Return frame count, fps and frame size of a video."""
+        cap = cv2.VideoCapture(str(video_path))
+        try:
+            return {
+                'frame_count': int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+                'fps': cap.get(cv2.CAP_PROP_FPS) or 0.0,
+                'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            }
+        finally:
+            cap.release()
+
+    def read_frames(self, video_path, frame_indices):
+        """Return [(frame_index, rgb_frame), ...] for the requested indices, in order."""
+        raise NotImplementedError
+
+    def _resize(self, frame):
+        if not self.short_side:
+            return frame
+        height, width = frame.shape[:2]
+        size = scaled_size(width, height, self.short_side)
+        if size == (width, height):
+            return frame
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+    @staticmethod
+    def _expand(decoded, frame_indices):
+        """Map decoded {index: frame} back onto the requested (possibly repeated) indices."""
+        return [(int(idx), decoded[int(idx)]) for idx in frame_indices if int(idx) in decoded]
+
+
+class OpenCVSeekDecoder(FrameDecoder):
+    """Original behaviour: one seek + decode-from-keyframe per sampled frame."""
+
+    name = 'opencv-seek'
+
+    def read_frames(self, video_path, frame_indices):
+        cap = cv2.VideoCapture(str(video_path))
+        decoded = {}
+        try:
+            for idx in sorted(set(int(i) for i in frame_indices)):
+                cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+                ret, frame = cap.read()
+                if ret:
+                    decoded[idx] = self._resize(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        finally:
+            cap.release()
+        return self._expand(decoded, frame_indices)
+
+
+class OpenCVSequentialDecoder(FrameDecoder):
+    """Single forward pass: grab() every frame, retrieve() and convert only the sampled ones."""
+
+    name = 'opencv'
+
+    def read_frames(self, video_path, frame_indices):
+        wanted = set(int(i) for i in frame_indices)
+        if not wanted:
+            return []
+        last = max(wanted)
+
+        cap = cv2.VideoCapture(str(video_path))
+        decoded = {}
+        try:
+            idx = 0
+            while idx <= last and cap.grab():
+                if idx in wanted:
+                    ret, frame = cap.retrieve()
+                    if ret:
+                        decoded[idx] = self._resize(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                idx += 1
+        finally:
+            cap.release()
+        return self._expand(decoded, frame_indices)
+
+
+class PyAVDecoder(FrameDecoder):
+    """PyAV with codec threading; seeks to the preceding keyframe only across large gaps."""
+
+    name = 'pyav'
+    keyframes_only = False
+
+    # Gaps shorter than this many seconds are decoded through instead of seeking
+    seek_gap_seconds = 2.0
+
+    @classmethod
+    def is_available(cls):
+        return PYAV_AVAILABLE
+
+    def probe(self, video_path):
+        import av
+
+        with av.open(str(video_path)) as container:
+            stream = container.streams.video[0]
+            fps = float(stream.average_rate or stream.guessed_rate or 0)
+            frame_count = stream.frames
+            if not frame_count and stream.duration and fps:
+                frame_count = int(stream.duration * stream.time_base * fps)
+            if not frame_count and container.duration and fps:
+                frame_count = int(container.duration / av.time_base * fps)
+            return {
+                'frame_count': int(frame_count or 0),
+                'fps': fps,
+                'width': stream.codec_context.width,
+                'height': stream.codec_context.height,
+            }
+
+    def _to_rgb(self, frame):
+        width, height = scaled_size(frame.width, frame.height, self.short_side)
+        return frame.to_ndarray(format='rgb24', width=width, height=height)
+
+    def read_frames(self, video_path, frame_indices):
+        import av
+
+        targets = sorted(set(int(i) for i in frame_indices))
+        if not targets:
+            return []
+
+        decoded = {}
+        with av.open(str(video_path)) as container:
+            stream = container.streams.video[0]
+            stream.thread_type = 'AUTO'
+            fps = float(stream.average_rate or stream.guessed_rate or 0)
+            if fps <= 0:
+                return []
+            start_time = float(stream.start_time * stream.time_base) if stream.start_time else 0.0
+
+            if self.keyframes_only:
+                stream.codec_context.skip_frame = 'NONKEY'
+                decoded = self._read_keyframes(container, stream, fps, start_time, targets)
+                # Reported at the keyframe's own index, which can be a GOP before the requested one
+                return [decoded[int(idx)] for idx in frame_indices if int(idx) in decoded]
+
+            position = -1
+            pending = list(targets)
+            while pending:
+                target = pending[0]
+                if target - position > self.seek_gap_seconds * fps:
+                    container.seek(int((start_time + target / fps) / stream.time_base),
+                                   stream=stream, backward=True, any_frame=False)
+                found = False
+                for frame in container.decode(stream):
+                    if frame.pts is None:
+                        continue
+                    position = int(round((float(frame.pts * stream.time_base) - start_time) * fps))
+                    while pending and position >= pending[0]:
+                        decoded[pending.pop(0)] = self._to_rgb(frame)
+                        found = True
+                    if found:
+                        break
+                if not found:
+                    break
+
+        return self._expand(decoded, frame_indices)
+
+    def _read_keyframes(self, container, stream, fps, start_time, targets):
+        """Decode the keyframe at or before each target: {target: (keyframe index, frame)}."""
+        decoded = {}
+        for target in targets:
+            container.seek(int((start_time + target / fps) / stream.time_base),
+                           stream=stream, backward=True, any_frame=False)
+            for frame in container.decode(stream):
+                if frame.pts is None:
+                    continue
+                position = max(0, int(round((float(frame.pts * stream.time_base) - start_time) * fps)))
+                decoded[target] = (position, self._to_rgb(frame))
+                break
+        return decoded
+
+
+class PyAVKeyframeDecoder(PyAVDecoder):
+    """Keyframe-only PyAV decoding: fastest, but samples land on the nearest preceding keyframe."""
+
+    name = 'pyav-keyframes'
+    keyframes_only = True
+
+
+class FFmpegPipeDecoder(FrameDecoder):
+    """ffmpeg selects and scales the sampled frames, streaming rawvideo RGB over a pipe."""
+
+    name = 'ffmpeg'
+
+    def __init__(self, short_side=CLIP_INPUT_SIZE):
+        super().__init__(short_side=short_side)
+
+    @classmethod
+    def is_available(cls):
+        return shutil.which('ffmpeg') is not None
+
+    def read_frames(self, video_path, frame_indices):
+        targets = sorted(set(int(i) for i in frame_indices))
+        if not targets:
+            return []
+
+        info = self.probe(video_path)
+        width, height = scaled_size(info['width'], info['height'], self.short_side)
+        if width <= 0 or height <= 0:
+            return []
+
+        select = '+'.join(f'eq(n\\,{idx})' for idx in targets)
+        cmd = [
+            'ffmpeg', '-v', 'error', '-nostdin', '-threads', '0',
+            '-i', str(video_path),
+            '-vf', f"select='{select}',scale={width}:{height}:flags=area",
+            '-vsync', '0',
+            '-frames:v', str(len(targets)),
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24', 'pipe:1',
+        ]
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+        if result.returncode != 0 and not result.stdout:
+            raise RuntimeError(result.stderr.decode(errors='replace').strip() or 'ffmpeg failed')
+
+        frame_bytes = width * height * 3
+        count = len(result.stdout) // frame_bytes
+        frames = np.frombuffer(result.stdout, dtype=np.uint8, count=count * frame_bytes)
+        frames = frames.reshape(count, height, width, 3)
+
+        decoded = {idx: frames[i] for i, idx in enumerate(targets[:count])}
+        return self._expand(decoded, frame_indices)
+
+
+DECODERS = {
+    decoder.name: decoder
+    for decoder in (OpenCVSeekDecoder, OpenCVSequentialDecoder, PyAVDecoder,
+                    PyAVKeyframeDecoder, FFmpegPipeDecoder)
+}
+
+
+def available_decoders():
+    """Names of decoders whose dependencies are installed."""
+    return [name for name, decoder in DECODERS.items() if decoder.is_available()]
+
+
+def get_decoder(name=DEFAULT_DECODER, **kwargs):
+    """Instantiate a decoder by name, falling back to the default when unavailable."""
+    if name not in DECODERS:
+        raise ValueError(f"Unknown decoder '{name}'. Choose from: {', '.join(DECODERS)}")
+
+    decoder = DECODERS[name]
+    if not decoder.is_available():
+        hint = "pip install av" if decoder in (PyAVDecoder, PyAVKeyframeDecoder) else "install ffmpeg"
+        print(f"⚠️  Decoder '{name}' not available ({hint}), falling back to '{DEFAULT_DECODER}'")
+        decoder = DECODERS[DEFAULT_DECODER]
+    return decoder(**kwargs)
+
+
+def find_videos(root, cache_dir="video_embeddings_cache"):
+    """List video files in the channel folders below `root` (channels/<channel>/.../<video>), sorted."""
+    return [video_info['path'] for video_info in discover_videos(root, cache_dir, min_depth=1)]
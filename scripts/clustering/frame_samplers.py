@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Frame sampling strategies: which frames of a video are sent to CLIP.
+
+    uniform   `num_frames` evenly spaced frames (original behaviour)
+    scene     cheap change detection on tiny frames, one representative frame
+              per detected scene, between `min_frames` and `max_frames`
+
+Both samplers can skip a shared intro (see intro_detection.py): sampling then
+starts at the first frame after it, and the number of skipped frames is
+returned with the frames so it can be stored per video.
+
+The scene sampler decodes a denser set of candidate frames at CLIP resolution,
+compares 16x16 luma thumbnails and luma histograms of consecutive candidates,
+and cuts a scene wherever the difference exceeds `threshold`. A static clip
+ends up with `min_frames` CLIP passes; a busy montage gets one per scene.
+
+Samplers are picklable so decoder processes can run them.
+"""
+
+import cv2
+import numpy as np
+
+from frame_decoders import CLIP_INPUT_SIZE, decode_timed_frames, frame_timestamps, sample_frame_indices
+
+SAMPLERS = ['uniform', 'scene']
+DEFAULT_SAMPLER = 'uniform'
+
+# Thumbnail used for change detection
+SIGNATURE_SIZE = 16
+HISTOGRAM_BINS = 32
+
+
+class FrameSampler:
+    """Base class: pick the frames of a video that are sent to CLIP."""
+
+    name = None
+
+    def __init__(self, intro=None):
+        # IntroReference of a shared intro to skip, or None
+        self.intro = intro
+
+    def describe(self):
+        """Settings recorded with the embeddings, so a run can be reproduced."""
+        settings = {'sampler': self.name, **self._settings()}
+        if self.intro:
+            settings['intro'] = self.intro.to_dict()
+        return settings
+
+    def sample(self, decoder, video_path):
+        """
+        Return ([(frame_index, rgb_frame), ...], timestamps in seconds, details),
+        where details holds per-video facts to store, like 'intro_frames'.
+        """
+        info = decoder.probe(video_path)
+        if info['frame_count'] == 0:
+            return [], np.array([], dtype=np.float32), {}
+        details = {}
+        start_frame = 0
+        if self.intro is not None:
+            start_frame = details['intro_frames'] = self.intro.intro_frames(decoder, video_path, info)
+        frames, timestamps = self._sample(decoder, video_path, info, start_frame)
+        return frames, timestamps, details
+
+    def _settings(self):
+        return {}
+
+    def _sample(self, decoder, video_path, info, start_frame):
+        raise NotImplementedError
+
+
+class UniformSampler(FrameSampler):
+    """Evenly spaced frames across the whole video."""
+
+    name = 'uniform'
+
+    def __init__(self, num_frames=5, intro=None):
+        super().__init__(intro)
+        self.num_frames = num_frames
+
+    def _settings(self):
+        return {'num_frames': self.num_frames}
+
+    def _sample(self, decoder, video_path, info, start_frame):
+        return decode_timed_frames(decoder, video_path, self.num_frames, start_frame, info)
+
+
+def frame_signature(frame):
+    """Tiny luma thumbnail plus normalized luma histogram of an RGB frame."""
+    luma = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+    thumbnail = cv2.resize(luma, (SIGNATURE_SIZE, SIGNATURE_SIZE), interpolation=cv2.INTER_AREA)
+    histogram = np.bincount((luma >> 3).ravel(), minlength=HISTOGRAM_BINS).astype(np.float32)
+    return thumbnail.astype(np.float32) / 255.0, histogram / histogram.sum()
+
+
+def change_scores(signatures):
+    """Difference in [0, 1] between each pair of consecutive signatures."""
+    thumbnails = np.stack([s[0] for s in signatures])
+    histograms = np.stack([s[1] for s in signatures])
+    luma_change = np.abs(np.diff(thumbnails, axis=0)).mean(axis=(1, 2))
+    histogram_change = 0.5 * np.abs(np.diff(histograms, axis=0)).sum(axis=1)
+    return 0.5 * (luma_change + histogram_change)
+
+
+def pick_representatives(scores, threshold, min_frames, max_frames):
+    """
+    Split candidates into scenes at scores above `threshold` and return the
+    candidate positions to keep: the middle of each scene. With more than
+    `max_frames` scenes only the strongest cuts are kept; with fewer than
+    `min_frames`, the spare frames go to the longest scenes and are spread
+    evenly within them.
+    """
+    num_candidates = len(scores) + 1
+    cuts = np.flatnonzero(scores > threshold)
+    if len(cuts) >= max_frames:
+        cuts = np.sort(cuts[np.argsort(-scores[cuts], kind='stable')[:max_frames - 1]])
+    bounds = np.concatenate([[0], cuts + 1, [num_candidates]])
+    scenes = list(zip(bounds[:-1], bounds[1:]))
+
+    allocation = [1] * len(scenes)
+    for _ in range(min(min_frames, num_candidates) - len(scenes)):
+        # Next frame to the scene with the most candidates per allocated frame
+        best = max(range(len(scenes)), key=lambda i: (scenes[i][1] - scenes[i][0]) / allocation[i])
+        allocation[best] += 1
+
+    picks = []
+    for (start, end), count in zip(scenes, allocation):
+        picks.extend(start + ((np.arange(count) + 0.5) * (end - start) / count).astype(int))
+    return sorted(set(int(p) for p in picks))
+
+
+class SceneSampler(FrameSampler):
+    """One representative frame per detected scene, within min/max bounds."""
+
+    name = 'scene'
+
+    def __init__(self, min_frames=2, max_frames=12, threshold=0.12, candidates_per_second=2.0,
+                 max_candidates=48, intro=None):
+        super().__init__(intro)
+        self.min_frames = min_frames
+        self.max_frames = max_frames
+        self.threshold = threshold
+        self.candidates_per_second = candidates_per_second
+        self.max_candidates = max_candidates
+
+    def _settings(self):
+        return {'min_frames': self.min_frames, 'max_frames': self.max_frames, 'threshold': self.threshold,
+                'candidates_per_second': self.candidates_per_second, 'max_candidates': self.max_candidates}
+
+    def _sample(self, decoder, video_path, info, start_frame):
+        # Candidates only need CLIP resolution; decoding them at full size would waste memory
+        if not decoder.short_side or decoder.short_side > CLIP_INPUT_SIZE:
+            decoder = type(decoder)(short_side=CLIP_INPUT_SIZE)
+
+        remaining_frames = info['frame_count'] - start_frame
+        duration = remaining_frames / info['fps'] if info['fps'] > 0 else 0
+        num_candidates = int(np.clip(round(duration * self.candidates_per_second),
+                                     self.max_frames, self.max_candidates))
+        candidates = decoder.read_frames(video_path, np.unique(
+            sample_frame_indices(info['frame_count'], num_candidates, start_frame)))
+        if len(candidates) <= self.min_frames:
+            frames = candidates
+        else:
+            scores = change_scores([frame_signature(frame) for _, frame in candidates])
+            frames = [candidates[i] for i in pick_representatives(scores, self.threshold,
+                                                                  self.min_frames, self.max_frames)]
+
+        return frames, frame_timestamps(frames, info['fps'])
+
+
+def get_sampler(name=DEFAULT_SAMPLER, num_frames=5, intro=None, **kwargs):
+    """Instantiate a sampler by name; `num_frames` applies to the uniform sampler."""
+    if name not in SAMPLERS:
+        raise ValueError(f"Unknown sampler '{name}'. Choose from: {', '.join(SAMPLERS)}")
+    if name == 'uniform':
+        return UniformSampler(num_frames, intro=intro)
+    return SceneSampler(intro=intro, **{k: v for k, v in kwargs.items() if v is not None})
+
+
+def sampler_from_settings(settings):
+    """
+    Rebuild the sampler recorded by describe() (None: the original 5 uniform
+    frames). Raises ValueError if the record names an unknown sampler or setting.
+    """
+    from intro_detection import IntroReference
+
+    settings = dict(settings or {'sampler': 'uniform', 'num_frames': 5})
+    name = settings.pop('sampler', None)
+    intro = settings.pop('intro', None)
+    if name not in SAMPLERS:
+        raise ValueError(f"Unknown sampler '{name}'. Choose from: {', '.join(SAMPLERS)}")
+    try:
+        intro = IntroReference.from_dict(intro) if intro else None
+        sampler_class = UniformSampler if name == 'uniform' else SceneSampler
+        return sampler_class(intro=intro, **settings)
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Can't rebuild the {name} sampler from {settings}: {e}")
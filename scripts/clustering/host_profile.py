@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Per-host embedding throughput settings, found by timed trials.
+
+The fastest CLIP batch size, number of decoder processes and torch intra-op
+thread count differ a lot between laptops and the build server.
+`advanced_video_clusterer.py autotune` embeds a sample of the real collection
+under a series of settings, each trial in a fresh process so peak memory is
+measured per trial. It keeps the fastest configuration under a memory ceiling
+and saves it to video_embeddings_cache/host_profiles/<hostname>.json.
+
+Later runs on the same host load the profile automatically for any of
+--batch-size, --decode-workers and --threads not given on the command line.
+
+The search tunes one setting at a time (threads, then decoder workers, then
+batch size), keeping the best value found so far for the others.
+"""
+
+import os
+import sys
+import json
+import socket
+import random
+from datetime import datetime
+from pathlib import Path
+
+from memory_budget import peak_rss_mb, run_isolated
+
+PROFILE_DIR_NAME = "host_profiles"
+
+# Settings a profile provides (argparse dests of advanced_video_clusterer.py)
+TUNED_SETTINGS = ('batch_size', 'decode_workers', 'threads')
+
+BATCH_SIZE_CANDIDATES = [16, 32, 64, 128, 256]
+
+# Videos embedded per trial (one more is used to warm up)
+DEFAULT_SAMPLE_SIZE = 12
+
+
+def host_name():
+    return socket.gethostname().split('.')[0] or 'localhost'
+
+
+def profile_path(cache_dir, host=None):
+    return Path(cache_dir) / PROFILE_DIR_NAME / f"{host or host_name()}.json"
+
+
+def total_memory_mb():
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def load_host_profile(cache_dir, backend=None):
+    """This host's saved profile, or None (also if it was tuned for another backend)."""
+    path = profile_path(cache_dir)
+    if not path.exists():
+        return None
+    with open(path, 'r') as f:
+        profile = json.load(f)
+    if backend and profile.get('backend') != backend:
+        return None
+    return profile
+
+
+def apply_host_profile(args, cache_dir, backend, defaults):
+    """
+    Fill the tuned settings left unset (None) in `args` from this host's
+    profile, else from `defaults`. Returns the profile used, or None.
+    """
+    profile = load_host_profile(cache_dir, backend)
+    tuned = profile['settings'] if profile else {}
+    for key in TUNED_SETTINGS:
+        if getattr(args, key, None) is None:
+            setattr(args, key, tuned.get(key, defaults.get(key)))
+    if profile:
+        print(f"🎛️  Host profile {profile['host']} ({profile['created']}): batch size {args.batch_size}, "
+              f"{args.decode_workers} decode workers, {args.threads} threads")
+    return profile
+
+
+def save_host_profile(profile, cache_dir):
+    path = profile_path(cache_dir, profile['host'])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(profile, f, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _power_of_two_steps(low, high):
+    values = {low, high}
+    value = 1
+    while value < high:
+        if value >= low:
+            values.add(value)
+        value *= 2
+    return sorted(values)
+
+
+def candidate_settings(cpus):
+    """Values tried for each setting on a host with `cpus` cores."""
+    return {
+        'threads': _power_of_two_steps(1, cpus),
+        # Runs decode under a timeout, which always uses at least one worker
+        'decode_workers': _power_of_two_steps(1, max(1, cpus - 1)),
+        'batch_size': BATCH_SIZE_CANDIDATES,
+    }
+
+
+def _trial(video_infos, cache_dir, backend, decoder, sampler, settings, video_timeout):
+    """One timed run in a fresh process. The first video only warms up decoder and model."""
+    import time
+    import resource
+
+    # Keep the parent's table readable
+    sys.stdout = open(os.devnull, 'w')
+    sys.stderr = sys.stdout
+    from advanced_video_clusterer import VideoClusterer
+
+    clusterer = VideoClusterer(cache_dir=cache_dir, decoder=decoder, backend=backend, sampler=sampler,
+                               threads=settings['threads'])
+    clusterer.compute_frame_embeddings_batched(video_infos[:1], batch_size=settings['batch_size'])
+
+    start = time.perf_counter()
+    results = clusterer.compute_frame_embeddings_batched(
+        video_infos[1:], batch_size=settings['batch_size'], decode_workers=settings['decode_workers'],
+        video_timeout=video_timeout
+    )
+    elapsed = time.perf_counter() - start
+
+    # Decoder workers are children: count the largest one once per worker
+    worker_peak_mb = peak_rss_mb(resource.RUSAGE_CHILDREN)
+    frames = sum(len(result[0]) for result in results if result is not None)
+    return {
+        **settings,
+        'videos': len(video_infos) - 1,
+        'frames': frames,
+        'seconds': elapsed,
+        'frames_per_sec': frames / elapsed if elapsed > 0 else 0.0,
+        'peak_rss_mb': peak_rss_mb() + worker_peak_mb * max(1, settings['decode_workers']),
+    }
+
+
+def autotune(clusterer, sample_size=DEFAULT_SAMPLE_SIZE, max_rss_mb=None, video_timeout=None, seed=0):
+    """
+    Time embedding settings on a sample of the clusterer's videos and save the
+    fastest within `max_rss_mb` (default: half the machine's memory) as this
+    host's profile. Returns the profile, or None if no trial fit.
+    """
+    videos = clusterer.video_files or clusterer.find_all_videos()
+    if len(videos) < 2:
+        print("❌ Need at least 2 videos to autotune")
+        return None
+    sample = random.Random(seed).sample(videos, min(len(videos), sample_size + 1))
+    cpus = os.cpu_count() or 1
+    memory_mb = total_memory_mb()
+    if max_rss_mb is None and memory_mb:
+        max_rss_mb = memory_mb / 2
+
+    print(f"🎛️  Autotuning on {len(sample) - 1} videos ({cpus} cores"
+          + (f", memory ceiling {max_rss_mb:.0f} MB" if max_rss_mb else "") + ")")
+    print(f"\n{'Threads':>8}{'Workers':>9}{'Batch':>7}{'Frames/s':>10}{'Peak RSS (MB)':>15}")
+    print("-" * 49)
+
+    trials = {}
+
+    def fits(trial):
+        return max_rss_mb is None or trial['peak_rss_mb'] <= max_rss_mb
+
+    def run(settings):
+        key = tuple(settings[k] for k in TUNED_SETTINGS)
+        if key not in trials:
+            trial = run_isolated(_trial, sample, str(clusterer.cache_dir), clusterer.backend, clusterer.decoder.name,
+                                 clusterer.sampler, settings, video_timeout)
+            trials[key] = trial
+            print(f"{trial['threads']:>8}{trial['decode_workers']:>9}{trial['batch_size']:>7}"
+                  f"{trial['frames_per_sec']:>10.1f}{trial['peak_rss_mb']:>15.0f}"
+                  + ("" if fits(trial) else "  ⚠️ over ceiling"))
+        return trials[key]
+
+    candidates = candidate_settings(cpus)
+    best = {'threads': cpus, 'decode_workers': 1, 'batch_size': 64}
+    for key in ('threads', 'decode_workers', 'batch_size'):
+        for value in candidates[key]:
+            run({**best, key: value})
+        fitting = [trial for trial in trials.values() if fits(trial)]
+        if fitting:
+            fastest = max(fitting, key=lambda trial: trial['frames_per_sec'])
+            best = {k: fastest[k] for k in TUNED_SETTINGS}
+
+    fitting = [trial for trial in trials.values() if fits(trial)]
+    if not fitting:
+        print(f"\n❌ No configuration stayed under {max_rss_mb:.0f} MB")
+        return None
+    fastest = max(fitting, key=lambda trial: trial['frames_per_sec'])
+
+    profile = {
+        'host': host_name(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'cpu_count': cpus,
+        'memory_mb': round(memory_mb) if memory_mb else None,
+        'max_rss_mb': round(max_rss_mb) if max_rss_mb else None,
+        'backend': clusterer.backend,
+        'decoder': clusterer.decoder.name,
+        'sampling': clusterer.sampler.describe(),
+        'sample_videos': len(sample) - 1,
+        'settings': {k: fastest[k] for k in TUNED_SETTINGS},
+        'frames_per_sec': round(fastest['frames_per_sec'], 2),
+        'trials': list(trials.values()),
+    }
+    path = save_host_profile(profile, clusterer.cache_dir)
+    print(f"\n✅ Fastest: batch size {fastest['batch_size']}, {fastest['decode_workers']} decode workers, "
+          f"{fastest['threads']} threads ({fastest['frames_per_sec']:.1f} frames/s)")
+    print(f"💾 Saved host profile to {path}")
+    return profile
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Detect the shared CRT intro at the start of generated videos.
+
+Every Veo prompt opens on the same CRT broadcast poster, so the first second
+of most videos looks alike and pulls their embeddings together. An intro
+reference is a small set of perceptual hashes of that poster; a video starts
+with the intro when its first frames match the reference, and sampling begins
+at the first frame after it.
+
+The reference is built once from the collection: the opening seconds of many
+videos are hashed, and the prefix shared by at least `min_share` of them
+becomes the reference. It is saved to the cache directory so later runs
+(and the embedding store metadata) use exactly the same intro definition.
+
+Usage:
+    python3 intro_detection.py build --channels-dir channels
+    python3 intro_detection.py show
+    python3 intro_detection.py check channels/Some_Channel/video.mp4
+"""
+
+import json
+import argparse
+from pathlib import Path
+
+import numpy as np
+from tqdm import tqdm
+
+from frame_decoders import DEFAULT_DECODER, find_videos, get_decoder
+from perceptual_hash import from_hex, hamming_distance, is_flat, phash, to_hex
+
+INTRO_REFERENCE_NAME = "intro_reference.json"
+
+# Thumbnails are all pHash needs
+PROBE_SHORT_SIDE = 64
+
+
+class IntroReference:
+    """Perceptual hashes of a shared intro and how videos are matched against them."""
+
+    def __init__(self, hashes, max_distance=10, window_seconds=3.0, probe_interval=0.25):
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+        self.max_distance = max_distance
+        self.window_seconds = window_seconds
+        self.probe_interval = probe_interval
+
+    def __bool__(self):
+        return len(self.hashes) > 0
+
+    def to_dict(self):
+        return {
+            'hashes': [to_hex(h) for h in self.hashes],
+            'max_distance': self.max_distance,
+            'window_seconds': self.window_seconds,
+            'probe_interval': self.probe_interval,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls([from_hex(h) for h in data['hashes']], data['max_distance'],
+                   data['window_seconds'], data['probe_interval'])
+
+    def probe_indices(self, info):
+        """Frame indices checked at the start of a video."""
+        fps = info['fps'] or 25.0
+        window = min(info['frame_count'], int(self.window_seconds * fps))
+        return np.arange(0, window, max(1, int(round(self.probe_interval * fps))))
+
+    def matches(self, frame_hash):
+        return bool(len(self.hashes)) and hamming_distance(frame_hash, self.hashes).min() <= self.max_distance
+
+    def intro_frames(self, decoder, video_path, info=None):
+        """
+        Number of leading frames that belong to the intro (0 if the video doesn't
+        start with it). Flat frames (fades, black) around the intro count as intro.
+        """
+        if not self:
+            return 0
+        info = info or decoder.probe(video_path)
+        indices = self.probe_indices(info)
+        if len(indices) == 0:
+            return 0
+
+        probe_decoder = type(decoder)(short_side=PROBE_SHORT_SIDE)
+        matched = False
+        for idx, frame in probe_decoder.read_frames(video_path, indices):
+            if is_flat(frame):
+                continue
+            if self.matches(phash(frame)):
+                matched = True
+                continue
+            return idx if matched else 0
+
+        # The whole window looks like intro: skip it, but never the whole video
+        end = int(indices[-1]) + 1
+        return end if matched and end < info['frame_count'] else 0
+
+
+def opening_hashes(decoder, video_path, reference):
+    """pHashes of the probe frames at the start of a video (None for flat frames)."""
+    probe_decoder = type(decoder)(short_side=PROBE_SHORT_SIDE)
+    indices = reference.probe_indices(probe_decoder.probe(video_path))
+    return [None if is_flat(frame) else phash(frame) for _, frame in probe_decoder.read_frames(video_path, indices)]
+
+
+def _shared_hashes(hashes, max_distance, min_support, limit):
+    """Greedily pick hashes that at least `min_support` of the given (one per video) are near."""
+    near = hamming_distance(hashes[:, None], hashes[None, :]) <= max_distance
+    support = near.sum(axis=1)
+    selected = []
+    available = support >= min_support
+    while available.any() and len(selected) < limit:
+        best = int(np.argmax(np.where(available, support, -1)))
+        selected.append(hashes[best])
+        available &= ~near[best]
+    return selected
+
+
+def build_intro_reference(video_paths, decoder=None, sample_videos=200, min_share=0.2, max_hashes=16,
+                          **reference_kwargs):
+    """
+    Find the opening shared by at least `min_share` of (a sample of) the videos.
+
+    Probe positions are walked from the start: at each one, hashes shared by
+    enough of the videos still in their intro join the reference, and videos
+    whose frame matches none of them have left the intro. Content that merely
+    recurs later in videos is never part of the reference.
+
+    Returns an IntroReference, empty if no shared intro was found.
+    """
+    decoder = decoder or get_decoder(DEFAULT_DECODER)
+    reference = IntroReference([], **reference_kwargs)
+    video_paths = list(video_paths)
+    if len(video_paths) > sample_videos:
+        video_paths = [video_paths[i] for i in np.linspace(0, len(video_paths) - 1, sample_videos, dtype=int)]
+
+    openings = []
+    for video_path in tqdm(video_paths, desc="Hashing video openings", leave=False):
+        try:
+            # Leading flat frames (fade-in from black) come before the intro
+            hashes = opening_hashes(decoder, video_path, reference)
+            while hashes and hashes[0] is None:
+                hashes.pop(0)
+            openings.append(hashes)
+        except Exception as e:
+            print(f"❌ Error reading {Path(video_path).name}: {e}")
+    min_support = max(3, int(np.ceil(min_share * len(video_paths))))
+
+    selected = []
+    in_intro = [hashes for hashes in openings if hashes]
+    position = 0
+    while len(in_intro) >= min_support and len(selected) < max_hashes:
+        current = [hashes for hashes in in_intro if position < len(hashes) and hashes[position] is not None]
+        if len(current) < min_support:
+            break
+        frame_hashes = np.array([hashes[position] for hashes in current], dtype=np.uint64)
+        shared = _shared_hashes(frame_hashes, reference.max_distance, min_support, max_hashes - len(selected))
+        if not shared:
+            break
+        selected.extend(shared)
+        still = hamming_distance(frame_hashes[:, None], np.array(shared, dtype=np.uint64)[None, :]).min(axis=1)
+        in_intro = [hashes for hashes, distance in zip(current, still) if distance <= reference.max_distance]
+        position += 1
+
+    # Drop near-duplicates picked at different positions (a static poster repeats)
+    unique = []
+    for frame_hash in selected:
+        if not unique or hamming_distance(frame_hash, np.array(unique)).min() > reference.max_distance // 2:
+            unique.append(frame_hash)
+    reference.hashes = np.array(unique, dtype=np.uint64)
+    return reference
+
+
+def load_intro_reference(cache_dir):
+    """The saved intro reference of a cache directory, or None."""
+    reference_file = Path(cache_dir) / INTRO_REFERENCE_NAME
+    if not reference_file.exists():
+        return None
+    with open(reference_file, 'r') as f:
+        return IntroReference.from_dict(json.load(f))
+
+
+def save_intro_reference(reference, cache_dir, source=None):
+    reference_file = Path(cache_dir) / INTRO_REFERENCE_NAME
+    reference_file.parent.mkdir(parents=True, exist_ok=True)
+    data = reference.to_dict()
+    if source:
+        data['source'] = source
+    with open(reference_file, 'w') as f:
+        json.dump(data, f, indent=2)
+    return reference_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the shared-intro reference")
+    parser.add_argument("command", choices=['build', 'show', 'check'], help="Command to run")
+    parser.add_argument("video", nargs='?', help="Video to check (check command)")
+    parser.add_argument("--channels-dir", default="channels", help="Directory containing video channels")
+    parser.add_argument("--cache-dir", default="video_embeddings_cache", help="Embedding cache directory")
+    parser.add_argument("--decoder", default=DEFAULT_DECODER, help=f"Frame decoder (default: {DEFAULT_DECODER})")
+    parser.add_argument("--min-share", type=float, default=0.2,
+                       help="Fraction of videos that must share an opening frame (default: 0.2)")
+    parser.add_argument("--sample-videos", type=int, default=200,
+                       help="Videos hashed to build the reference (default: 200)")
+
+    args = parser.parse_args()
+    decoder = get_decoder(args.decoder)
+
+    if args.command == 'build':
+        video_paths = find_videos(args.channels_dir, args.cache_dir)
+        if not video_paths:
+            print(f"❌ No videos found in {args.channels_dir}")
+            return
+        print(f"🔍 Looking for a shared intro in {min(len(video_paths), args.sample_videos)} videos...")
+        reference = build_intro_reference(video_paths, decoder, sample_videos=args.sample_videos,
+                                          min_share=args.min_share)
+        if not reference:
+            print("⚠️  No shared intro found")
+        reference_file = save_intro_reference(reference, args.cache_dir, source=str(args.channels_dir))
+        print(f"✅ Saved {len(reference.hashes)} intro hashes to {reference_file}")
+        return
+
+    reference = load_intro_reference(args.cache_dir)
+    if reference is None:
+        print(f"❌ No intro reference in {args.cache_dir}. Run: python3 intro_detection.py build")
+        return
+
+    if args.command == 'show':
+        print(f"📦 {Path(args.cache_dir) / INTRO_REFERENCE_NAME}")
+        print(f"   Hashes: {', '.join(to_hex(h) for h in reference.hashes) or '(none)'}")
+        print(f"   Match: ≤ {reference.max_distance} bits, first {reference.window_seconds}s "
+              f"every {reference.probe_interval}s")
+
+    elif args.command == 'check':
+        if not args.video:
+            print("❌ Pass a video to check")
+            return
+        info = decoder.probe(args.video)
+        intro = reference.intro_frames(decoder, args.video, info)
+        seconds = intro / info['fps'] if info['fps'] else 0
+        print(f"🎬 {Path(args.video).name}: " + (f"intro of {intro} frames ({seconds:.2f}s)" if intro else "no intro"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Memory budget for embedding runs (--memory-budget).
+
+The budget covers this process plus its live decoder processes. While usage
+is above HIGH_WATER of the budget, the embedding loop encodes what it has
+right away, halves its CLIP batch, and stops handing new videos to the
+decoders until usage drops again. Below LOW_WATER the batch grows back.
+
+The run also traces Python/numpy allocations (tracemalloc). A snapshot is
+taken each time usage reaches a new high, so the report at the end lists the
+largest allocators at the peak, not only what is still alive at the end.
+Allocations made by torch itself are not traced.
+
+When embedding_daemon.py does the encoding, the budget is sent along with
+each request and applies to the daemon process and its decoders. The daemon
+returns its summary() with the reply, and the client's report() prints those
+numbers next to its own.
+
+Also home to the peak-RSS helpers the autotuner and the benchmarks share
+(peak_rss_mb, run_isolated).
+"""
+
+import sys
+import resource
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Fractions of the budget where throttling starts and stops
+HIGH_WATER = 0.9
+LOW_WATER = 0.7
+
+# New usage highs closer than this to the last snapshot don't take another one
+SNAPSHOT_GROWTH = 1.05
+
+TOP_ALLOCATIONS = 8
+
+_PAGE_MB = resource.getpagesize() / (1024 * 1024)
+
+
+def rss_mb(pid='self'):
+    """Current resident set size of a process in MB, or None where /proc isn't available."""
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_MB
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """Peak RSS in MB of this process, or of the largest finished child with RUSAGE_CHILDREN."""
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_isolated(func, *args):
+    """Run a trial in a fresh process so its peak RSS is its own."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(func, *args).result()
+
+
+class MemoryBudget:
+    """Usage of this process and its decoder processes against a budget in MB."""
+
+    def __init__(self, budget_mb):
+        self.budget_mb = budget_mb
+        self.peak_mb = 0.0
+        self.throttled = 0
+        self.smallest_batch = None
+        self._snapshot = None
+        self._snapshot_mb = 0.0
+        self._tracing = False
+        # summary() of each embedding daemon request made with this budget
+        self._remote = []
+
+    def __getstate__(self):
+        # Sent to the daemon: it measures its own process, from scratch
+        return {'budget_mb': self.budget_mb}
+
+    def __setstate__(self, state):
+        self.__init__(state['budget_mb'])
+
+    def start(self):
+        """Trace allocations, unless someone else already does (then they keep control of it)."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+
+    def stop(self):
+        """Stop tracing if this budget started it."""
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def usage_mb(self):
+        own = rss_mb()
+        if own is None:
+            # No /proc: the peak is an upper bound of current usage
+            return peak_rss_mb()
+        usage = own + sum(rss_mb(child.pid) or 0 for child in multiprocessing.active_children())
+        if usage > self.peak_mb:
+            self.peak_mb = usage
+            if tracemalloc.is_tracing() and usage > self._snapshot_mb * SNAPSHOT_GROWTH:
+                self._snapshot = tracemalloc.take_snapshot()
+                self._snapshot_mb = usage
+        return usage
+
+    def over(self):
+        return self.usage_mb() > self.budget_mb * HIGH_WATER
+
+    def has_headroom(self):
+        """For the decoder pipeline: may another video be handed out?"""
+        return self.usage_mb() <= self.budget_mb * HIGH_WATER
+
+    def relaxed(self):
+        return self.usage_mb() < self.budget_mb * LOW_WATER
+
+    def throttle(self, batch_size):
+        """Note one throttling step and return the smaller batch size to use."""
+        self.throttled += 1
+        batch_size = max(1, batch_size // 2)
+        self.smallest_batch = min(self.smallest_batch or batch_size, batch_size)
+        return batch_size
+
+    def absorb(self, summary):
+        """Keep the summary() an embedding daemon returned for a request."""
+        self._remote.append(summary)
+
+    def summary(self):
+        """Peak memory, throttling and top allocators at the peak, as a plain dict."""
+        self.usage_mb()
+        summary = {
+            'peak_mb': self.peak_mb,
+            'process_peak_mb': peak_rss_mb(),
+            'worker_peak_mb': peak_rss_mb(resource.RUSAGE_CHILDREN),
+            'throttled': self.throttled,
+            'smallest_batch': self.smallest_batch,
+            'snapshot_mb': self._snapshot_mb,
+            'traced_peak_mb': tracemalloc.get_traced_memory()[1] / (1024 * 1024) if tracemalloc.is_tracing() else 0.0,
+            'top_allocations': [],
+        }
+        if self._snapshot is not None:
+            snapshot = self._snapshot.filter_traces([
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+                tracemalloc.Filter(False, tracemalloc.__file__),
+            ])
+            summary['top_allocations'] = [
+                {'size_mb': stat.size / (1024 * 1024), 'file': stat.traceback[0].filename,
+                 'line': stat.traceback[0].lineno, 'blocks': stat.count}
+                for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+            ]
+        return summary
+
+    def report(self):
+        """Print peak memory, throttling and the top Python allocators at the peak (also the daemon's)."""
+        self._print_summary(self.summary(), "this process")
+        if self._remote:
+            # The request that came closest to the budget, with throttling over all of them
+            daemon = dict(max(self._remote, key=lambda summary: summary['peak_mb']))
+            daemon['throttled'] = sum(summary['throttled'] for summary in self._remote)
+            batches = [summary['smallest_batch'] for summary in self._remote if summary['smallest_batch']]
+            daemon['smallest_batch'] = min(batches) if batches else None
+            requests = len(self._remote)
+            self._print_summary(daemon, "embedding daemon" + (f", {requests} requests" if requests > 1 else ""))
+        self.stop()
+        self._snapshot = None
+
+    def _print_summary(self, summary, where):
+        print(f"🧠 Peak memory {summary['peak_mb']:.0f} MB of {self.budget_mb:.0f} MB budget ({where}: "
+              f"process {summary['process_peak_mb']:.0f} MB peak"
+              + (f", largest decoder process {summary['worker_peak_mb']:.0f} MB"
+                 if summary['worker_peak_mb'] else "") + ")")
+        if summary['throttled']:
+            print(f"   Throttled {summary['throttled']} times, CLIP batch down to {summary['smallest_batch']}")
+        if summary['top_allocations']:
+            print(f"   Top allocators at {summary['snapshot_mb']:.0f} MB "
+                  f"(traced peak {summary['traced_peak_mb']:.0f} MB):")
+            for allocation in summary['top_allocations']:
+                print(f"   {allocation['size_mb']:8.1f} MB  {allocation['file']}:{allocation['line']} "
+                      f"({allocation['blocks']} blocks)")
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Offline near-duplicate index for the video collection.
+
+Each video gets a signature of perceptual hashes (see perceptual_hash.py) of
+evenly spaced frames after the shared intro. Re-encoded, rescaled or re-uploaded
+copies of a video land within a few bits at every position, while different
+videos don't.
+
+Comparing every pair of videos would be quadratic, so hashes are bucketed with
+LSH banding: each 64-bit hash is cut into bands, and videos that share any band
+value at any position become candidate pairs. Only candidates are compared
+frame by frame. Confirmed pairs (and byte-identical copies, which share a
+fingerprint) are merged into groups with union-find. Each group keeps one
+canonical file: highest resolution, then longest, then largest.
+
+The index is saved to video_embeddings_cache/near_duplicates.json. The
+clusterer (--skip-duplicates), the embedding export and the Stream upload skip
+non-canonical files. Signatures are cached by fingerprint, so rebuilding only
+hashes new files.
+
+Usage:
+    python3 near_duplicates.py build --channels-dir channels
+    python3 near_duplicates.py show
+"""
+
+import json
+import argparse
+from collections import defaultdict
+from datetime import datetime
+from itertools import combinations
+from pathlib import Path
+
+import numpy as np
+from tqdm import tqdm
+
+from duplicate_index import DUPLICATE_INDEX_NAME, DuplicateIndex, load_duplicate_index
+from frame_decoders import DEFAULT_DECODER, find_videos, get_decoder, sample_frame_indices
+from intro_detection import load_intro_reference
+from perceptual_hash import from_hex, hamming_distance, is_flat, phash, to_hex
+from video_discovery import VideoManifest
+
+INDEX_VERSION = 1
+
+# Frames hashed per video, and the thumbnail size they are decoded at
+SIGNATURE_FRAMES = 8
+HASH_SHORT_SIDE = 64
+
+# 4 bands of 16 bits: hashes within 3 bits always share a band
+LSH_BANDS = 4
+
+# Bands shared by more videos than this carry no information (e.g. a common title card)
+MAX_BUCKET_SIZE = 64
+
+
+class UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, item):
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    def groups(self):
+        members = defaultdict(list)
+        for item in range(len(self.parent)):
+            members[self.find(item)].append(item)
+        return [group for group in members.values() if len(group) > 1]
+
+
+def video_signature(decoder, video_path, num_frames=SIGNATURE_FRAMES, intro=None):
+    """
+    Perceptual hashes of `num_frames` evenly spaced frames after the intro.
+
+    Returns a dict with 'hashes' (hex strings, None for flat frames and frames
+    that still look like the intro) and the video's width, height and duration.
+    """
+    hash_decoder = type(decoder)(short_side=HASH_SHORT_SIDE)
+    info = hash_decoder.probe(video_path)
+    start_frame = intro.intro_frames(hash_decoder, video_path, info) if intro else 0
+    indices = sample_frame_indices(info['frame_count'], num_frames, start_frame)
+
+    hashes = [None] * num_frames
+    for position, (_, frame) in enumerate(hash_decoder.read_frames(video_path, indices)):
+        if is_flat(frame):
+            continue
+        frame_hash = phash(frame)
+        if intro is None or not intro.matches(frame_hash):
+            hashes[position] = to_hex(frame_hash)
+
+    return {
+        'hashes': hashes,
+        'width': info['width'],
+        'height': info['height'],
+        'duration': round(info['frame_count'] / info['fps'], 3) if info['fps'] else 0.0,
+    }
+
+
+def _hash_matrix(signatures, num_frames):
+    """(videos, num_frames) uint64 hashes and a mask of the positions that have one."""
+    hashes = np.zeros((len(signatures), num_frames), dtype=np.uint64)
+    valid = np.zeros((len(signatures), num_frames), dtype=bool)
+    for row, signature in enumerate(signatures):
+        for position, value in enumerate(signature['hashes'][:num_frames]):
+            if value is not None:
+                hashes[row, position] = from_hex(value)
+                valid[row, position] = True
+    return hashes, valid
+
+
+def lsh_candidates(hashes, valid, bands=LSH_BANDS, max_bucket_size=MAX_BUCKET_SIZE):
+    """Pairs of rows sharing at least one band value of any frame hash."""
+    rows, _ = np.nonzero(valid)
+    values = hashes[valid]
+    band_bits = 64 // bands
+    mask = np.uint64((1 << band_bits) - 1)
+
+    pairs = set()
+    skipped_buckets = 0
+    for band in range(bands):
+        band_values = (values >> np.uint64(band * band_bits)) & mask
+        buckets = defaultdict(set)
+        for row, value in zip(rows.tolist(), band_values.tolist()):
+            buckets[value].add(row)
+        for members in buckets.values():
+            if len(members) > max_bucket_size:
+                skipped_buckets += 1
+            elif len(members) > 1:
+                pairs.update(combinations(sorted(members), 2))
+    return pairs, skipped_buckets
+
+
+def signature_similarity(hashes, valid, a, b, max_distance):
+    """
+    Fraction of the frame positions both videos have a hash for that match
+    within `max_distance` bits, and how many positions were compared.
+    """
+    both = valid[a] & valid[b]
+    compared = int(both.sum())
+    if compared == 0:
+        return 0.0, 0
+    distances = hamming_distance(hashes[a][both], hashes[b][both])
+    return float(np.mean(distances <= max_distance)), compared
+
+
+def canonical_order(video):
+    """Sort key: highest resolution, then longest, then largest file, then path."""
+    return (-video['width'] * video['height'], -video['duration'], -video['size_bytes'], video['path'])
+
+
+def find_duplicate_groups(videos, num_frames=SIGNATURE_FRAMES, max_distance=10, min_similarity=0.75,
+                          min_frames=3, bands=LSH_BANDS):
+    """
+    Group near-duplicate videos.
+
+    `videos` are dicts with path, fingerprint, size_bytes and a signature
+    (hashes, width, height, duration). Two videos are duplicates when at least
+    `min_similarity` of at least `min_frames` compared positions match within
+    `max_distance` bits, or when they share a fingerprint.
+
+    Returns (groups, stats) where each group is a list of (video index,
+    similarity to the group's canonical video) with the canonical video first.
+    """
+    hashes, valid = _hash_matrix(videos, num_frames)
+    candidates, skipped_buckets = lsh_candidates(hashes, valid, bands)
+
+    union_find = UnionFind(len(videos))
+    by_fingerprint = defaultdict(list)
+    for row, video in enumerate(videos):
+        by_fingerprint[video['fingerprint']].append(row)
+    for rows in by_fingerprint.values():
+        for row in rows[1:]:
+            union_find.union(rows[0], row)
+
+    confirmed = 0
+    for a, b in candidates:
+        similarity, compared = signature_similarity(hashes, valid, a, b, max_distance)
+        if compared >= min_frames and similarity >= min_similarity:
+            union_find.union(a, b)
+            confirmed += 1
+
+    groups = []
+    for members in union_find.groups():
+        members.sort(key=lambda row: canonical_order(videos[row]))
+        canonical = members[0]
+        groups.append([(row, 1.0 if videos[row]['fingerprint'] == videos[canonical]['fingerprint']
+                        else signature_similarity(hashes, valid, canonical, row, max_distance)[0])
+                       for row in members])
+    groups.sort(key=lambda group: videos[group[0][0]]['path'])
+
+    stats = {'videos': len(videos), 'candidate_pairs': len(candidates), 'confirmed_pairs': confirmed,
+             'skipped_buckets': skipped_buckets}
+    return groups, stats
+
+
+def build_duplicate_index(video_paths, cache_dir="video_embeddings_cache", decoder=None,
+                          num_frames=SIGNATURE_FRAMES, max_distance=10, min_similarity=0.75):
+    """
+    Hash the videos (reusing cached signatures by fingerprint), group
+    near-duplicates and save the index. Returns the DuplicateIndex.
+    """
+    decoder = decoder or get_decoder(DEFAULT_DECODER)
+    intro = load_intro_reference(cache_dir)
+    settings = {'num_frames': num_frames, 'max_distance': max_distance, 'min_similarity': min_similarity,
+                'bands': LSH_BANDS, 'intro': intro.to_dict() if intro else None}
+
+    previous = load_duplicate_index(cache_dir)
+    cached_signatures = {}
+    if previous and {k: previous.data['settings'].get(k) for k in ('num_frames', 'intro')} == \
+            {k: settings[k] for k in ('num_frames', 'intro')}:
+        cached_signatures = previous.data.get('signatures', {})
+
+    videos = []
+    for path in video_paths:
+        stat = Path(path).stat()
+        videos.append({'path': str(path), 'size_bytes': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+    # Fingerprints come from the discovery manifest when the file is unchanged
+    manifest = VideoManifest(cache_dir)
+    manifest.fingerprint(videos)
+    manifest.save()
+
+    hashed = 0
+    signatures = {}
+    for video in tqdm(videos, desc="Hashing frames", leave=False):
+        signature = cached_signatures.get(video['fingerprint']) or signatures.get(video['fingerprint'])
+        if signature is None:
+            try:
+                signature = video_signature(decoder, video['path'], num_frames, intro)
+                hashed += 1
+            except Exception as e:
+                print(f"❌ Error hashing {Path(video['path']).name}: {e}")
+                signature = {'hashes': [None] * num_frames, 'width': 0, 'height': 0, 'duration': 0.0}
+        signatures[video['fingerprint']] = signature
+        video.update(signature)
+
+    groups, stats = find_duplicate_groups(videos, num_frames, max_distance, min_similarity)
+    stats['hashed'] = hashed
+
+    def entry(row, similarity=None):
+        video = videos[row]
+        item = {'path': video['path'], 'fingerprint': video['fingerprint'],
+                'width': video['width'], 'height': video['height'], 'duration': video['duration']}
+        if similarity is not None:
+            item['similarity'] = round(similarity, 3)
+        return item
+
+    data = {
+        'version': INDEX_VERSION,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'settings': settings,
+        'stats': stats,
+        'groups': [{'canonical': entry(group[0][0]),
+                    'duplicates': [entry(row, similarity) for row, similarity in group[1:]]}
+                   for group in groups],
+        'signatures': signatures,
+    }
+    index_file = Path(cache_dir) / DUPLICATE_INDEX_NAME
+    index_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = index_file.with_suffix('.json.tmp')
+    with open(tmp_file, 'w') as f:
+        json.dump(data, f, indent=2)
+    tmp_file.replace(index_file)
+    return DuplicateIndex(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find near-duplicate videos with perceptual hashes")
+    parser.add_argument("command", choices=['build', 'show'], help="Command to run")
+    parser.add_argument("--channels-dir", default="channels", help="Directory containing video channels")
+    parser.add_argument("--cache-dir", default="video_embeddings_cache", help="Embedding cache directory")
+    parser.add_argument("--decoder", default=DEFAULT_DECODER, help=f"Frame decoder (default: {DEFAULT_DECODER})")
+    parser.add_argument("--frames", type=int, default=SIGNATURE_FRAMES,
+                       help=f"Frames hashed per video (default: {SIGNATURE_FRAMES})")
+    parser.add_argument("--max-distance", type=int, default=10,
+                       help="Bits two frame hashes may differ by and still match (default: 10)")
+    parser.add_argument("--min-similarity", type=float, default=0.75,
+                       help="Fraction of frames that must match (default: 0.75)")
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        video_paths = find_videos(args.channels_dir, args.cache_dir)
+        if not video_paths:
+            print(f"❌ No videos found in {args.channels_dir}")
+            return
+        print(f"🔍 Indexing {len(video_paths)} videos for near-duplicates...")
+        index = build_duplicate_index(video_paths, args.cache_dir, get_decoder(args.decoder), args.frames,
+                                      args.max_distance, args.min_similarity)
+        stats = index.data['stats']
+        print(f"✅ Hashed {stats['hashed']} new videos; {stats['candidate_pairs']} LSH candidate pairs, "
+              f"{stats['confirmed_pairs']} confirmed")
+        if stats['skipped_buckets']:
+            print(f"⚠️  Ignored {stats['skipped_buckets']} overcrowded LSH buckets")
+        duplicates = sum(len(group['duplicates']) for group in index.groups)
+        print(f"📊 {len(index.groups)} duplicate groups, {duplicates} non-canonical files "
+              f"({Path(args.cache_dir) / DUPLICATE_INDEX_NAME})")
+        return
+
+    index = load_duplicate_index(args.cache_dir)
+    if index is None:
+        print(f"❌ No near-duplicate index in {args.cache_dir}. Run: python3 near_duplicates.py build")
+        return
+
+    if args.command == 'show':
+        print(f"📦 {len(index.groups)} duplicate groups (built {index.data['created_at']})")
+        for group in index.groups:
+            canonical = group['canonical']
+            print(f"\n   ✅ {canonical['path']} ({canonical['width']}x{canonical['height']}, "
+                  f"{canonical['duration']:.1f}s)")
+            for duplicate in group['duplicates']:
+                print(f"   🔁 {duplicate['path']} ({duplicate['width']}x{duplicate['height']}, "
+                      f"{100 * duplicate['similarity']:.0f}% frames match)")
+
+
+if __name__ == "__main__":
+    main()
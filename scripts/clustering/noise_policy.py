@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+What happens to videos HDBSCAN leaves as noise (label -1).
+
+    nearest-neighbor   join the cluster of the nearest clustered video
+                       (original behaviour of assign_all)
+    nearest-centroid   join the cluster whose centroid is nearest, so a
+                       stray video follows the bulk of a channel rather than
+                       one member on its edge
+    keep               stay noise (-1)
+
+Distances are euclidean in the 5-D UMAP space. All noise points are resolved
+in one query (a KD-tree over the clustered videos, or a noise × clusters
+distance matrix for the centroids) instead of one distance call per video.
+If nothing was clustered, the labels are left as they are.
+"""
+
+import numpy as np
+
+NOISE_POLICIES = ['nearest-neighbor', 'nearest-centroid', 'keep']
+DEFAULT_NOISE_POLICY = 'nearest-neighbor'
+
+
+def cluster_centroids(points, labels):
+    """(cluster ids, mean point of each cluster), noise excluded."""
+    clustered = labels != -1
+    cluster_ids, inverse = np.unique(labels[clustered], return_inverse=True)
+    sums = np.zeros((len(cluster_ids), points.shape[1]))
+    np.add.at(sums, inverse, points[clustered])
+    return cluster_ids, sums / np.bincount(inverse)[:, None]
+
+
+def reassign_noise(labels, points, policy=DEFAULT_NOISE_POLICY, reference=None, reference_labels=None):
+    """
+    Labels with the noise among `points` resolved by `policy`.
+
+    Args:
+        labels: Label per point, -1 for noise
+        points: Reduced coordinates of the points
+        reference, reference_labels: Clustered videos to assign to (default:
+            the points themselves); noise in the reference is ignored
+
+    Returns:
+        A new label array
+    """
+    if policy not in NOISE_POLICIES:
+        raise ValueError(f"Unknown noise policy '{policy}'. Choose from: {', '.join(NOISE_POLICIES)}")
+    labels = np.array(labels)
+    noise = labels == -1
+    if reference is None:
+        reference, reference_labels = points, labels
+    reference_labels = np.asarray(reference_labels)
+    clustered = reference_labels != -1
+    if policy == 'keep' or not np.any(noise) or not np.any(clustered):
+        return labels
+
+    if policy == 'nearest-centroid':
+        from sklearn.metrics.pairwise import euclidean_distances
+
+        cluster_ids, centroids = cluster_centroids(np.asarray(reference), reference_labels)
+        labels[noise] = cluster_ids[np.argmin(euclidean_distances(points[noise], centroids), axis=1)]
+    else:
+        from sklearn.neighbors import KDTree
+
+        _, nearest = KDTree(np.asarray(reference)[clustered]).query(points[noise], k=1)
+        labels[noise] = reference_labels[clustered][nearest[:, 0]]
+    return labels
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+64-bit perceptual hashes (pHash) for video frames.
+
+The hash keeps the signs of the lowest 8x8 DCT frequencies of a 32x32
+grayscale thumbnail relative to their median, so re-encodes, rescales and mild
+colour shifts of the same picture land within a few bits of each other.
+Hashes are uint64 numpy scalars/arrays; hamming_distance broadcasts.
+"""
+
+import cv2
+import numpy as np
+
+HASH_SIZE = 8
+THUMBNAIL_SIZE = 32
+
+# Frames with less luma variation than this have no structure to hash (black, white, flat fades)
+FLAT_STD = 8.0
+
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+_BIT_WEIGHTS = np.uint64(1) << np.arange(HASH_SIZE * HASH_SIZE, dtype=np.uint64)
+
+
+def _luma(frame):
+    return frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+
+
+def is_flat(frame):
+    """True for frames without enough structure to hash meaningfully."""
+    return float(_luma(frame).std()) < FLAT_STD
+
+
+def phash(frame):
+    """pHash of an RGB (or grayscale) uint8 frame as a np.uint64."""
+    thumbnail = cv2.resize(_luma(frame), (THUMBNAIL_SIZE, THUMBNAIL_SIZE), interpolation=cv2.INTER_AREA)
+    low = cv2.dct(thumbnail.astype(np.float32))[:HASH_SIZE, :HASH_SIZE]
+    # The DC term only encodes brightness, so it doesn't vote on the median
+    bits = (low > np.median(low.ravel()[1:])).ravel()
+    return np.bitwise_or.reduce(_BIT_WEIGHTS[bits], initial=np.uint64(0))
+
+
+def hamming_distance(a, b):
+    """Number of differing bits between (broadcastable arrays of) hashes."""
+    diff = np.ascontiguousarray(np.bitwise_xor(np.asarray(a, dtype=np.uint64), np.asarray(b, dtype=np.uint64)))
+    return _POPCOUNT[diff.view(np.uint8)].reshape(diff.shape + (8,)).sum(axis=-1)
+
+
+def to_hex(value):
+    return f"{int(value):016x}"
+
+
+def from_hex(text):
+    return np.uint64(int(text, 16))
@@ -7,7 +7,6 @@ This works with already-uploaded videos on Cloudflare Stream.
 import os
 import sys
 import json
-import pickle
 import numpy as np
 from pathlib import Path
 from collections import defaultdict
@@ -15,32 +14,37 @@ from collections import defaultdict
 # Import the clusterer
 sys.path.insert(0, str(Path(__file__).parent))
 from advanced_video_clusterer import VideoClusterer
+from embedding_store import open_store
+from video_thumbnails import export_sprite_sheets
 
-def recluster_and_update_json(cache_file="video_embeddings_cache/video_embeddings.pkl",
+def recluster_and_update_json(cache_dir="video_embeddings_cache",
                                channels_json="channels_clustered_stream.json",
                                upload_results="docs/new_videos_upload_results.json",
-                               min_cluster_size=7):
+                               min_cluster_size=7, sprites=False, namespace=None):
     """
     Recluster videos using cached embeddings and update JSON configuration.
     
     Args:
-        cache_file: Path to cached embeddings
+        cache_dir: Directory with the cached embedding store
         channels_json: Path to channels JSON file
         upload_results: Path to upload results JSON
         min_cluster_size: Minimum cluster size for HDBSCAN
+        sprites: Also export per-channel thumbnail sprite sheets next to the public JSON
+        namespace: Embedding namespace to cluster (default: the only one in cache_dir)
     """
     
     # Load existing embeddings
-    cache_path = Path(cache_file)
-    if not cache_path.exists():
-        print(f"❌ No cached embeddings found at {cache_file}")
+    try:
+        store = open_store(cache_dir, namespace=namespace)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+    if not store.exists():
+        print(f"❌ No cached embeddings found in {cache_dir}")
         return
     
     print("📦 Loading cached embeddings...")
-    with open(cache_path, 'rb') as f:
-        cached_data = pickle.load(f)
-        video_files = cached_data['video_files']
-        embeddings = cached_data['embeddings']
+    video_files, embeddings = store.load()
     
     print(f"✅ Loaded {len(video_files)} videos with embeddings")
     
@@ -73,7 +77,7 @@ def recluster_and_update_json(cache_file="video_embeddings_cache/video_embedding
         print(f"✅ Added {len(upload_data)} newly uploaded videos")
     
     # Initialize clusterer
-    clusterer = VideoClusterer()
+    clusterer = VideoClusterer(cache_dir=cache_dir, namespace=store.directory.parent.name)
     clusterer.video_files = video_files
     clusterer.embeddings = embeddings
     
@@ -149,6 +153,10 @@ def recluster_and_update_json(cache_file="video_embeddings_cache/video_embedding
     with open(public_file, 'w') as f:
         json.dump(channels_data, f, indent=2)
     
+    if sprites:
+        print("\n🖼️  Building channel sprite sheets...")
+        export_sprite_sheets(channels_data, video_files, cache_dir, public_file)
+    
     # Generate summary
     print("\n" + "="*60)
     print("📊 Reclustering Summary")
@@ -174,22 +182,28 @@ def main():
     import argparse
     
     parser = argparse.ArgumentParser(description='Recluster videos and update JSON')
-    parser.add_argument('--cache-file', default='video_embeddings_cache/video_embeddings.pkl',
-                       help='Path to cached embeddings')
+    parser.add_argument('--cache-dir', default='video_embeddings_cache',
+                       help='Directory with cached embeddings (default: video_embeddings_cache)')
     parser.add_argument('--channels-json', default='channels_clustered_stream.json',
                        help='Path to channels JSON file')
     parser.add_argument('--upload-results', default='docs/new_videos_upload_results.json',
                        help='Path to upload results JSON')
     parser.add_argument('--min-cluster-size', type=int, default=7,
                        help='Minimum cluster size (default: 7)')
+    parser.add_argument('--namespace', default=None,
+                       help='Embedding namespace (default: the only one in the cache directory)')
+    parser.add_argument('--sprites', action='store_true',
+                       help='Export channel thumbnail sprite sheets next to the public JSON')
     
     args = parser.parse_args()
     
     recluster_and_update_json(
-        args.cache_file,
+        args.cache_dir,
         args.channels_json,
         args.upload_results,
-        args.min_cluster_size
+        args.min_cluster_size,
+        sprites=args.sprites,
+        namespace=args.namespace
     )
 
 if __name__ == '__main__':
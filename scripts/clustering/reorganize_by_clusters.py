@@ -16,6 +16,7 @@ from tqdm import tqdm
 
 # Import clustering from main script
 from advanced_video_clusterer import VideoClusterer
+from embedding_store import resolve_namespace
 
 
 def reorganize_videos(clusterer, output_dir="channels_clustered", mode='copy'):
@@ -130,6 +131,8 @@ def main():
                        help="Minimum cluster size for re-clustering (default: 30)")
     parser.add_argument("--recluster", action="store_true",
                        help="Re-run clustering with new parameters")
+    parser.add_argument("--namespace", default=None,
+                       help="Embedding namespace (default: the only one in the cache directory)")
     parser.add_argument("--preview", action="store_true",
                        help="Preview reorganization without copying files")
     
@@ -137,17 +140,22 @@ def main():
     
     # Load clusterer
     print("🔧 Loading clustering results...")
-    clusterer = VideoClusterer()
-    clusterer.compute_all_embeddings()
+    try:
+        namespace = resolve_namespace("video_embeddings_cache", args.namespace)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+    clusterer = VideoClusterer(namespace=namespace)
+    clusterer.load_cached_embeddings()
     
     if args.recluster:
         print(f"\n🔄 Re-clustering with min_cluster_size={args.min_cluster_size}...")
         clusterer.cluster_videos(min_cluster_size=args.min_cluster_size)
         clusterer.visualize_clusters(save_path=f"video_clusters_size{args.min_cluster_size}.png")
         clusterer.export_cluster_report(output_file=f"cluster_analysis_size{args.min_cluster_size}.json")
-    else:
-        print("📦 Using cached clustering results...")
-        clusterer.cluster_videos(min_cluster_size=10)  # Will load from cache
+    elif not clusterer.load_cached_clustering():
+        print("⚠️  No cached clustering for these embeddings, clustering with default parameters...")
+        clusterer.cluster_videos()
     
     if args.preview:
         # Just show what would happen
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Shared video discovery for the clustering, upload and import scripts.
+
+Directories are walked with os.scandir (recursively if asked), and the
+per-file stat() calls run in a thread pool, which is what makes scans of large
+trees on network mounts fast: the time goes into round trips, not CPU.
+
+Every scan updates a manifest in the cache directory
+(video_embeddings_cache/video_manifest.json) with each directory's mtime, its
+subdirectories and its videos (size, mtime and, once computed, content
+fingerprint). A directory whose mtime hasn't changed since the last scan is
+not listed or stat'ed again: adding, removing or renaming files changes the
+directory's mtime, so only changed directories are looked at. A file
+rewritten in place doesn't touch its directory, so its manifest entry can be
+stale: whatever fingerprints videos (the embedding path, discover_videos with
+fingerprints=True, the upload's duplicate check) restats them first
+(VideoManifest.refresh), and --rescan (rescan=True) re-lists everything.
+
+Usage:
+    python3 video_discovery.py scan channels
+    python3 video_discovery.py scan channels_clustered --rescan
+"""
+
+import os
+import json
+import time
+import uuid
+import fcntl
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from video_fingerprint import resolve_partial_collisions, video_fingerprint
+
+VIDEO_EXTENSIONS = ['.mp4', '.mov', '.avi', '.mkv', '.webm']
+
+MANIFEST_NAME = "video_manifest.json"
+MANIFEST_VERSION = 1
+
+# Threads for stat() and hashing; latency-bound on network mounts, so more than cores
+DEFAULT_DISCOVERY_WORKERS = 16
+
+# Files stat'ed per thread-pool task
+STAT_BATCH_SIZE = 64
+
+# A directory modified this close to the scan may change again within the
+# mtime's resolution (seconds on some network filesystems): don't trust it next time
+RACY_MTIME_SECONDS = 2
+
+
+class VideoManifest:
+    """directory path -> {mtime_ns, subdirs, videos: {name: {size_bytes, mtime_ns, fingerprint}}}"""
+
+    def __init__(self, cache_dir="video_embeddings_cache"):
+        self.file = Path(cache_dir) / MANIFEST_NAME
+        self.directories = self._read()
+        self.stats = {'listed': 0, 'reused': 0, 'stat_calls': 0}
+        # Directories this process changed or forgot: what save() merges into the file
+        self.changed = set()
+        self.forgotten = set()
+
+    def scan(self, root, recursive=True, min_depth=0, workers=DEFAULT_DISCOVERY_WORKERS, rescan=False):
+        """
+        Find the videos under `root`, breadth first, one thread-pool round per level.
+
+        Hidden directories are skipped. With `min_depth` 1, videos directly in
+        `root` are left out (the channels/<channel>/<video> layout).
+
+        Returns:
+            [(path, entry)] sorted by path (absolute, as strings), entry being
+            the manifest record {size_bytes, mtime_ns[, fingerprint]}
+        """
+        # Plain strings: pathlib costs more than the syscalls on warm scans
+        root = os.path.abspath(root)
+        started = time.time()
+        found = []
+        visited = set()
+        level = [root]
+        depth = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while level:
+                to_stat = []
+                next_level = []
+                listings = pool.map(lambda d: _list_directory(d, self.directories.get(d), started, rescan), level)
+                for directory, (record, listed) in zip(level, listings):
+                    if record is None:
+                        continue
+                    visited.add(directory)
+                    if listed:
+                        self.directories[directory] = record
+                        self.changed.add(directory)
+                    self.stats['listed' if listed else 'reused'] += 1
+                    if recursive:
+                        next_level.extend(os.path.join(directory, name) for name in record['subdirs'])
+                    if depth < min_depth:
+                        continue
+                    names = []
+                    for name, entry in record['videos'].items():
+                        if entry is None:
+                            names.append(name)
+                        else:
+                            found.append((os.path.join(directory, name), entry))
+                    # Files of changed directories, stat'ed in parallel in batches
+                    for i in range(0, len(names), STAT_BATCH_SIZE):
+                        to_stat.append((directory, record, names[i:i + STAT_BATCH_SIZE]))
+
+                for (directory, record, names), entries in zip(to_stat, pool.map(_stat_videos, to_stat)):
+                    previous_videos = record.get('previous', {})
+                    for name, entry in zip(names, entries):
+                        if entry is None:
+                            del record['videos'][name]
+                            continue
+                        previous = previous_videos.get(name)
+                        if previous and previous.get('fingerprint') and _same_file(previous, entry):
+                            entry['fingerprint'] = previous['fingerprint']
+                        record['videos'][name] = entry
+                        found.append((os.path.join(directory, name), entry))
+                    self.stats['stat_calls'] += len(names)
+                    self.changed.add(directory)
+
+                level = next_level
+                depth += 1
+
+        # Directories that disappeared from under the root are forgotten; a
+        # non-recursive scan only looked at the root, so only it can have gone
+        prefix = root.rstrip(os.sep) + os.sep
+        for key in list(self.directories):
+            if (key == root or (recursive and key.startswith(prefix))) and key not in visited:
+                del self.directories[key]
+                self.changed.discard(key)
+                self.forgotten.add(key)
+        found.sort(key=lambda item: item[0])
+        return found
+
+    def refresh(self, video_infos, workers=DEFAULT_DISCOVERY_WORKERS):
+        """
+        refresh_stats, and bring the records of files rewritten in place up to
+        date (dropping their fingerprint) so new fingerprints get recorded.
+        """
+        refresh_stats(video_infos, workers)
+        for video_info in video_infos:
+            entry = self._entry(video_info['path'])
+            if entry and 'size_bytes' in video_info and not _same_file(entry, video_info):
+                entry.update(size_bytes=video_info['size_bytes'], mtime_ns=video_info['mtime_ns'])
+                entry.pop('fingerprint', None)
+                self.changed.add(os.path.dirname(os.path.abspath(video_info['path'])))
+
+    def fingerprint(self, video_infos, full=False, workers=DEFAULT_DISCOVERY_WORKERS):
+        """
+        Attach content fingerprints, reusing the manifest's when size and mtime
+        are unchanged and hashing the rest in parallel. Returns the number hashed.
+        """
+        to_hash = []
+        for video_info in video_infos:
+            entry = self._entry(video_info['path'])
+            if (entry and entry.get('fingerprint') and _same_file(entry, video_info)
+                    and not (full and entry['fingerprint'].startswith('p:'))):
+                video_info['fingerprint'] = entry['fingerprint']
+            else:
+                to_hash.append(video_info)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            fingerprints = pool.map(
+                lambda v: video_fingerprint(v['path'], full=full, size=v['size_bytes']), to_hash)
+            for video_info, fingerprint in zip(to_hash, fingerprints):
+                video_info['fingerprint'] = fingerprint
+
+        resolve_partial_collisions(video_infos)
+        self.record_fingerprints(video_infos)
+        return len(to_hash)
+
+    def record_fingerprints(self, video_infos):
+        """Remember fingerprints computed elsewhere for files the manifest knows."""
+        for video_info in video_infos:
+            entry = self._entry(video_info['path'])
+            if (entry and video_info.get('fingerprint') and _same_file(entry, video_info)
+                    and entry.get('fingerprint') != video_info['fingerprint']):
+                entry['fingerprint'] = video_info['fingerprint']
+                self.changed.add(os.path.dirname(os.path.abspath(video_info['path'])))
+
+    def _entry(self, path):
+        directory, name = os.path.split(os.path.abspath(path))
+        record = self.directories.get(directory)
+        return record['videos'].get(name) if record else None
+
+    def save(self):
+        """
+        Write the manifest if a scan or fingerprint changed it.
+
+        Shard processes share one manifest: under a lock, the directories this
+        process changed are merged into the file as it is now, so records
+        written by the others in the meantime are kept.
+        """
+        if not self.changed and not self.forgotten:
+            return
+        for directory in self.changed:
+            record = self.directories[directory]
+            record.pop('previous', None)
+            # Videos left unstat'ed (above min_depth) are listed again next time
+            if any(entry is None for entry in record['videos'].values()):
+                record['mtime_ns'] = None
+        self.file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.file.with_suffix('.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            directories = self._read()
+            for directory in self.forgotten:
+                directories.pop(directory, None)
+            for directory in self.changed:
+                _keep_fingerprints(self.directories[directory], directories.get(directory))
+                directories[directory] = self.directories[directory]
+            # Unique per writer: shards on other hosts may share the cache directory
+            tmp_file = self.file.with_name(f"{self.file.name}.{uuid.uuid4().hex[:12]}.tmp")
+            with open(tmp_file, 'w') as f:
+                f.write(json.dumps({'version': MANIFEST_VERSION, 'directories': directories}))
+            os.replace(tmp_file, self.file)
+        self.directories = directories
+        self.changed.clear()
+        self.forgotten.clear()
+
+    def _read(self):
+        if not self.file.exists():
+            return {}
+        with open(self.file, 'r') as f:
+            data = json.load(f)
+        return data['directories'] if data.get('version') == MANIFEST_VERSION else {}
+
+
+def _list_directory(directory, record, started, rescan):
+    """
+    (record, listed): the manifest record of `directory`, listed again unless
+    its mtime matches (record None if the directory is gone).
+    """
+    try:
+        mtime_ns = os.stat(directory).st_mtime_ns
+    except OSError:
+        return None, False
+    if record and not rescan and record['mtime_ns'] == mtime_ns:
+        return record, False
+
+    subdirs = []
+    videos = {}
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir():
+                    subdirs.append(entry.name)
+                elif os.path.splitext(entry.name)[1].lower() in VIDEO_EXTENSIONS:
+                    # Stat'ed afterwards, in parallel with the other changed directories
+                    videos[entry.name] = None
+    except OSError as e:
+        print(f"⚠️  Cannot list {directory}: {e}")
+        return None, False
+    return {
+        'mtime_ns': mtime_ns if started - mtime_ns / 1e9 > RACY_MTIME_SECONDS else None,
+        'subdirs': sorted(subdirs),
+        'videos': videos,
+        # Unchanged files keep their fingerprint
+        'previous': record['videos'] if record else {},
+    }, True
+
+
+def _stat_videos(batch):
+    directory, _, names = batch
+    entries = []
+    for name in names:
+        try:
+            stat = os.stat(os.path.join(directory, name))
+        except OSError:
+            # Removed between listing and stat
+            entries.append(None)
+            continue
+        entries.append({'size_bytes': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+    return entries
+
+
+def refresh_stats(video_infos, workers=DEFAULT_DISCOVERY_WORKERS):
+    """
+    Stat the videos again, updating size and mtime in place (a file rewritten
+    in place keeps its directory's mtime, so the manifest can't tell). A video
+    that changed loses its fingerprint; one that can no longer be stat'ed is
+    left as it is.
+    """
+    def stat(video_info):
+        try:
+            return os.stat(video_info['path'])
+        except OSError:
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for video_info, result in zip(video_infos, pool.map(stat, video_infos)):
+            if result is None:
+                continue
+            if (video_info.get('size_bytes'), video_info.get('mtime_ns')) != (result.st_size, result.st_mtime_ns):
+                video_info.pop('fingerprint', None)
+            video_info.update(size_mb=result.st_size / (1024 * 1024), size_bytes=result.st_size,
+                              mtime_ns=result.st_mtime_ns)
+
+
+def _same_file(a, b):
+    return a['size_bytes'] == b['size_bytes'] and a['mtime_ns'] == b['mtime_ns']
+
+
+def _keep_fingerprints(record, saved):
+    """Fill in fingerprints another process saved for unchanged files of `record`."""
+    if not saved:
+        return
+    for name, entry in record['videos'].items():
+        previous = saved['videos'].get(name)
+        if (entry and previous and previous.get('fingerprint') and not entry.get('fingerprint')
+                and _same_file(previous, entry)):
+            entry['fingerprint'] = previous['fingerprint']
+
+
+def video_infos_for(found, root):
+    """
+    Video dicts for VideoManifest.scan results, in the shape
+    VideoClusterer.describe_video returns, plus the 'folder' each was found in
+    relative to `root` (channel, cluster folder, ...). Paths keep the form of
+    `root` (relative stays relative).
+    """
+    prefix_length = len(os.path.abspath(root).rstrip(os.sep)) + 1
+    video_infos = []
+    for path, entry in found:
+        relative = path[prefix_length:]
+        folder, separator, _ = relative.partition(os.sep)
+        video_info = {
+            'path': Path(os.path.join(root, relative)),
+            'name': os.path.basename(relative),
+            'folder': folder if separator else '',
+            'size_mb': entry['size_bytes'] / (1024 * 1024),
+            'size_bytes': entry['size_bytes'],
+            'mtime_ns': entry['mtime_ns'],
+        }
+        if entry.get('fingerprint'):
+            video_info['fingerprint'] = entry['fingerprint']
+        video_infos.append(video_info)
+    return video_infos
+
+
+def discover_videos(root, cache_dir="video_embeddings_cache", recursive=True, min_depth=0,
+                    workers=DEFAULT_DISCOVERY_WORKERS, rescan=False, fingerprints=False):
+    """
+    Scan `root` through the manifest in `cache_dir` (see VideoManifest.scan)
+    and save it.
+
+    With `fingerprints`, the videos are stat'ed again (see VideoManifest.refresh)
+    and content fingerprints attached (cached in the manifest, new ones hashed
+    in parallel).
+
+    Returns:
+        A list of video dicts sorted by path (see video_infos_for)
+    """
+    manifest = VideoManifest(cache_dir)
+    found = manifest.scan(root, recursive=recursive, min_depth=min_depth, workers=workers, rescan=rescan)
+    video_infos = video_infos_for(found, root)
+    if fingerprints:
+        manifest.refresh(video_infos, workers=workers)
+        manifest.fingerprint(video_infos, workers=workers)
+    manifest.save()
+    return video_infos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan video folders through the discovery manifest")
+    parser.add_argument("command", choices=['scan'], help="Command to run")
+    parser.add_argument("roots", nargs='+', help="Directories to scan")
+    parser.add_argument("--cache-dir", default="video_embeddings_cache",
+                       help="Cache directory holding the manifest (default: video_embeddings_cache)")
+    parser.add_argument("--no-recursive", action="store_true", help="Only look at the top-level directory")
+    parser.add_argument("--rescan", action="store_true",
+                       help="List and stat every directory, ignoring the manifest")
+    parser.add_argument("--fingerprints", action="store_true", help="Also fingerprint new or changed videos")
+    parser.add_argument("--workers", type=int, default=DEFAULT_DISCOVERY_WORKERS,
+                       help=f"Threads for stat and hashing (default: {DEFAULT_DISCOVERY_WORKERS})")
+
+    args = parser.parse_args()
+
+    if args.command == 'scan':
+        for root in args.roots:
+            if not Path(root).is_dir():
+                print(f"❌ Directory not found: {root}")
+                continue
+            manifest = VideoManifest(args.cache_dir)
+            start = time.perf_counter()
+            found = manifest.scan(root, recursive=not args.no_recursive, workers=args.workers, rescan=args.rescan)
+            hashed = 0
+            if args.fingerprints:
+                video_infos = video_infos_for(found, root)
+                hashed = manifest.fingerprint(video_infos, workers=args.workers)
+            elapsed = time.perf_counter() - start
+            manifest.save()
+            stats = manifest.stats
+            print(f"🔍 {root}: {len(found)} videos in {elapsed:.2f}s "
+                  f"({stats['listed']} directories listed, {stats['reused']} unchanged, "
+                  f"{stats['stat_calls']} files stat'ed" + (f", {hashed} fingerprinted" if args.fingerprints else "")
+                  + ")")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Persistent list of videos that failed to decode.
+
+Videos that time out, crash a decoder or produce no frames are recorded in
+video_embeddings_cache/quarantine.json, keyed by content fingerprint, with the
+reason. Later runs skip them until the file changes (new fingerprint) or the
+quarantine is cleared.
+
+Usage:
+    python3 video_quarantine.py list
+    python3 video_quarantine.py clear
+"""
+
+import os
+import json
+import argparse
+from datetime import datetime
+from pathlib import Path
+
+QUARANTINE_NAME = "quarantine.json"
+
+
+class Quarantine:
+    """fingerprint -> {path, reason, error, seconds, quarantined_at}"""
+
+    def __init__(self, cache_dir):
+        self.file = Path(cache_dir) / QUARANTINE_NAME
+        self.entries = {}
+        if self.file.exists():
+            with open(self.file, 'r') as f:
+                self.entries = json.load(f)
+
+    def __contains__(self, fingerprint):
+        return fingerprint in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, video_info, reason, error=None, seconds=None):
+        self.entries[video_info['fingerprint']] = {
+            'path': str(video_info['path']),
+            'reason': reason,
+            'error': error,
+            'seconds': round(seconds, 2) if seconds is not None else None,
+            'quarantined_at': datetime.now().isoformat(timespec='seconds'),
+        }
+
+    def prune(self, video_infos):
+        """
+        Forget entries whose file is gone or has changed, given the videos a run
+        discovered. Files the run didn't look at are kept while they exist.
+        """
+        fingerprints = {str(v['path']): v['fingerprint'] for v in video_infos}
+        known = set(fingerprints.values())
+        stale = [fp for fp, entry in self.entries.items()
+                 if fp not in known and (entry['path'] in fingerprints or not os.path.exists(entry['path']))]
+        for fp in stale:
+            del self.entries[fp]
+        return len(stale)
+
+    def clear(self):
+        self.entries = {}
+
+    def save(self):
+        if not self.entries:
+            self.file.unlink(missing_ok=True)
+            return
+        tmp_file = self.file.with_suffix('.json.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp_file, self.file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the video quarantine")
+    parser.add_argument("command", choices=['list', 'clear'], help="Command to run")
+    parser.add_argument("--cache-dir", default="video_embeddings_cache", help="Embedding cache directory")
+
+    args = parser.parse_args()
+    quarantine = Quarantine(args.cache_dir)
+
+    if args.command == 'list':
+        if not quarantine.entries:
+            print("✅ No quarantined videos")
+            return
+        print(f"🚫 {len(quarantine)} quarantined videos:")
+        for entry in sorted(quarantine.entries.values(), key=lambda e: e['path']):
+            print(f"   {entry['reason']:<10} {entry['path']}")
+            if entry.get('error'):
+                print(f"              {entry['error']}")
+
+    elif args.command == 'clear':
+        count = len(quarantine)
+        quarantine.clear()
+        quarantine.save()
+        print(f"✅ Cleared {count} quarantined videos")
+
+
+if __name__ == "__main__":
+    main()
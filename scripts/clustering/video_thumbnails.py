@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Video thumbnails and per-channel sprite sheets for the TV apps' channel guide.
+
+Thumbnails are written during the embedding pass from the frames already
+decoded for CLIP (no second decode): one small WebP per video, keyed by content
+fingerprint, in video_embeddings_cache/thumbnails/. Sprite sheets pack the
+thumbnails of each channel into a single WebP grid next to the channel JSON,
+with the tile offsets of every video in <channels json>.sprites.json:
+
+    {
+      "tile": {"width": 160, "height": 90},
+      "channels": {
+        "01 Semantic Channel 31": {
+          "sprite": "sprites/01_semantic_channel_31.webp",
+          "width": 1600, "height": 270,
+          "videos": {"video.mp4": {"x": 0, "y": 0}, ...}
+        }
+      }
+    }
+
+Usage:
+    python3 video_thumbnails.py sprites --channels-json public/channels_clustered_stream.json
+"""
+
+import re
+import json
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+THUMBNAIL_DIR_NAME = "thumbnails"
+THUMBNAIL_WIDTH = 160
+THUMBNAIL_HEIGHT = 90
+THUMBNAIL_QUALITY = 70
+
+# Tiles per sprite-sheet row
+SPRITE_COLUMNS = 10
+
+
+class ThumbnailWriter:
+    """Writes one WebP thumbnail per video from frames decoded for CLIP. Small enough to send to workers."""
+
+    def __init__(self, cache_dir, width=THUMBNAIL_WIDTH, height=THUMBNAIL_HEIGHT, quality=THUMBNAIL_QUALITY):
+        self.output_dir = Path(cache_dir) / THUMBNAIL_DIR_NAME
+        self.width = width
+        self.height = height
+        self.quality = quality
+
+    def path_for(self, video_info):
+        return self.output_dir / f"{video_info['fingerprint']}.webp"
+
+    def write(self, frames, output_file):
+        """
+        Save the middle sampled frame, cropped to fill the tile, as WebP.
+
+        `frames` are the sampler's (frame_idx, RGB array) pairs; with intro
+        skipping the middle frame is always past the intro.
+        """
+        from PIL import Image
+
+        if not frames:
+            return False
+        image = Image.fromarray(frames[len(frames) // 2][1])
+        scale = max(self.width / image.width, self.height / image.height)
+        resized = image.resize((max(self.width, round(image.width * scale)),
+                                max(self.height, round(image.height * scale))), Image.LANCZOS)
+        left = (resized.width - self.width) // 2
+        top = (resized.height - self.height) // 2
+        thumbnail = resized.crop((left, top, left + self.width, top + self.height))
+
+        output_file = Path(output_file)
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = output_file.with_suffix('.webp.tmp')
+        thumbnail.save(tmp_file, format='WEBP', quality=self.quality, method=4)
+        tmp_file.replace(output_file)
+        return True
+
+    def write_safely(self, frames, output_file, video_name):
+        # A thumbnail is a side product: never fail the embedding because of it
+        try:
+            return self.write(frames, output_file)
+        except Exception as e:
+            print(f"⚠️  Could not write thumbnail for {video_name}: {e}")
+            return False
+
+
+def _slug(name):
+    return re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_') or 'channel'
+
+
+def sprite_metadata_path(channels_json):
+    """<name>.sprites.json next to the channel JSON."""
+    channels_json = Path(channels_json)
+    return channels_json.with_name(f"{channels_json.stem}.sprites.json")
+
+
+def build_sprite_sheets(channels_data, video_files, cache_dir, channels_json, columns=SPRITE_COLUMNS,
+                        quality=THUMBNAIL_QUALITY):
+    """
+    Pack each channel's thumbnails into a sprite sheet next to `channels_json`.
+
+    Channel videos are matched to their fingerprint (and so their thumbnail) by
+    filename through `video_files` (the embedding store rows). Videos without a
+    thumbnail are left out of the sheets.
+
+    Returns:
+        (metadata_file, sprite_count, missing) where missing lists filenames
+        without a thumbnail
+    """
+    from PIL import Image
+
+    thumbnail_dir = Path(cache_dir) / THUMBNAIL_DIR_NAME
+    fingerprint_by_name = {video['name']: video['fingerprint'] for video in video_files if video.get('fingerprint')}
+    output_dir = Path(channels_json).parent
+    sprite_dir = output_dir / "sprites"
+    sprite_dir.mkdir(parents=True, exist_ok=True)
+
+    metadata = {'tile': None, 'channels': {}}
+    missing = []
+    for channel in channels_data['channels']:
+        tiles = []
+        for video in channel['videos']:
+            fingerprint = fingerprint_by_name.get(video['filename'])
+            thumbnail_file = thumbnail_dir / f"{fingerprint}.webp" if fingerprint else None
+            if thumbnail_file is None or not thumbnail_file.exists():
+                missing.append(video['filename'])
+                continue
+            tiles.append((video['filename'], thumbnail_file))
+        if not tiles:
+            continue
+
+        with Image.open(tiles[0][1]) as first:
+            tile_width, tile_height = first.size
+        metadata['tile'] = {'width': tile_width, 'height': tile_height}
+        grid_columns = min(columns, len(tiles))
+        grid_rows = int(np.ceil(len(tiles) / grid_columns))
+        sheet = Image.new('RGB', (grid_columns * tile_width, grid_rows * tile_height))
+
+        offsets = {}
+        for position, (filename, thumbnail_file) in enumerate(tiles):
+            x = (position % grid_columns) * tile_width
+            y = (position // grid_columns) * tile_height
+            with Image.open(thumbnail_file) as thumbnail:
+                sheet.paste(thumbnail.convert('RGB').resize((tile_width, tile_height)), (x, y))
+            offsets[filename] = {'x': x, 'y': y}
+
+        sprite_file = sprite_dir / f"{_slug(channel['name'])}.webp"
+        sheet.save(sprite_file, format='WEBP', quality=quality, method=4)
+        metadata['channels'][channel['name']] = {
+            'sprite': sprite_file.relative_to(output_dir).as_posix(),
+            'width': sheet.width,
+            'height': sheet.height,
+            'videos': offsets,
+        }
+
+    metadata_file = sprite_metadata_path(channels_json)
+    with open(metadata_file, 'w') as f:
+        json.dump(metadata, f, indent=2)
+    return metadata_file, len(metadata['channels']), missing
+
+
+def export_sprite_sheets(channels_data, video_files, cache_dir, channels_json):
+    """build_sprite_sheets with a printed summary."""
+    metadata_file, sprite_count, missing = build_sprite_sheets(channels_data, video_files, cache_dir, channels_json)
+    print(f"🖼️  Wrote {sprite_count} channel sprite sheets ({metadata_file})")
+    if missing:
+        print(f"⚠️  {len(missing)} videos have no thumbnail yet "
+              f"(run: python3 advanced_video_clusterer.py analyze --force --thumbnails)")
+    return metadata_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build channel sprite sheets from cached thumbnails")
+    parser.add_argument("command", choices=['sprites'], help="Command to run")
+    parser.add_argument("--channels-json", default="public/channels_clustered_stream.json",
+                       help="Channel JSON to build sprite sheets for")
+    parser.add_argument("--cache-dir", default="video_embeddings_cache", help="Embedding cache directory")
+    parser.add_argument("--namespace", default=None,
+                       help="Embedding namespace (default: the only one in the cache directory)")
+
+    args = parser.parse_args()
+
+    from embedding_store import open_store, rows_from_columns
+
+    try:
+        store = open_store(args.cache_dir, namespace=args.namespace)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+    if not store.exists():
+        print(f"❌ No embedding store in {args.cache_dir}")
+        return
+    metadata = store.read_metadata()
+    video_files = rows_from_columns(metadata['columns'], metadata['count'])
+
+    with open(args.channels_json, 'r') as f:
+        channels_data = json.load(f)
+
+    if args.command == 'sprites':
+        export_sprite_sheets(channels_data, video_files, args.cache_dir, args.channels_json)
+
+
+if __name__ == "__main__":
+    main()
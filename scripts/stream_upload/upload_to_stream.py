@@ -12,6 +12,11 @@ from pathlib import Path
 from typing import Dict, List
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'clustering'))
+from duplicate_index import load_duplicate_index
+from video_discovery import discover_videos
 
 # Get Cloudflare credentials from environment or prompt
 ACCOUNT_ID = os.getenv('CLOUDFLARE_ACCOUNT_ID', 'efdcb0933eaac64f27c0b295039b28f2')
@@ -77,23 +82,25 @@ def upload_video(video_path: str, metadata: Dict) -> Dict:
         print(f"   ❌ Error: {str(e)}")
         return {'success': False, 'filename': filename, 'full_path': full_path, 'error': str(e)}
 
-def scan_videos(base_dir: str = 'channels_reclustered_all') -> List[tuple]:
-    """Scan all videos in channels directory"""
+def scan_videos(base_dir: str = 'channels_reclustered_all', cache_dir: str = 'video_embeddings_cache') -> List[tuple]:
+    """Scan all videos in channels directory, leaving out near-duplicate copies"""
     videos = []
-    base_path = Path(base_dir)
-    
-    # Support multiple video formats
-    video_extensions = ['*.mp4', '*.webm', '*.mov', '*.avi', '*.mkv']
     
-    for cluster_dir in sorted(base_path.iterdir()):
-        if cluster_dir.is_dir() and cluster_dir.name.startswith(('0', '1', '2', '3', '4', '5', '6')):
-            cluster_name = cluster_dir.name
+    # Cluster folders (and their subfolders), through the shared discovery manifest
+    for video_info in discover_videos(base_dir, cache_dir, min_depth=1):
+        cluster_name = video_info['folder']
+        if cluster_name.startswith(('0', '1', '2', '3', '4', '5', '6')):
             cluster_number = cluster_name.split('_')[0]
-            
-            # Scan for all video formats
-            for ext in video_extensions:
-                for video_file in sorted(cluster_dir.glob(ext)):
-                    videos.append((str(video_file), cluster_name, cluster_number))
+            videos.append((str(video_info['path']), cluster_name, cluster_number))
+    
+    # Don't spend Stream storage on copies listed in the near-duplicate index
+    duplicates = load_duplicate_index(cache_dir)
+    if duplicates is not None:
+        canonical = set(duplicates.canonical_paths([video[0] for video in videos], cache_dir))
+        skipped = len(videos) - len(canonical)
+        videos = [video for video in videos if video[0] in canonical]
+        if skipped:
+            print(f"🔁 Skipping {skipped} near-duplicate copies (see {cache_dir}/near_duplicates.json)")
     
     return videos
 
@@ -3,27 +3,42 @@
 Export video embeddings cache to JSON format for embedding flow visualization.
 """
 
+import sys
 import json
-import pickle
 import numpy as np
 from pathlib import Path
 
-def export_embeddings_to_json():
-    """Export embeddings from pickle cache to JSON with URLs from channels config"""
+sys.path.insert(0, str(Path(__file__).parent.parent / 'clustering'))
+from embedding_store import open_store
+from duplicate_index import load_duplicate_index
+
+def export_embeddings_to_json(cache_dir='video_embeddings_cache', namespace=None):
+    """Export embeddings from the embedding store to JSON with URLs from channels config"""
     
     # Load embeddings cache
-    cache_file = Path('video_embeddings_cache/video_embeddings.pkl')
-    if not cache_file.exists():
-        print(f"❌ Cache file not found: {cache_file}")
+    try:
+        store = open_store(cache_dir, namespace=namespace)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+    if not store.exists():
+        print(f"❌ Embedding store not found in: {cache_dir}")
         return
     
     print("📦 Loading embeddings cache...")
-    with open(cache_file, 'rb') as f:
-        cached_data = pickle.load(f)
-        video_files = cached_data['video_files']
-        embeddings = cached_data['embeddings']
+    video_files, embeddings = store.load()
+    
+    print(f"✅ Loaded {len(video_files)} videos with embeddings ({store.directory.parent.name})")
     
-    print(f"✅ Loaded {len(video_files)} videos with embeddings")
+    # Leave out near-duplicate copies so the flow doesn't have to skip them at runtime
+    duplicates = load_duplicate_index(cache_dir)
+    if duplicates is not None:
+        keep = duplicates.canonical_mask(v.get('fingerprint') for v in video_files)
+        skipped = keep.count(False)
+        video_files = [v for v, kept in zip(video_files, keep) if kept]
+        embeddings = embeddings[np.asarray(keep, dtype=bool)]
+        if skipped:
+            print(f"🔁 Skipping {skipped} near-duplicate copies")
     
     # Load channels config to get URLs
     channels_file = Path('channels_clustered_stream.json')
@@ -103,4 +118,13 @@ def export_embeddings_to_json():
     print("   Test: open html_apps/tv_embedding_flow.html")
 
 if __name__ == '__main__':
-    export_embeddings_to_json()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Export embeddings to JSON for the embedding flow')
+    parser.add_argument('--cache-dir', default='video_embeddings_cache',
+                       help='Cache directory (default: video_embeddings_cache)')
+    parser.add_argument('--namespace', default=None,
+                       help='Embedding namespace (default: the only one in the cache directory)')
+    args = parser.parse_args()
+    
+    export_embeddings_to_json(args.cache_dir, args.namespace)
@@ -10,6 +10,9 @@ import shutil
 from pathlib import Path
 from datetime import datetime
 
+sys.path.insert(0, str(Path(__file__).parent.parent / 'clustering'))
+from video_discovery import discover_videos
+
 def sanitize_filename(filename):
     """Create a safe filename"""
     # Remove extension
@@ -23,8 +26,8 @@ def sanitize_filename(filename):
     safe_name = "".join(c for c in name if c.isalnum() or c in ('_', '-'))
     return safe_name
 
-def import_videos(source_dir, output_dir='new_videos_staging', prefix='ale'):
-    """Import videos from source directory"""
+def import_videos(source_dir, output_dir='new_videos_staging', prefix='ale', recursive=False):
+    """Import videos from source directory (and its subfolders if recursive)"""
     source_path = Path(source_dir)
     output_path = Path(output_dir)
     
@@ -36,9 +39,7 @@ def import_videos(source_dir, output_dir='new_videos_staging', prefix='ale'):
     output_path.mkdir(exist_ok=True)
     
     # Find all video files
-    video_extensions = {'.mp4', '.mov', '.avi', '.mkv', '.webm'}
-    video_files = [f for f in source_path.iterdir() 
-                   if f.is_file() and f.suffix.lower() in video_extensions]
+    video_files = [v['path'] for v in discover_videos(source_path, recursive=recursive)]
     
     if not video_files:
         print(f"❌ No video files found in {source_dir}")
@@ -90,19 +91,22 @@ def import_videos(source_dir, output_dir='new_videos_staging', prefix='ale'):
         print("3. Or add to existing channels manually")
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python3 import_new_videos.py <source_directory> [output_dir] [prefix]")
+    args = [arg for arg in sys.argv[1:] if arg != '--recursive']
+    recursive = len(args) < len(sys.argv) - 1
+    if len(args) < 1:
+        print("Usage: python3 import_new_videos.py <source_directory> [output_dir] [prefix] [--recursive]")
         print()
         print("Example:")
         print("  python3 import_new_videos.py /Users/thomash/Downloads/alemorevids")
         print("  python3 import_new_videos.py ~/Downloads/videos new_videos ale")
+        print("  python3 import_new_videos.py ~/Downloads/batches --recursive   # include subfolders")
         sys.exit(1)
     
-    source_dir = sys.argv[1]
-    output_dir = sys.argv[2] if len(sys.argv) > 2 else 'new_videos_staging'
-    prefix = sys.argv[3] if len(sys.argv) > 3 else 'ale'
+    source_dir = args[0]
+    output_dir = args[1] if len(args) > 1 else 'new_videos_staging'
+    prefix = args[2] if len(args) > 2 else 'ale'
     
-    import_videos(source_dir, output_dir, prefix)
+    import_videos(source_dir, output_dir, prefix, recursive=recursive)
 
 if __name__ == '__main__':
     main()
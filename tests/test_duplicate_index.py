@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""Near-duplicate filtering of store rows (scripts/clustering/duplicate_index.py)."""
+
+import sys
+import pickle
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'scripts' / 'clustering'))
+from duplicate_index import DuplicateIndex
+from embedding_store import LEGACY_PICKLE_NAME, open_store
+
+
+def _index(canonical, duplicates):
+    return DuplicateIndex({'groups': [{
+        'canonical': {'fingerprint': canonical},
+        'duplicates': [{'fingerprint': fingerprint} for fingerprint in duplicates],
+    }]})
+
+
+def test_migrated_rows_without_fingerprints_are_kept(tmp_path):
+    # A pickle from before fingerprints, migrated into a store on first open
+    video_files = [{'path': Path(f"channels/a/{i}.mp4"), 'name': f"{i}.mp4", 'channel': 'a', 'size_mb': 1.0}
+                   for i in range(3)]
+    with open(tmp_path / LEGACY_PICKLE_NAME, 'wb') as f:
+        pickle.dump({'video_files': video_files, 'embeddings': np.ones((3, 4), dtype=np.float32)}, f)
+    rows, _ = open_store(tmp_path, model="ViT-B/32").load()
+    fingerprints = [row.get('fingerprint') for row in rows]
+    assert fingerprints == ['', '', '']
+
+    assert _index('p:a', ['p:b']).canonical_mask(fingerprints) == [True, True, True]
+
+
+def test_copies_and_repeated_fingerprints_are_dropped():
+    mask = _index('p:a', ['p:b']).canonical_mask(['p:a', 'p:b', '', 'p:c', 'p:c', ''])
+    assert mask == [True, False, True, True, False, True]